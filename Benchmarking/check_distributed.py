@@ -0,0 +1,115 @@
+# Checks distributed location end to end on this host. A synthetic data set is
+# located once with a Pool, as by location_p.py, and once by a Coordinator on
+# 127.0.0.1 with several worker_p.py worker processes, one of which is killed
+# part of the way through. The check passes if the killed worker's tasks are
+# re-queued and the distributed output is complete, in frame order and
+# identical to that of the Pool.
+# Run from the root of the repository, e.g.:
+#     python Benchmarking/check_distributed.py --workers 3 --frames 24
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import location_p
+import worker_p
+from lib import dataset
+from lib import distributed
+from lib import vmptutils as vuti
+import synthetic
+
+CONNECT_TIMEOUT = 60.0      # seconds to wait for the workers to connect
+
+# Sets the parameters of location_p in each process
+def setParameters(params):
+    for name, value in params.items():
+        setattr(location_p, name, value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check distributed location against a Pool on this host.')
+    parser.add_argument('--tracers', type=int, default=3)
+    parser.add_argument('--lines', type=int, default=100, help='Lines_Per_Tracer')
+    parser.add_argument('--frames', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=3, help='worker processes, one of which is killed')
+    parser.add_argument('--task-frames', type=int, default=2)
+    parser.add_argument('--tasks-per-worker', type=int, default=2)
+    parser.add_argument('--kill-after', type=int, default=1, help='tasks output before a worker is killed')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    params = {'EPS':5.0, 'K':4, 'LOF_FRAC':0.5, 'VOL_FRAC':0.6, 'POI_ENGINE':'voronoi', 'DENSITY_K':6,
+              'FOV':None, 'COARSE_FACTOR':1, 'MIN_NEIGHBOURS':0, 'SUBDOMAINS':1, 'SUBDOMAIN_OVERLAP':50.0,
+              'SUBDOMAIN_THREADS':1}
+    # the settings sent to the workers, as by location_p.py --distributed
+    settings = {'eps':params['EPS'], 'k':params['K'], 'lof_frac':params['LOF_FRAC'],
+                'vol_frac':params['VOL_FRAC'], 'poi_engine':params['POI_ENGINE'],
+                'density_k':params['DENSITY_K'], 'fov':params['FOV'], 'coarse_factor':params['COARSE_FACTOR'],
+                'min_neighbours':params['MIN_NEIGHBOURS'], 'subdomains':params['SUBDOMAINS'],
+                'subdomain_overlap':params['SUBDOMAIN_OVERLAP'], 'subdomain_threads':params['SUBDOMAIN_THREADS'],
+                'warm_start':False, 'warm_radius':0.0, 'num_tracers':args.tracers, 'overlapping':False,
+                'profile':False}
+    frame_size = args.lines * args.tracers
+
+    temp_folder = tempfile.mkdtemp()
+    failures = []
+    workers = []
+    coordinator = None
+    try:
+        lor_data, _ = synthetic.generate(args.tracers, args.frames, args.lines, seed=args.seed)
+        file_path = os.path.join(temp_folder, 'synthetic.dat')
+        synthetic.writeData(file_path, lor_data)
+
+        setParameters(params)
+        pool = multiprocessing.Pool(processes=args.workers, initializer=setParameters, initargs=(params,))
+        expected = pool.map(location_p.locate, dataset.FrameReader(file_path, frame_size))
+        pool.close()
+        pool.join()
+        print('Located ' + str(len(expected)) + ' frames with a Pool')
+
+        authkey = os.urandom(16)
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), authkey, settings, args.tasks_per_worker)
+        workers = [multiprocessing.Process(target=worker_p.runWorker, args=(coordinator.getAddress(), authkey, 1.0)) \
+                   for worker_num in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        give_up = time.time() + CONNECT_TIMEOUT
+        while coordinator.getNumWorkers() < args.workers:
+            if time.time() > give_up:
+                raise RuntimeError('Only ' + str(coordinator.getNumWorkers()) + ' workers connected')
+            time.sleep(0.1)
+
+        outputs = []
+        chunks = vuti.getChunks(dataset.FrameReader(file_path, frame_size), args.task_frames)
+        for task_num, chunk_outputs in enumerate(coordinator.imap(chunks)):
+            outputs.extend(chunk_outputs)
+            if task_num + 1 == args.kill_after:
+                print('Killing worker process ' + str(workers[0].pid))
+                os.kill(workers[0].pid, signal.SIGKILL)
+        print('Located ' + str(len(outputs)) + ' frames with ' + str(args.workers) + ' workers, ' \
+              + str(coordinator.getNumRequeued()) + ' tasks re-queued')
+
+        if coordinator.getNumRequeued() == 0:
+            failures.append('no tasks were re-queued')
+        if len(outputs) != len(expected):
+            failures.append(str(len(outputs)) + ' frames output, ' + str(len(expected)) + ' expected')
+        for frame_num, (locations, expected_locations) in enumerate(zip(outputs, expected)):
+            # a frame out of order differs from the frame of the Pool at its position
+            if not np.array_equal(locations, expected_locations):
+                failures.append('frame ' + str(frame_num) + ' differs from the Pool output')
+        for failure in failures:
+            print('FAIL: ' + failure)
+        if len(failures) == 0:
+            print('PASS')
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+        for worker in workers:
+            worker.join()
+        shutil.rmtree(temp_folder)
+    sys.exit(1 if len(failures) > 0 else 0)
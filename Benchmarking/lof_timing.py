@@ -0,0 +1,56 @@
+# Compares the vectorized lofpy.getLOF against the original loop based 
+# implementation, both for speed and for agreement of the results.
+# Run from the root of the repository:
+#     python Benchmarking/lof_timing.py [num_points ...]
+import os
+import sys
+import time
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib import lofpy
+
+# The original per-point implementation, kept as the reference
+def getLOFLoop(k, X):
+    num_points = X.shape[0]
+    lof = np.zeros((num_points,1), float)
+    lrd = np.zeros((num_points,1), float)
+    nbrs = NearestNeighbors(n_neighbors=k+1).fit(X)
+    distances, indices = nbrs.kneighbors(X)
+    kdistances = distances[:,-1]
+    
+    for i in range(0, num_points):
+        i_nbrs = indices[i,1:]
+        i_kdist = kdistances[i_nbrs]
+        i_reach_dist = np.maximum(distances[i,1:],i_kdist)
+        lrd[i] = float(k) / np.sum(i_reach_dist)
+        
+    for j in range(0, num_points):
+        j_nbrs = indices[j,1:]
+        lof[j] = (np.sum(lrd[j_nbrs]) / float(k)) / lrd[j]
+           
+    return lof
+
+def timeCall(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+if __name__ == "__main__":
+    K = 4
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    rng = np.random.RandomState(0)
+    
+    print('%10s %12s %12s %12s %10s %12s' % ('points', 'loop (s)', 'vector (s)', 'no knn (s)', 'speedup', 'max diff'))
+    for num_points in sizes:
+        X = rng.uniform(-100.0, 100.0, (num_points,3))
+        
+        lof_loop, t_loop = timeCall(getLOFLoop, K, X)
+        lof_vec, t_vec = timeCall(lofpy.getLOF, K, X)
+        # time the LOF stage alone when the neighbour search is reused
+        neighbors = lofpy.getNeighbors(K, X)
+        lof_pre, t_pre = timeCall(lofpy.getLOF, K, X, neighbors)
+        
+        max_diff = np.max(np.abs(lof_loop[:,0] - lof_vec))
+        print('%10d %12.4f %12.4f %12.4f %10.1f %12.3g' % (num_points, t_loop, t_vec, t_pre, t_loop/t_vec, max_diff))
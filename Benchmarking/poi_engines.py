@@ -0,0 +1,69 @@
+# Compares the point of interest engines of Frame on the same synthetic frames,
+# reporting the time taken per frame by each engine and how far the tracer
+# locations found using each engine are from each other and from the true 
+# tracer positions.
+# Run from the root of the repository:
+#     python Benchmarking/poi_engines.py [num_tracers] [num_frames]
+import os
+import sys
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import location_p
+from lib import frame
+import synthetic
+
+ENGINES = ['voronoi', 'density']
+
+# Returns the distance from each of the points in A to the nearest point in B
+def nearestDistances(A, B):
+    if A.shape[0] == 0 or B.shape[0] == 0:
+        return np.array([np.inf])
+    distances, _ = cKDTree(B).query(A)
+    return distances
+
+if __name__ == "__main__":
+    num_tracers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    
+    location_p.EPS = 5.0
+    location_p.K = 4
+    location_p.LOF_FRAC = 0.5
+    location_p.VOL_FRAC = 0.6
+    location_p.DENSITY_K = 6
+    location_p.FOV = None
+    location_p.COARSE_FACTOR = 1
+    location_p.MIN_NEIGHBOURS = 0
+    location_p.SUBDOMAINS = 1
+    location_p.SUBDOMAIN_OVERLAP = 0.0
+    location_p.SUBDOMAIN_THREADS = 1
+    lor_data, truth = synthetic.generate(num_tracers, num_frames)
+    frame_size = 100 * num_tracers
+    
+    poi_times = dict((engine, []) for engine in ENGINES)
+    errors = dict((engine, []) for engine in ENGINES)
+    agreement = []
+    for frame_num in range(num_frames):
+        frame_data = lor_data[frame_num * frame_size:(frame_num + 1) * frame_size,:]
+        tracers = truth[frame_num * num_tracers:(frame_num + 1) * num_tracers, 0:3]
+        
+        locations = {}
+        for engine in ENGINES:
+            start = time.time()
+            frame.Frame(frame_data).getPointsOfInterest(location_p.EPS, engine, location_p.DENSITY_K)
+            poi_times[engine].append(time.time() - start)
+            
+            location_p.POI_ENGINE = engine
+            locations[engine] = location_p.locate(frame_data)[:,0:3]
+            errors[engine].extend(nearestDistances(tracers, locations[engine]))
+        agreement.extend(nearestDistances(locations['voronoi'], locations['density']))
+    
+    print('%d tracers, %d frames' % (num_tracers, num_frames))
+    print('%10s %14s %16s %16s' % ('engine', 'poi time (s)', 'median err (mm)', 'tracers found'))
+    for engine in ENGINES:
+        errs = np.array(errors[engine])
+        print('%10s %14.4f %16.3f %15.1f%%' % (engine, np.mean(poi_times[engine]),
+                                            np.median(errs), 100.0 * np.mean(errs < location_p.EPS)))
+    print('Median distance between voronoi and density locations: %.3f mm' % np.median(agreement))
@@ -0,0 +1,79 @@
+# Replays the lines of a .dat file at a fixed rate, as a live source of LOR's for
+# testing stream_p.py. The lines are written to standard output, a FIFO, or the
+# first client of a Unix or TCP socket, e.g.:
+#     python Benchmarking/replay_lors.py data.dat --rate 20000 | python stream_p.py - out 3
+#     python Benchmarking/replay_lors.py data.dat --rate 20000 --unix /tmp/lors.sock &
+#     python stream_p.py unix:/tmp/lors.sock out 3
+import os
+import sys
+import time
+import errno
+import socket
+import argparse
+import itertools
+
+# Opens the destination of the replay, returning a method which writes a string
+def openOutput(args):
+    if args.fifo is not None:
+        if not os.path.exists(args.fifo):
+            os.mkfifo(args.fifo)
+        # waits until the reader has opened the FIFO
+        output = open(args.fifo, 'wb')
+        return lambda text: (output.write(text), output.flush())
+    if args.unix is not None or args.tcp is not None:
+        if args.unix is not None:
+            if os.path.exists(args.unix):
+                os.remove(args.unix)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(args.unix)
+        else:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(('', args.tcp))
+        server.listen(1)
+        sys.stderr.write('Waiting for a client\n')
+        client, _ = server.accept()
+        server.close()
+        return client.sendall
+    return lambda text: (sys.stdout.write(text), sys.stdout.flush())
+
+# Writes the lines of the file in blocks of block_lines, pacing the writes so that
+# rate lines are written per second on average (as fast as possible if rate is 0)
+def replay(file_path, write, rate, block_lines):
+    start = time.time()
+    num_lines = 0
+    with open(file_path, 'r') as f:
+        while True:
+            lines = list(itertools.islice(f, block_lines))
+            if len(lines) == 0:
+                break
+            if rate > 0:
+                delay = start + (num_lines + len(lines)) / float(rate) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            write(''.join(lines))
+            num_lines += len(lines)
+    return num_lines, time.time() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a .dat file as a stream of LORs.')
+    parser.add_argument('file', help='the .dat file to replay')
+    parser.add_argument('--rate', type=float, default=10000.0, help='lines per second, 0 for no limit')
+    parser.add_argument('--block', type=int, default=100, help='lines written at a time')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times the file is replayed')
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument('--fifo', help='path of a FIFO to write to, created if needed')
+    destination.add_argument('--unix', help='path of a Unix socket to serve the lines on')
+    destination.add_argument('--tcp', type=int, help='TCP port to serve the lines on')
+    args = parser.parse_args()
+
+    write = openOutput(args)
+    try:
+        for repeat in range(args.repeat):
+            num_lines, elapsed = replay(args.file, write, args.rate, args.block)
+            sys.stderr.write('Replayed %d lines in %.2fs (%.0f lines/s)\n' % (num_lines, elapsed,
+                                                                            num_lines / max(elapsed, 1e-9)))
+    except (IOError, socket.error) as e:
+        # the reader has closed the stream
+        if e.errno != errno.EPIPE:
+            raise
@@ -0,0 +1,149 @@
+# Reproducible benchmark of the location algorithm on synthetic data. For each
+# combination of the parameters given, a data set is generated with
+# synthetic.py, written to a .dat file and located with location_p.locate using
+# a Pool, in the same way as the main program. The end-to-end frame rate, the 
+# mean time of each stage and the location error against the true tracer
+# positions are printed and appended to a CSV file (Benchmarking/results.csv
+# unless --output is given, which git ignores), or to a new one if the columns
+# of the existing file differ.
+# Run from the root of the repository, e.g.:
+#     python Benchmarking/run_benchmark.py --tracers 1 5 --eps 4 5 --cores 1 4
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import location_p
+from lib import dataset
+from lib import fov
+from lib import profiling
+import synthetic
+
+STAGES = ['frame', 'discretization', 'voronoi', 'smallest_region', 'halo_check', 'density', 
+          'spatial_index', 'lof', 'filters', 'dbscan', 'centroids']
+
+# Sets the parameters of location_p in each process
+def setParameters(params):
+    for name, value in params.items():
+        setattr(location_p, name, value)
+
+# Returns the path to which rows of the given columns are appended: the output
+# path if it does not exist or has the same header, and otherwise the first of
+# output_2.csv, output_3.csv, ... which does, so that rows are never appended
+# under the header of an older version with other columns
+def getOutputPath(output_path, columns):
+    root, extension = os.path.splitext(output_path)
+    path = output_path
+    num = 1
+    while os.path.isfile(path):
+        with open(path) as in_file:
+            if next(csv.reader(in_file), None) == columns:
+                break
+        num += 1
+        path = '%s_%d%s' % (root, num, extension)
+    if path != output_path:
+        print('The columns of ' + output_path + ' differ, writing to ' + path)
+    return path
+
+# Locates every frame of the file, returning the locations, the profile of the
+# frames and the elapsed time
+def runLocation(file_path, frame_size, num_cores, params):
+    setParameters(params)
+    pool = multiprocessing.Pool(processes=num_cores, initializer=setParameters, initargs=(params,))
+    summary = profiling.ProfileSummary()
+    all_locations = []
+    start = time.time()
+    frames = dataset.FrameReader(file_path, frame_size)
+    for locations, record in pool.imap(profiling.Profiled(location_p.locate), frames):
+        all_locations.append(locations)
+        summary.add(record)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+    return np.vstack(all_locations), summary, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark location on synthetic data.')
+    parser.add_argument('--tracers', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--lines', type=int, nargs='+', default=[100], help='Lines_Per_Tracer values')
+    parser.add_argument('--eps', type=float, nargs='+', default=[5.0])
+    parser.add_argument('--cores', type=int, nargs='+', default=[1])
+    parser.add_argument('--frames', type=int, default=10)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--lof-frac', type=float, default=0.5)
+    parser.add_argument('--vol-frac', type=float, default=0.6)
+    parser.add_argument('--engine', default='voronoi', help='point of interest engine')
+    parser.add_argument('--fov-radius', type=float, default=0.0, 
+                        help='radius of a cylindrical field of view about the z axis, 0 for none')
+    parser.add_argument('--coarse-factor', type=int, default=1, help='adaptive discretization factor')
+    parser.add_argument('--min-neighbours', type=int, default=25)
+    parser.add_argument('--subdomains', type=int, default=1, help='subdomains per frame, 1 for none')
+    parser.add_argument('--subdomain-overlap', type=float, default=50.0)
+    parser.add_argument('--subdomain-threads', type=int, default=1)
+    parser.add_argument('--scatter', type=float, default=0.1, help='fraction of scattered LORs')
+    parser.add_argument('--randoms', type=float, default=0.1, help='fraction of random LORs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='Benchmarking/results.csv',
+                        help='CSV file to which a row is appended per run (ignored by git)')
+    args = parser.parse_args()
+    
+    columns = ['date', 'tracers', 'lines_per_tracer', 'eps', 'cores', 'engine', 'fov_radius', 'coarse_factor',
+               'subdomains', 'frames', 'frames_per_s', 'median_error', 'p90_error', 'found_frac',
+               'spurious_per_frame'] + \
+              ['ms_' + stage for stage in STAGES]
+    output_path = getOutputPath(args.output, columns)
+    write_header = not os.path.isfile(output_path)
+    out_file = open(output_path, 'a')
+    writer = csv.writer(out_file)
+    if write_header:
+        writer.writerow(columns)
+    
+    field_of_view = None
+    if args.fov_radius > 0:
+        field_of_view = fov.CylinderFOV([0.0, 0.0], args.fov_radius, -args.fov_radius, args.fov_radius)
+    
+    temp_folder = tempfile.mkdtemp()
+    try:
+        for num_tracers in args.tracers:
+            for lines_per_tracer in args.lines:
+                lor_data, truth = synthetic.generate(num_tracers, args.frames, lines_per_tracer,
+                                                     scatter_frac=args.scatter, random_frac=args.randoms,
+                                                     seed=args.seed)
+                file_path = os.path.join(temp_folder, 'synthetic.dat')
+                synthetic.writeData(file_path, lor_data)
+                frame_size = lines_per_tracer * num_tracers
+                
+                for eps in args.eps:
+                    params = {'EPS':eps, 'K':args.k, 'LOF_FRAC':args.lof_frac, 'VOL_FRAC':args.vol_frac,
+                              'POI_ENGINE':args.engine, 'DENSITY_K':6, 'FOV':field_of_view,
+                              'COARSE_FACTOR':args.coarse_factor, 'MIN_NEIGHBOURS':args.min_neighbours,
+                              'SUBDOMAINS':args.subdomains, 'SUBDOMAIN_OVERLAP':args.subdomain_overlap,
+                              'SUBDOMAIN_THREADS':args.subdomain_threads}
+                    for num_cores in args.cores:
+                        locations, summary, elapsed = runLocation(file_path, frame_size, num_cores, params)
+                        errors, num_spurious = synthetic.getLocationErrors(locations, truth, 2.0 * eps)
+                        stage_means = dict(summary.getStageMeans())
+                        
+                        row = [time.strftime('%Y-%m-%d %H:%M'), num_tracers, lines_per_tracer, eps, num_cores,
+                               args.engine, args.fov_radius, args.coarse_factor, args.subdomains, args.frames,
+                               args.frames / elapsed, np.median(errors),
+                               np.percentile(errors, 90), np.mean(errors < 2.0 * eps),
+                               num_spurious / float(args.frames)] + \
+                              [1000.0 * stage_means.get(stage, 0.0) for stage in STAGES]
+                        writer.writerow(row)
+                        out_file.flush()
+                        values = dict(zip(columns, row))
+                        print('tracers=%d lines=%d eps=%.1f cores=%d: %.2f frames/s, median error %.2fmm, '
+                              '%.1f%% found, %.2f spurious/frame' % (num_tracers, lines_per_tracer, eps, num_cores,
+                                                                     values['frames_per_s'], values['median_error'],
+                                                                     100.0 * values['found_frac'],
+                                                                     values['spurious_per_frame']))
+    finally:
+        shutil.rmtree(temp_folder)
+        out_file.close()
@@ -0,0 +1,129 @@
+# Generates synthetic LOR data with known tracer positions, for benchmarking the
+# location algorithm. Tracers move on circular, bobbing trajectories inside a
+# spherical detector. Each true LOR passes through a tracer (blurred by the
+# positron range), a fraction are scattered so that they miss the tracer by a
+# larger amount, and a fraction are replaced by random coincidences joining two
+# random points on the detector.
+# The data is written in the same 7 column, tab separated format read by 
+# DataSet, and the true positions in the same [x,y,z,t] format as the output.
+# Run from the root of the repository to write a data set:
+#     python Benchmarking/synthetic.py output.dat [num_tracers] [num_frames]
+import sys
+import numpy as np
+
+DETECTOR_RADIUS = 300.0     # radius of the spherical detector
+FIELD_RADIUS = 150.0        # tracers stay within this distance of the centre
+POSITRON_RANGE = 0.5        # standard deviation of the distance travelled before annihilation
+
+# Returns the positions of each tracer at the given times as a 
+# (num_times, num_tracers, 3) array. The trajectories are fixed by the seed.
+def getTrajectories(num_tracers, times, seed=0):
+    rng = np.random.RandomState(seed)
+    radii = rng.uniform(0.2, 0.6, num_tracers) * FIELD_RADIUS
+    speeds = rng.uniform(0.5, 2.0, num_tracers) * rng.choice([-1.0, 1.0], num_tracers)
+    phases = rng.uniform(0.0, 2.0 * np.pi, num_tracers)
+    heights = rng.uniform(-0.5, 0.5, num_tracers) * FIELD_RADIUS
+    bobs = rng.uniform(0.0, 0.2, num_tracers) * FIELD_RADIUS
+    
+    # angular speeds are given in revolutions per 100000 time units
+    angles = phases + 2.0 * np.pi * speeds * times[:,np.newaxis] / 100000.0
+    positions = np.zeros((len(times), num_tracers, 3))
+    positions[:,:,0] = radii * np.cos(angles)
+    positions[:,:,1] = radii * np.sin(angles)
+    positions[:,:,2] = heights + bobs * np.sin(2.0 * angles)
+    return positions
+
+# Returns the two points at which the lines through points along directions 
+# meet the detector sphere
+def getDetectorHits(points, directions):
+    # solve |p + s*d| = R for s, with |d| = 1
+    b = np.sum(points * directions, axis=1)
+    c = np.sum(points * points, axis=1) - DETECTOR_RADIUS**2
+    root = np.sqrt(b * b - c)
+    A = points + (-b + root)[:,np.newaxis] * directions
+    B = points + (-b - root)[:,np.newaxis] * directions
+    return A, B
+
+def getRandomDirections(num, rng):
+    directions = rng.normal(size=(num,3))
+    directions /= np.sqrt(np.sum(directions**2, axis=1))[:,np.newaxis]
+    return directions
+
+# Generates num_frames frames of lines_per_tracer * num_tracers LOR's, recorded
+# at one LOR per time unit. Returns the (N,7) LOR data and the (num_frames * 
+# num_tracers, 4) array of the true [x,y,z,t] of each tracer in each frame,
+# taken as its mean position over the frame. scatter_frac of the true LOR's 
+# miss their tracer by a normally distributed distance of scale scatter_dist,
+# and random_frac of all LOR's are random coincidences.
+def generate(num_tracers, num_frames, lines_per_tracer=100, scatter_frac=0.1,
+             scatter_dist=10.0, random_frac=0.1, seed=0):
+    rng = np.random.RandomState(seed + 1)
+    frame_size = lines_per_tracer * num_tracers
+    num_lines = frame_size * num_frames
+    times = np.arange(num_lines, dtype=float)
+    
+    positions = getTrajectories(num_tracers, times, seed)
+    tracer_ids = rng.randint(0, num_tracers, num_lines)
+    sources = positions[np.arange(num_lines), tracer_ids, :]
+    sources += rng.normal(0.0, POSITRON_RANGE, (num_lines,3))
+    scattered = rng.rand(num_lines) < scatter_frac
+    sources[scattered,:] += rng.normal(0.0, scatter_dist, (np.sum(scattered),3))
+    
+    A, B = getDetectorHits(sources, getRandomDirections(num_lines, rng))
+    randoms = rng.rand(num_lines) < random_frac
+    num_randoms = np.sum(randoms)
+    A[randoms,:] = DETECTOR_RADIUS * getRandomDirections(num_randoms, rng)
+    B[randoms,:] = DETECTOR_RADIUS * getRandomDirections(num_randoms, rng)
+    
+    lor_data = np.zeros((num_lines,7))
+    lor_data[:,0:3] = A
+    lor_data[:,3:6] = B
+    lor_data[:,6] = times
+    
+    truth = np.zeros((num_frames * num_tracers,4))
+    frame_positions = positions.reshape(num_frames, frame_size, num_tracers, 3)
+    truth[:,0:3] = np.mean(frame_positions, axis=1).reshape(-1,3)
+    truth[:,3] = np.repeat(np.mean(times.reshape(num_frames, frame_size), axis=1), num_tracers)
+    return lor_data, truth
+
+# Writes LOR data in the tab separated format read by DataSet
+def writeData(file_path, lor_data):
+    np.savetxt(file_path, lor_data, delimiter='\t', fmt='%.4f')
+
+# Returns the error of the located positions against the true positions, frame
+# by frame. Each true position is matched to the nearest location in the same
+# frame. Returns the distance to each match (inf if the frame has no locations),
+# and the number of locations which are not within tolerance of any tracer.
+def getLocationErrors(locations, truth, tolerance):
+    errors = []
+    num_spurious = 0
+    # locations are assigned to the frame with the closest time
+    frame_times = np.unique(truth[:,3])
+    location_frames = np.zeros(locations.shape[0], int)
+    if len(frame_times) > 1:
+        location_frames = np.clip(np.searchsorted(frame_times, locations[:,3]), 1, len(frame_times) - 1)
+        earlier = np.abs(locations[:,3] - frame_times[location_frames - 1]) < \
+                  np.abs(locations[:,3] - frame_times[location_frames])
+        location_frames[earlier] -= 1
+    
+    for frame_num, frame_time in enumerate(frame_times):
+        true_i = truth[truth[:,3] == frame_time, 0:3]
+        found_i = locations[location_frames == frame_num, 0:3]
+        if found_i.shape[0] == 0:
+            errors.extend([np.inf] * true_i.shape[0])
+            continue
+        distances = np.sqrt(np.sum((true_i[:,np.newaxis,:] - found_i[np.newaxis,:,:])**2, axis=2))
+        errors.extend(np.min(distances, axis=1))
+        num_spurious += np.sum(np.min(distances, axis=0) > tolerance)
+    return np.array(errors), num_spurious
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('Usage: python Benchmarking/synthetic.py output.dat [num_tracers] [num_frames]')
+        sys.exit(1)
+    num_tracers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    num_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    lor_data, truth = generate(num_tracers, num_frames)
+    writeData(sys.argv[1], lor_data)
+    np.savetxt(sys.argv[1] + '.truth.csv', truth, delimiter=',')
+    print('Wrote %d LORs and %d true positions' % (lor_data.shape[0], truth.shape[0]))
@@ -1,45 +1,272 @@
 import numpy as np
 import math
+import os
 
 from lib import frame
 
+BLOCK_BYTES = 64 * 1024 * 1024    # size of the blocks of text parsed at a time
+STREAM_BLOCK_BYTES = 1024 * 1024  # most text read from a stream at a time
+
+CACHE_EXTENSION = '.lorcache'     # extension of the binary cache files
+CACHE_MAGIC = b'VMPTLOR1'         # identifies a cache file and its version
+CACHE_HEADER_BYTES = 64           # the header is padded to this size before the data
+
+# If use_cache is set, the data is memory-mapped from a binary cache of the file,
+# which is created the first time the file is used.
+# Consecutive frames start stride rows apart, so they overlap if the stride is
+# less than the frame size. By default the stride is the frame size.
 class DataSet:
-    def __init__(self, file_path, frame_size, num_frames=-1):
-        self._file_data = np.genfromtxt(file_path, delimiter='\t') # load data from file
+    def __init__(self, file_path, frame_size, num_frames=-1, use_cache=False, stride=0):
+        self._cache_path = None
+        if use_cache:
+            self._cache_path = getCachePath(file_path)
+            if not isCacheValid(file_path, self._cache_path):
+                writeCache(file_path, self._cache_path, frame_size)
+            self._file_data = openCache(self._cache_path)          # map data from the cache
+        else:
+            self._file_data = readFile(file_path)                  # load data from file
         # the number of lines to be used in the 
         self._frame_size = frame_size                              
+        self._stride = getStride(frame_size, stride)
         self._data_size = self._file_data.shape[0]                  # number of rows in the data
         if num_frames > 0 and num_frames < self._data_size:
             self._num_frames = num_frames
-            self._file_data = self._file_data[0:num_frames*frame_size,:]
-            self._data_size = np.shape(self._file_data)
+            self._file_data = self._file_data[0:(num_frames-1)*self._stride + frame_size,:]
+            self._data_size = self._file_data.shape[0]
         else:
-            self._num_frames = int(math.ceil(self._data_size / float(self._frame_size)))  # number of frames, based on data set and frame size
+            # number of frames, based on data set, frame size and stride
+            num_after_first = math.ceil(max(self._data_size - self._frame_size, 0) / float(self._stride))
+            self._num_frames = int(num_after_first) + 1 if self._data_size > 0 else 0
 
     # Returns the total number of frames in the file
     def getNumFrames(self):
         return self._num_frames        
     
+    # Returns the path of the binary cache the data is mapped from, or None
+    def getCachePath(self):
+        return self._cache_path
+    
     # Returns the fframe of data at some index frame_num
     def getFrameAt(self, frame_num):
         if frame_num >= self._num_frames:
             return None
         else:
-            frame_start = frame_num * self._frame_size
-            frame_end = frame_start + self._frame_size
-            
-            # If the number f entries in the data is not exactly divisible by the frame size,
-            # the beginning of the last frame is shifted back, such that the end of that frame
-            # aligns with the end of the file
-            if frame_end > self._data_size:
-                frame_end = self._data_size
-                frame_start = frame_end - self._frame_size
-                
+            frame_start, frame_end = self.getFrameRange(frame_num)
             frame_data = self._file_data[frame_start:frame_end, : ]
             return frame.Frame(frame_data)
+    
+    # Returns the (start, stop) rows of the frame at index frame_num
+    def getFrameRange(self, frame_num):
+        frame_start = frame_num * self._stride
+        frame_end = frame_start + self._frame_size
+        
+        # If the number f entries in the data is not exactly divisible by the frame size,
+        # the beginning of the last frame is shifted back, such that the end of that frame
+        # aligns with the end of the file
+        if frame_end > self._data_size:
+            frame_end = self._data_size
+            frame_start = max(frame_end - self._frame_size, 0)
+        return frame_start, frame_end
+    
+    # Returns the (start, stop) rows of every frame. Used with a cache, so that only
+    # the offsets need to be sent to other processes, which map the same file.
+    def getFrameRanges(self):
+        return [self.getFrameRange(frame_num) for frame_num in range(self._num_frames)]
         
     # For parallel computing, splits the data set up into chunks for processing
     def split(self):
         split_indices = range(self._frame_size, self._num_frames*self._frame_size, self._frame_size)
         return np.split(self._file_data, split_indices)
         
+
+# Reads a whole tab separated data file into an (N, num_columns) array, using the
+# same block parser as FrameReader
+def readFile(file_path):
+    blocks = list(readBlocks(file_path))
+    if len(blocks) == 0:
+        return np.zeros((0,7))
+    return np.concatenate(blocks)
+
+# Generator which parses a tab separated data file in blocks of roughly block_bytes,
+# yielding each block as an (n, num_columns) array of floats. The text is split at
+# line boundaries and parsed by numpy in C, rather than line by line in Python.
+def readBlocks(file_path, block_bytes=BLOCK_BYTES):
+    with open(file_path, 'rb') as f:
+        for block in parseBlocks(f.read, block_bytes, file_path):
+            yield block
+
+# As readBlocks, for a pipe, FIFO or socket (any object with a fileno). Each read
+# returns as soon as any data is available, so lines are parsed as they arrive
+# rather than once a whole block has been received.
+def readStreamBlocks(stream, block_bytes=STREAM_BLOCK_BYTES):
+    fd = stream.fileno()
+    return parseBlocks(lambda num_bytes: os.read(fd, num_bytes), block_bytes, 'stream')
+
+# Generator which parses the text returned by read(block_bytes), which returns an
+# empty string at the end of the data, into (n, num_columns) arrays of floats
+def parseBlocks(read, block_bytes, source_name):
+    num_columns = 0
+    leftover = b''
+    while True:
+        text = read(block_bytes)
+        at_end = len(text) == 0
+        text = leftover + text
+        if not at_end:
+            # only whole lines are parsed; the remainder is kept for the next block
+            last_newline = text.rfind(b'\n')
+            if last_newline == -1:
+                leftover = text
+                continue
+            leftover = text[last_newline + 1:]
+            text = text[:last_newline + 1]
+        if len(text.strip()) == 0:
+            if at_end:
+                break
+            continue
+        
+        if num_columns == 0:
+            num_columns = len(text.lstrip().split(b'\n', 1)[0].split())
+        values = np.fromstring(text, dtype=float, sep=' ')
+        if values.size % num_columns != 0:
+            raise ValueError('Inconsistent number of columns in ' + source_name)
+        yield values.reshape(-1, num_columns)
+        
+        if at_end:
+            break
+
+# Reads the frames of a data file one at a time, without loading the whole file.
+# Only the block currently being parsed and the frame previously returned are held
+# in memory. As in DataSet, the last frame is shifted back such that its end aligns
+# with the end of the file, if the data is not exactly divisible by the frame size.
+class FrameReader:
+    def __init__(self, file_path, frame_size, num_frames=-1, block_bytes=BLOCK_BYTES, stride=0):
+        self._file_path = file_path
+        self._frame_size = frame_size
+        self._num_frames = num_frames
+        self._block_bytes = block_bytes
+        self._stride = stride
+        
+    def __iter__(self):
+        return self.getFrames()
+        
+    # Generator yielding each (frame_size, 7) frame of the file in order
+    def getFrames(self):
+        blocks = readBlocks(self._file_path, self._block_bytes)
+        return formFrames(blocks, self._frame_size, self._num_frames, self._stride)
+
+# Reads the frames of a live stream of LOR's, e.g. a pipe, FIFO or socket, yielding
+# each frame as soon as its last line has arrived. The stream is read only while
+# the next frame is wanted, so a writer is held back when processing falls behind.
+class StreamReader:
+    def __init__(self, stream, frame_size, block_bytes=STREAM_BLOCK_BYTES, stride=0):
+        self._stream = stream
+        self._frame_size = frame_size
+        self._block_bytes = block_bytes
+        self._stride = stride
+        
+    def __iter__(self):
+        blocks = readStreamBlocks(self._stream, self._block_bytes)
+        return formFrames(blocks, self._frame_size, stride=self._stride)
+
+# Returns the number of rows between the starts of consecutive frames. A stride of
+# 0 (or more than the frame size) gives frames which do not overlap.
+def getStride(frame_size, stride):
+    if stride <= 0 or stride > frame_size:
+        return frame_size
+    return stride
+
+# Generator which groups the rows of a sequence of blocks into frames of frame_size
+# rows starting stride rows apart, stopping after num_frames frames if it is 
+# positive. Used by FrameReader and StreamReader.
+def formFrames(blocks, frame_size, num_frames=-1, stride=0):
+    stride = getStride(frame_size, stride)
+    frame_count = 0
+    pending = None      # rows from the start of the next frame
+    previous = None     # the most recent full frame
+    
+    for block in blocks:
+        if pending is None or pending.shape[0] == 0:
+            pending = block
+        else:
+            pending = np.concatenate((pending, block))
+            
+        while pending.shape[0] >= frame_size:
+            previous = pending[0:frame_size,:]
+            pending = pending[stride:,:]
+            yield previous
+            
+            frame_count += 1
+            if frame_count == num_frames:
+                return
+    
+    if pending is not None and pending.shape[0] > 0:
+        if previous is None:
+            yield pending
+        elif pending.shape[0] > frame_size - stride:
+            # the rows after the most recent frame are in a last frame, aligned 
+            # with the end of the data
+            new_rows = pending[frame_size - stride:,:]
+            num_new = new_rows.shape[0]
+            yield np.concatenate((previous[num_new:,:], new_rows))
+
+# Returns the path of the binary cache for a data file
+def getCachePath(file_path):
+    return os.path.splitext(file_path)[0] + CACHE_EXTENSION
+
+# Reads the header of a cache file, returning a dictionary of its fields, or None
+# if the file is not a cache file
+def readCacheHeader(cache_path):
+    with open(cache_path, 'rb') as f:
+        magic = f.read(len(CACHE_MAGIC))
+        if magic != CACHE_MAGIC:
+            return None
+        fields = np.fromfile(f, dtype='<i8', count=5)
+    if fields.size != 5:
+        return None
+    return {'num_rows':int(fields[0]), 'num_columns':int(fields[1]), 'frame_size':int(fields[2]),
+            'source_size':int(fields[3]), 'source_mtime':int(fields[4])}
+
+# Returns true if the cache exists and was made from the current version of the file
+def isCacheValid(file_path, cache_path):
+    if not os.path.isfile(cache_path):
+        return False
+    header = readCacheHeader(cache_path)
+    if header is None:
+        return False
+    source_size, source_mtime = _getSourceStamp(file_path)
+    return header['source_size'] == source_size and header['source_mtime'] == source_mtime
+
+# Converts a tab separated data file to a binary cache. The cache is a fixed size
+# header (noting the number of rows and columns, the frame size and the size and
+# modification time of the source file) followed by the data as C ordered float64.
+# The file is written under a temporary name and renamed when complete.
+def writeCache(file_path, cache_path, frame_size):
+    temp_path = cache_path + '.tmp'
+    num_rows = 0
+    num_columns = 7
+    with open(temp_path, 'wb') as f:
+        f.write(b'\0' * CACHE_HEADER_BYTES)
+        for block in readBlocks(file_path):
+            num_columns = block.shape[1]
+            f.write(np.ascontiguousarray(block, '<f8').tobytes())
+            num_rows += block.shape[0]
+        
+        source_size, source_mtime = _getSourceStamp(file_path)
+        fields = np.array([num_rows, num_columns, frame_size, source_size, source_mtime], '<i8')
+        f.seek(0)
+        f.write(CACHE_MAGIC)
+        f.write(fields.tobytes())
+    os.rename(temp_path, cache_path)
+
+# Memory-maps the data of a cache file as a read-only (N, num_columns) array
+def openCache(cache_path):
+    header = readCacheHeader(cache_path)
+    if header is None:
+        raise IOError('Not a valid cache file: ' + cache_path)
+    if header['num_rows'] == 0:
+        return np.zeros((0,header['num_columns']))
+    return np.memmap(cache_path, dtype='<f8', mode='r', offset=CACHE_HEADER_BYTES,
+                     shape=(header['num_rows'], header['num_columns']))
+
+def _getSourceStamp(file_path):
+    return os.path.getsize(file_path), int(os.path.getmtime(file_path) * 1e6)
@@ -0,0 +1,296 @@
+import collections
+import os
+import socket
+import threading
+import time
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+from multiprocessing import AuthenticationError
+
+# Messages are tuples sent over multiprocessing connections, which pickle them:
+#   worker -> coordinator: ('hello', name), ('heartbeat',), ('result', task_id, outputs)
+#   coordinator -> worker: ('settings', settings), ('task', task_id, inputs), ('stop',)
+
+POLL_INTERVAL = 1.0     # seconds between checks for stopped or lost workers
+HANDSHAKE_TIMEOUT = 10.0    # seconds to wait for each reply while authenticating a worker
+
+# Hands out tasks to worker processes, which connect over TCP from this or other
+# hosts, and collects their results in order. Each task is a list of inputs (e.g.
+# the frames of data of a chunk), and its result is the list of outputs.
+# A worker is sent at most tasks_per_worker tasks at a time. A worker is lost if its
+# connection closes or nothing is received from it for heartbeat_timeout seconds,
+# in which case its tasks are sent to the other workers.
+# Workers are authenticated with the authkey in the thread serving each, so that
+# one which connects and sends nothing does not hold back the others. An empty
+# authkey is only accepted for a loopback address.
+class Coordinator:
+    def __init__(self, address, authkey, settings, tasks_per_worker=2, max_tasks=64, heartbeat_timeout=60.0):
+        if not authkey and not isLoopback(address[0]):
+            raise ValueError('An authkey must be set to listen on ' + address[0])
+        self._listener = Listener(address)
+        self._authkey = authkey
+        self._settings = settings
+        self._tasks_per_worker = tasks_per_worker
+        self._max_tasks = max(int(max_tasks), 1)  # tasks sent or waiting to be read, at most
+        self._heartbeat_timeout = heartbeat_timeout
+        self._cond = threading.Condition()
+        self._tasks = {}                        # inputs of the tasks without a result
+        self._results = {}                      # results which have not yet been read
+        self._pending = collections.deque()     # tasks not assigned to a worker
+        self._workers = {}
+        self._next_task_id = 0
+        self._next_worker_id = 0
+        self._num_requeued = 0                  # tasks of lost workers sent again
+        self._closed = False
+
+        for target in (self._acceptWorkers, self._monitorWorkers):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    # Returns the (host, port) the coordinator is listening on
+    def getAddress(self):
+        return self._listener.address
+
+    def getNumWorkers(self):
+        with self._cond:
+            return len(self._workers)
+
+    # Returns the number of tasks of lost workers which have been re-queued
+    def getNumRequeued(self):
+        with self._cond:
+            return self._num_requeued
+
+    # Generator yielding the result of each task of the iterable, in order. Only
+    # max_tasks tasks are taken from the iterable ahead of the results read.
+    def imap(self, tasks):
+        tasks = iter(tasks)
+        next_result = self._next_task_id
+        exhausted = False
+        while True:
+            while not exhausted and self._next_task_id - next_result < self._max_tasks:
+                try:
+                    task = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self._addTask(task)
+            if exhausted and next_result == self._next_task_id:
+                return
+            yield self._getResult(next_result)
+            next_result += 1
+
+    # Stops the workers and the listener. Tasks without a result are discarded.
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for worker in self._workers.values():
+                try:
+                    worker.conn.send(('stop',))
+                except (IOError, EOFError):
+                    pass
+            self._workers = {}
+            self._cond.notify_all()
+        self._listener.close()
+
+    def _addTask(self, task):
+        with self._cond:
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            self._tasks[task_id] = task
+            self._pending.append(task_id)
+            self._dispatch()
+
+    # the wait has a timeout, as otherwise a KeyboardInterrupt is not received
+    def _getResult(self, task_id):
+        with self._cond:
+            while task_id not in self._results:
+                if self._closed:
+                    raise IOError('Coordinator closed')
+                self._cond.wait(POLL_INTERVAL)
+            return self._results.pop(task_id)
+
+    # Sends pending tasks to workers with free slots. Called with the lock held.
+    def _dispatch(self):
+        for worker_id, worker in list(self._workers.items()):
+            while len(worker.assigned) < self._tasks_per_worker and len(self._pending) > 0:
+                task_id = self._pending.popleft()
+                if task_id not in self._tasks:
+                    continue # a lost worker's task which has since been completed
+                try:
+                    worker.conn.send(('task', task_id, self._tasks[task_id]))
+                except (IOError, EOFError):
+                    self._pending.appendleft(task_id)
+                    self._dropWorker(worker_id)
+                    break
+                worker.assigned.add(task_id)
+
+    # Removes a worker and returns its tasks to the front of the queue. Called
+    # with the lock held.
+    def _dropWorker(self, worker_id):
+        worker = self._workers.pop(worker_id, None)
+        if worker is None:
+            return
+        for task_id in sorted(worker.assigned, reverse=True):
+            if task_id in self._tasks:
+                self._pending.appendleft(task_id)
+                self._num_requeued += 1
+        print('Lost worker ' + worker.name + ', ' + str(len(worker.assigned)) + ' tasks re-queued')
+        self._dispatch()
+
+    def _acceptWorkers(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (IOError, EOFError, socket.error):
+                return # the listener has been closed
+            thread = threading.Thread(target=self._serveWorker, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    # Receives the messages of one worker, until it is lost or stopped
+    def _serveWorker(self, conn):
+        worker_id = None
+        try:
+            handshake = _HandshakeConnection(conn, HANDSHAKE_TIMEOUT)
+            try:
+                # the worker checks the key of the coordinator in turn, as Client does
+                deliver_challenge(handshake, self._authkey)
+                answer_challenge(handshake, self._authkey)
+            except AuthenticationError:
+                return
+            message = conn.recv()
+            with self._cond:
+                if self._closed or message[0] != 'hello':
+                    return
+                worker_id = self._next_worker_id
+                self._next_worker_id += 1
+                self._workers[worker_id] = _Worker(message[1], conn)
+                conn.send(('settings', self._settings))
+                print('Worker connected: ' + message[1])
+                self._dispatch()
+
+            while True:
+                message = conn.recv() if conn.poll(POLL_INTERVAL) else None
+                with self._cond:
+                    worker = self._workers.get(worker_id)
+                    if worker is None:
+                        return
+                    if message is None:
+                        continue
+                    worker.last_seen = time.time()
+                    if message[0] == 'result':
+                        self._addResult(worker, message[1], message[2])
+        except (IOError, EOFError):
+            pass
+        finally:
+            if worker_id is not None:
+                with self._cond:
+                    self._dropWorker(worker_id)
+            conn.close()
+
+    # Called with the lock held
+    def _addResult(self, worker, task_id, outputs):
+        worker.assigned.discard(task_id)
+        if task_id in self._tasks:
+            del self._tasks[task_id]
+            self._results[task_id] = outputs
+            self._cond.notify_all()
+        self._dispatch()
+
+    # Drops workers from which nothing has been received within the timeout
+    def _monitorWorkers(self):
+        while not self._closed:
+            time.sleep(POLL_INTERVAL)
+            with self._cond:
+                now = time.time()
+                for worker_id, worker in list(self._workers.items()):
+                    if now - worker.last_seen > self._heartbeat_timeout:
+                        self._dropWorker(worker_id)
+
+# The state of a connected worker, as kept by the coordinator
+class _Worker:
+    def __init__(self, name, conn):
+        self.name = name
+        self.conn = conn
+        self.assigned = set()   # ids of the tasks sent to the worker
+        self.last_seen = time.time()
+
+# Wraps a connection while it is authenticated, so that each reply is waited for
+# for at most timeout seconds. Only the methods used by deliver_challenge and
+# answer_challenge are provided.
+class _HandshakeConnection:
+    def __init__(self, conn, timeout):
+        self._conn = conn
+        self._timeout = timeout
+
+    def send_bytes(self, data):
+        self._conn.send_bytes(data)
+
+    def recv_bytes(self, max_length):
+        if not self._conn.poll(self._timeout):
+            raise AuthenticationError('no reply received within ' + str(self._timeout) + 's')
+        return self._conn.recv_bytes(max_length)
+
+# Returns True if the host name or address is that of the loopback interface, so
+# that only processes on this host can connect to it
+def isLoopback(host):
+    try:
+        return socket.gethostbyname(host).startswith('127.')
+    except socket.error:
+        return False
+
+# Connects to a coordinator and processes its tasks until it stops or closes.
+# setup is called with the settings sent by the coordinator, and returns the
+# method applied to the list of inputs of each task, which returns the list of
+# outputs (e.g. a vmptutils.ChunkTask). A heartbeat is sent every
+# heartbeat_interval seconds while the worker is busy. If the coordinator is not
+# yet listening, connecting is retried for up to connect_timeout seconds.
+def runWorker(address, authkey, setup, heartbeat_interval=5.0, connect_timeout=60.0):
+    conn = _connect(address, authkey, connect_timeout)
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+    name = socket.gethostname() + ':' + str(os.getpid())
+    try:
+        conn.send(('hello', name))
+        message = conn.recv()
+        func = setup(message[1])
+
+        heartbeat = threading.Thread(target=_sendHeartbeats,
+                                     args=(conn, send_lock, heartbeat_interval, stopped))
+        heartbeat.daemon = True
+        heartbeat.start()
+
+        while True:
+            message = conn.recv()
+            if message[0] == 'stop':
+                break
+            task_id, inputs = message[1], message[2]
+            outputs = func(inputs)
+            with send_lock:
+                conn.send(('result', task_id, outputs))
+    except (IOError, EOFError):
+        pass # the coordinator has closed
+    finally:
+        stopped.set()
+        with send_lock:
+            conn.close()
+
+def _connect(address, authkey, connect_timeout):
+    give_up = time.time() + connect_timeout
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except socket.error:
+            if time.time() > give_up:
+                raise
+            time.sleep(POLL_INTERVAL)
+
+def _sendHeartbeats(conn, send_lock, heartbeat_interval, stopped):
+    while not stopped.wait(heartbeat_interval):
+        with send_lock:
+            if stopped.is_set():
+                return
+            try:
+                conn.send(('heartbeat',))
+            except (IOError, EOFError):
+                return
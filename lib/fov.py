@@ -0,0 +1,135 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# The field of view (FOV) is the region in which the tracers can be, e.g. the
+# inside of the vessel. LOR's are clipped to the FOV before discretization, so
+# that no seed points are placed where there can be no tracer.
+# Each shape returns, for lines A + t(B - A), the range of t in [0,1] which is
+# inside the FOV. The range is empty (start > end) for lines which miss it.
+
+# Box between the corners lower and upper, with faces parallel to the axes
+class BoxFOV:
+    def __init__(self, lower, upper):
+        self._lower = np.array(lower, float).reshape(1,3)
+        self._upper = np.array(upper, float).reshape(1,3)
+
+    # A are the (N,3) start points and V the (N,3) vectors from A to B
+    def getIntervals(self, A, V):
+        return _getSlabIntervals(A, V, self._lower, self._upper)
+
+    def __repr__(self):
+        return 'BoxFOV(%r, %r)' % (self._lower.ravel().tolist(), self._upper.ravel().tolist())
+
+# Cylinder of the given radius about the axis parallel to z through the (x,y)
+# center, between z_min and z_max
+class CylinderFOV:
+    def __init__(self, center, radius, z_min, z_max):
+        self._center = np.array(center, float).reshape(1,2)
+        self._radius = float(radius)
+        self._z_min = float(z_min)
+        self._z_max = float(z_max)
+
+    def getIntervals(self, A, V):
+        start, end = _getSlabIntervals(A[:,2:3], V[:,2:3], self._z_min, self._z_max)
+
+        # the line is inside the circle where |D + tW|^2 <= radius^2, with D and W
+        # the (x,y) components of A - center and V
+        D = A[:,0:2] - self._center
+        W = V[:,0:2]
+        a = np.sum(W * W, axis=1)
+        b = 2.0 * np.sum(D * W, axis=1)
+        c = np.sum(D * D, axis=1) - self._radius**2
+        discriminant = b * b - 4.0 * a * c
+        parallel = a == 0.0     # lines parallel to the axis
+        hits = ~parallel & (discriminant >= 0.0)
+
+        radial_start = np.full(A.shape[0], np.inf)
+        radial_end = np.full(A.shape[0], -np.inf)
+        root = np.sqrt(discriminant[hits])
+        radial_start[hits] = (-b[hits] - root) / (2.0 * a[hits])
+        radial_end[hits] = (-b[hits] + root) / (2.0 * a[hits])
+        inside_parallel = parallel & (c <= 0.0)
+        radial_start[inside_parallel] = -np.inf
+        radial_end[inside_parallel] = np.inf
+
+        return np.maximum(start, radial_start), np.minimum(end, radial_end)
+
+    def __repr__(self):
+        return 'CylinderFOV(%r, %r, %r, %r)' % (self._center.ravel().tolist(), self._radius,
+                                                self._z_min, self._z_max)
+
+# Spheres of the given radius about each of the (M,3) centers, e.g. the previous
+# locations of the tracers. A line may pass through several spheres, so the range
+# returned spans all of them, and contains() is used to discard the points of the
+# line between the spheres.
+class SpheresFOV:
+    def __init__(self, centers, radius):
+        self._centers = np.array(centers, float).reshape(-1,3)
+        self._radius = float(radius)
+
+    def getIntervals(self, A, V):
+        # the line is inside sphere j where |D_j + tV|^2 <= radius^2, D_j = A - center_j
+        D = A[:,np.newaxis,:] - self._centers[np.newaxis,:,:]
+        a = np.sum(V * V, axis=1)[:,np.newaxis]
+        b = 2.0 * np.sum(D * V[:,np.newaxis,:], axis=2)
+        c = np.sum(D * D, axis=2) - self._radius**2
+        discriminant = b * b - 4.0 * a * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            root = np.sqrt(np.maximum(discriminant, 0.0))
+            sphere_start = np.where(discriminant >= 0.0, (-b - root) / (2.0 * a), np.inf)
+            sphere_end = np.where(discriminant >= 0.0, (-b + root) / (2.0 * a), -np.inf)
+        # zero length lines are inside a sphere if their point is
+        point = (a == 0.0) & np.ones(c.shape, bool)
+        sphere_start[point] = np.where(c[point] <= 0.0, -np.inf, np.inf)
+        sphere_end[point] = np.where(c[point] <= 0.0, np.inf, -np.inf)
+        # lines which only meet a sphere outside [0,1] are excluded
+        misses = (sphere_end < 0.0) | (sphere_start > 1.0)
+        sphere_start[misses] = np.inf
+        sphere_end[misses] = -np.inf
+
+        start = np.maximum(np.min(sphere_start, axis=1), 0.0)
+        end = np.minimum(np.max(sphere_end, axis=1), 1.0)
+        return start, end
+
+    # Returns a boolean array, true for the (P,3) points inside any sphere
+    def contains(self, points):
+        distances, _ = cKDTree(self._centers).query(points, distance_upper_bound=self._radius)
+        return distances <= self._radius
+
+    def __repr__(self):
+        return 'SpheresFOV(%r, %r)' % (self._centers.tolist(), self._radius)
+
+# Returns the FOV described in the [Frame] section of the config file, or None
+def fromConfig(config):
+    shape = config.get('Frame','Fov_Shape')
+    if shape == 'none':
+        return None
+    lower = _getValues(config, 'Fov_Min')
+    upper = _getValues(config, 'Fov_Max')
+    if shape == 'box':
+        return BoxFOV(lower, upper)
+    elif shape == 'cylinder':
+        return CylinderFOV(_getValues(config, 'Fov_Center'), config.getfloat('Frame','Fov_Radius'),
+                           lower[2], upper[2])
+    else:
+        raise ValueError('Unknown field of view shape: ' + shape)
+
+def _getValues(config, option):
+    return [float(value) for value in config.get('Frame', option).split(',')]
+
+# Range of t in [0,1] for which A + tV is between lower and upper in every column
+def _getSlabIntervals(A, V, lower, upper):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_lower = (lower - A) / V
+        t_upper = (upper - A) / V
+    t_near = np.minimum(t_lower, t_upper)
+    t_far = np.maximum(t_lower, t_upper)
+    # lines parallel to a pair of faces are either always or never between them
+    parallel = V == 0.0
+    between = (A >= lower) & (A <= upper)
+    t_near[parallel] = np.where(between[parallel], -np.inf, np.inf)
+    t_far[parallel] = np.where(between[parallel], np.inf, -np.inf)
+
+    start = np.maximum(np.max(t_near, axis=1), 0.0)
+    end = np.minimum(np.min(t_far, axis=1), 1.0)
+    return start, end
@@ -1,16 +1,33 @@
 import numpy as np
-from scipy.spatial import Voronoi
+import itertools
+import multiprocessing.pool
+from scipy.spatial import ConvexHull, Voronoi, cKDTree
 import vmptlib
 
 import lor
+import profiling
 
+# If a field of view is given (see fov.py), the lines are clipped to it before
+# they are discretized. If a focus is given (a fov.SpheresFOV, e.g. about the
+# previous locations of the tracers), the lines are also clipped to it, and only
+# the seed points inside it are kept. If seed_points are given, as the (points,
+# line_indices) of the discretization of the lines (e.g. from a lor.LineSpan),
+# they are used in place of discretizing the lines again.
 class Frame:
-    def __init__ (self, frame_data):
+    def __init__ (self, frame_data, fov=None, focus=None, seed_points=None):
         self._frame_data = frame_data
         self._num_rows = self._frame_data.shape[0]
-        self._lines = []
+        self._lines = None
+        self._fov = fov
+        self._focus = focus
+        self._seed_points = seed_points
         self._frame_time = 0.0
         self._spacing = 1.0
+        self._coarse_factor = 1
+        self._min_neighbours = 0
+        self._subdomains = 1
+        self._overlap = 0.0
+        self._num_threads = 1
         
         self._generateLines()
     
@@ -18,59 +35,336 @@ class Frame:
     def getFrameTime(self):
         return self._frame_time
         
-    # returns the points with the smallest Voronoi regions per line
-    def getPointsOfInterest(self, spacing):
+    # returns the points of interest per line. engine is either 'voronoi', for the
+    # points with the smallest Voronoi regions, or 'density', for the points with
+    # the highest local density of seed points. If a profiling.StageTimer is 
+    # given, the time taken by each step and the number of points are recorded.
+    # If coarse_factor is greater than 1, the lines are discretized adaptively:
+    # only every coarse_factor'th point is kept, except near the coarse points
+    # with at least min_neighbours points of other lines within coarse_factor *
+    # spacing, i.e. where the lines converge.
+    # If subdomains is greater than 1, the Voronoi engine splits the seed points 
+    # into that many subdomains, each tessellated separately with the seed points
+    # within overlap of it, in num_threads threads. The overlap only affects the
+    # time taken: subdomains whose regions it does not fix are tessellated again
+    # with a larger one.
+    # If there are fewer than min_seed_points seed points, e.g. if a focus keeps
+    # few of them, no points of interest are found and the engine is not run.
+    def getPointsOfInterest(self, spacing, engine='voronoi', density_k=6, timer=profiling.NULL_TIMER,
+                            coarse_factor=1, min_neighbours=0, subdomains=1, overlap=0.0, num_threads=1,
+                            min_seed_points=0):
         self._spacing = spacing
+        self._coarse_factor = coarse_factor
+        self._min_neighbours = min_neighbours
+        self._subdomains = subdomains
+        self._overlap = overlap
+        self._num_threads = num_threads
         self._generateSeedPoints()
-
-        voro = Voronoi(self._all_points)    
-                 
-        points, volumes = vmptlib.getSmallestRegion(int(len(self._lines)),
-                                           self._line_indices.tolist(),
-                                           voro.point_region.tolist(),
-                                           voro.regions,
-                                           voro.vertices)
+        timer.mark('discretization')
+        timer.count('lines', self._num_rows)
+        timer.count('seed_points', self._all_points.shape[0])
+        
+        if self._all_points.shape[0] < min_seed_points:
+            points, volumes = np.zeros(0, np.intp), np.zeros(0, float)
+        elif engine == 'voronoi':
+            points, volumes = self._getSmallestRegions(timer)
+        elif engine == 'density':
+            points, volumes = self._getDensestPoints(density_k)
+            timer.mark('density')
+        else:
+            raise ValueError('Unknown point of interest engine: ' + str(engine))
+        timer.count('points_of_interest', len(points))
       
         return {'ind':points, 'vol':volumes}
     
     # returns the locations of the points at the specified indices
     def getPointsAt(self, indices):
         return self._all_points[indices,:]
+    
+    # returns the LineOfResponse object for the line at row line_id
+    def getLine(self, line_id):
+        return self._lines.getLine(line_id)
     #------------------------------------------------------------------------#     
         
-    # creates a list of LineOfResponse objects from the raw frame data
+    # creates the batch of LOR's from the raw frame data
     def _generateLines(self):
-        t_total = 0.0
-        
-        for row in range(0, self._num_rows):
-            A = self._frame_data[row,0:3]
-            B = self._frame_data[row,3:6]
-            t_total += self._frame_data[row,6]
-            
-            self._lines.append(lor.LineOfResponse(A, B, row))
-        
-        self._frame_time = t_total/self._num_rows    
+        self._lines = lor.LineBatch(self._frame_data)
+        self._frame_time = self._lines.getMeanTime()
+        if self._fov is not None:
+            self._lines.clip(self._fov)
+        if self._focus is not None:
+            self._lines.clip(self._focus)
         
     # discretizes the LOR's and creates containers to track which points belong
     # to which lines
     def _generateSeedPoints(self):
-        total_points = 0
-        for line in self._lines: # count the total number of points that will be used in the tessellation
-            total_points += line.getNumPoints(self._spacing)
-            
-        total_points = int(total_points)
-        # create an array of zeros to be populated with Voronoi seeds
-        self._all_points = np.zeros((total_points,3))
-        self._line_indices = np.zeros((total_points))
-        
-        current_row = 0
-        for line in self._lines:
-            num_points = line.getNumPoints(self._spacing)
-            self._all_points[current_row:current_row + num_points,:] = line.getLineDiscretization(self._spacing)
-            self._line_indices[current_row:current_row + num_points] = line.getLineID()
-            self._line_indices = self._line_indices.astype(int)
-            
-            current_row += num_points            
+        if self._seed_points is not None:
+            self._all_points, self._line_indices = self._seed_points
+        elif self._coarse_factor > 1:
+            self._generateAdaptiveSeedPoints()
+        else:
+            self._all_points, self._line_indices = self._lines.getDiscretization(self._spacing)
+        if self._focus is not None:
+            inside = self._focus.contains(self._all_points)
+            self._all_points = self._all_points[inside,:]
+            self._line_indices = self._line_indices[inside]
+        
+    # The adaptive discretization keeps a subset of the points of the full 
+    # discretization: the coarse points (every coarse_factor'th point, and the 
+    # first and last points of each line), and every point between a coarse 
+    # point where the lines converge and the coarse points either side of it.
+    def _generateAdaptiveSeedPoints(self):
+        factor = self._coarse_factor
+        line_indices, positions = self._lines.getPointPositions(self._spacing)
+        is_first = np.ones(len(positions), bool)
+        is_first[1:] = line_indices[1:] != line_indices[:-1]
+        is_last = np.ones(len(positions), bool)
+        is_last[:-1] = is_first[1:]
+        coarse = (positions % factor == 0) | is_first | is_last
+        coarse_lines = line_indices[coarse]
+        coarse_points = self._lines.getPoints(self._spacing, coarse_lines, positions[coarse])
+        
+        # count the coarse points of other lines near each coarse point
+        pairs = cKDTree(coarse_points).query_pairs(factor * self._spacing, output_type='ndarray')
+        pairs = pairs[coarse_lines[pairs[:,0]] != coarse_lines[pairs[:,1]]]
+        neighbours = np.bincount(pairs.ravel(), minlength=coarse_points.shape[0])
+        converging = neighbours >= self._min_neighbours
+        
+        # the coarse points before and after each point of the full discretization,
+        # found by ordering the points by line and then position
+        num_positions = int(np.max(positions)) + 1 if len(positions) > 0 else 1
+        keys = line_indices.astype(np.int64) * num_positions + positions
+        before = np.searchsorted(keys[coarse], keys, side='right') - 1
+        after = np.searchsorted(keys[coarse], keys, side='left')
+        keep = coarse | converging[before] | converging[after]
+        
+        self._line_indices = line_indices[keep]
+        self._all_points = self._lines.getPoints(self._spacing, self._line_indices, positions[keep])
+        
+    # Voronoi engine: tessellates all of the seed points and finds the point
+    # with the smallest region per line
+    def _getSmallestRegions(self, timer=profiling.NULL_TIMER):
+        if self._subdomains > 1:
+            return self._getSmallestRegionsDecomposed(timer)
+        points, volumes = _getSmallestRegionPerLine(self._all_points, self._line_indices, 
+                                                    self._num_rows, timer)
+        # lines without seed points, e.g. clipped out by the field of view, have
+        # no point of interest
+        found = points != -1
+        return points[found], volumes[found]
+        
+    # Voronoi engine for frames with many seed points. The seed points are split
+    # into subdomains of about equal numbers of points, each of which is 
+    # tessellated with the points within overlap of it (the halo). The halo 
+    # points only bound the regions, and are not candidates, so each point is a
+    # candidate in one subdomain, and the smallest regions of each line found in
+    # the subdomains are merged, with ties going to the later point as in 
+    # vmptlib. The region of a point is that of the tessellation of the whole
+    # frame if the sphere about each of its vertices through the point holds no
+    # other point of the frame, or, if the region is unbounded, if the point is
+    # on the convex hull of the frame. If any region of a subdomain is not, the 
+    # subdomain is tessellated again with at least twice the overlap, so the 
+    # points of interest are those of the whole frame whatever the overlap. The 
+    # subdomains are tessellated in num_threads threads, as the tessellation
+    # releases the GIL, and each tessellation is smaller than that of the whole
+    # frame. Each subdomain is timed separately, and the records merged into 
+    # the timer of the frame.
+    def _getSmallestRegionsDecomposed(self, timer=profiling.NULL_TIMER):
+        num_points = self._all_points.shape[0]
+        domains = _splitPoints(self._all_points, np.arange(num_points), self._subdomains)
+        timer.count('subdomains', len(domains))
+        frame_lower = np.min(self._all_points, axis=0)
+        frame_upper = np.max(self._all_points, axis=0)
+        tree = cKDTree(self._all_points)
+        on_hull = np.zeros(num_points, bool)
+        hull = ConvexHull(self._all_points, qhull_options='Qc')
+        on_hull[hull.vertices] = True
+        on_hull[hull.coplanar[:,0]] = True
+        timer.mark('halo_check')
         
+        def tessellate(domain):
+            is_core = np.zeros(num_points, bool)
+            is_core[domain] = True
+            domain_timer = profiling.StageTimer()
+            overlap = self._overlap
+            num_retries = 0
+            while True:
+                lower = np.min(self._all_points[domain,:], axis=0) - overlap
+                upper = np.max(self._all_points[domain,:], axis=0) + overlap
+                members = np.flatnonzero(np.all((self._all_points >= lower) & 
+                                                (self._all_points <= upper), axis=1))
+                # the halo points are given to an extra line, which is discarded
+                line_indices = np.where(is_core[members], self._line_indices[members], self._num_rows)
+                regions = _tessellate(self._all_points[members,:], domain_timer)
+                points, volumes = _getSmallestRegionArray(regions, line_indices, self._num_rows + 1)
+                domain_timer.mark('smallest_region')
+                # beyond the edges of the frame there are no points to be missed
+                lower = np.where(lower <= frame_lower, -np.inf, lower)
+                upper = np.where(upper >= frame_upper, np.inf, upper)
+                if np.all(np.isinf(lower)) and np.all(np.isinf(upper)):
+                    break
+                core = np.flatnonzero(is_core[members])
+                exact, bounded, reach = _getExactRegions(self._all_points, members[core], regions, core, 
+                                                  lower, upper, tree)
+                domain_timer.mark('halo_check')
+                if np.all(exact | (~bounded & on_hull[members[core]])):
+                    break
+                overlap = max(2 * overlap, overlap + reach, self._spacing)
+                num_retries += 1
+            domain_timer.count('halo_retries', num_retries)
+            lines = np.flatnonzero(points[0:self._num_rows] != -1)
+            return lines, members[points[lines]], volumes[lines], domain_timer.getRecord()
         
+        if self._num_threads > 1:
+            pool = multiprocessing.pool.ThreadPool(min(self._num_threads, len(domains)))
+            try:
+                results = pool.map(tessellate, domains)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [tessellate(domain) for domain in domains]
+        timer.merge([result[3] for result in results])
         
+        lines = np.concatenate([result[0] for result in results])
+        points = np.concatenate([result[1] for result in results])
+        volumes = np.concatenate([result[2] for result in results])
+        # the smallest region of each line is taken, and of equal regions the last
+        # point, as in vmptlib
+        order = np.lexsort((-points, volumes, lines))
+        first = np.ones(len(order), bool)
+        first[1:] = lines[order][1:] != lines[order][:-1]
+        timer.mark('smallest_region')
+        
+        return points[order][first], volumes[order][first]
+        
+    # Density engine: estimates the local density at each seed point as the mean
+    # distance to its k nearest seed points on other lines, using a KD-tree rather 
+    # than a tessellation, and finds the densest point per line. The estimate
+    # takes the place of the Voronoi region size.
+    def _getDensestPoints(self, k):
+        num_points = self._all_points.shape[0]
+        # a point has no neighbours to estimate its density from, e.g. if every
+        # line is clipped out by the field of view
+        if num_points < 2:
+            return np.zeros(0, np.intp), np.zeros(0, float)
+        # neighbours along the same line are discarded, so extra neighbours are queried
+        num_query = min(3 * k + 1, num_points)
+        tree = cKDTree(self._all_points)
+        distances, indices = tree.query(self._all_points, k=num_query)
+        # a single neighbour is returned as 1-D arrays
+        distances = distances.reshape(num_points, num_query)
+        indices = indices.reshape(num_points, num_query)
+        
+        same_line = self._line_indices[indices] == self._line_indices[:,np.newaxis]
+        distances[same_line] = np.inf
+        distances.sort(axis=1)
+        density = np.mean(distances[:,0:k], axis=1)
+        
+        # order the points by line, and then by density, and take the first per line
+        order = np.lexsort((density, self._line_indices))
+        first = np.ones(num_points, bool)
+        first[1:] = self._line_indices[order][1:] != self._line_indices[order][:-1]
+        points = order[first]
+        volumes = density[points]
+        # lines with too few neighbours to estimate a density have no point of interest
+        found = np.isfinite(volumes)
+        
+        return points[found], volumes[found]
+        
+# Tessellates the points and finds the point with the smallest region on each of
+# num_lines lines, given the line of each point. Returns the index of the point
+# per line, which is -1 for lines without points, and the volume of its region.
+# As in the list-based vmptlib.getSmallestRegion, unbounded regions have a volume
+# of 100000, so a line on which every point has one keeps the last of them.
+def _getSmallestRegionPerLine(all_points, line_indices, num_lines, timer=profiling.NULL_TIMER):
+    regions = _tessellate(all_points, timer)
+    points, volumes = _getSmallestRegionArray(regions, line_indices, num_lines)
+    timer.mark('smallest_region')
+    return points, volumes
+
+# Tessellates the points, returning the (point_region, region_offsets, 
+# region_vertices, vertices) arrays of the regions. The regions are in
+# compressed form: the vertex indices of all regions in one array, and the
+# offset of each region into that array.
+def _tessellate(all_points, timer=profiling.NULL_TIMER):
+    voro = Voronoi(all_points)    
+    timer.mark('voronoi')
+    timer.count('voronoi_regions', len(voro.regions))
+             
+    region_sizes = np.fromiter((len(region) for region in voro.regions), 
+                               np.intp, len(voro.regions))
+    region_offsets = np.zeros(len(voro.regions) + 1, np.intp)
+    np.cumsum(region_sizes, out=region_offsets[1:])
+    region_vertices = np.fromiter(itertools.chain.from_iterable(voro.regions), 
+                                  np.intp, region_offsets[-1])
+    regions = (np.ascontiguousarray(voro.point_region, np.intp), region_offsets, region_vertices,
+               np.ascontiguousarray(voro.vertices, float))
+    del voro # freeing the regions takes some time, so is included in the next stage
+    return regions
+
+# Finds the point with the smallest region on each of num_lines lines, given the
+# regions from _tessellate and the line of each point, using vmptlib
+def _getSmallestRegionArray(regions, line_indices, num_lines):
+    point_region, region_offsets, region_vertices, vertices = regions
+    points = np.empty(num_lines, np.intp)
+    volumes = np.empty(num_lines, float)
+    vmptlib.getSmallestRegionArray(np.ascontiguousarray(line_indices, np.intp),
+                                   point_region,
+                                   region_offsets,
+                                   region_vertices,
+                                   vertices,
+                                   points,
+                                   volumes)
+    return points, volumes
+
+# Returns whether the region of each of the given points, in a tessellation of
+# only some of the points of the frame, is its region in the tessellation of 
+# every point, whether it is bounded, and how far beyond the box the box must
+# grow to hold the spheres of the regions which are not. point_indices are the indices of the
+# points in all_points, and region_points their indices in the tessellation. The
+# region is the same if the sphere about each of its vertices through the point
+# holds no other point. This is so if the sphere lies in the box between lower
+# and upper, in which every point is in the tessellation, and is otherwise 
+# checked with the KD-tree of all of the points.
+def _getExactRegions(all_points, point_indices, regions, region_points, lower, upper, tree):
+    point_region, region_offsets, region_vertices, vertices = regions
+    num_points = len(point_indices)
+    starts = region_offsets[point_region[region_points]]
+    sizes = region_offsets[point_region[region_points] + 1] - starts
+    owners = np.repeat(np.arange(num_points), sizes)
+    entries = np.repeat(starts - np.concatenate(([0], np.cumsum(sizes)[:-1])), sizes) + \
+              np.arange(np.sum(sizes))
+    vertex_ids = region_vertices[entries]
+    bounded = np.bincount(owners[vertex_ids == -1], minlength=num_points) == 0
+    
+    owners = owners[vertex_ids != -1]
+    centres = vertices[vertex_ids[vertex_ids != -1]]
+    radii = np.sqrt(np.sum((centres - all_points[point_indices[owners]]) ** 2, axis=1))
+    inside = np.all((centres - radii[:,np.newaxis] >= lower) & 
+                    (centres + radii[:,np.newaxis] <= upper), axis=1)
+    # the nearest point to the centre of an empty sphere is on it, so is no
+    # nearer than the radius, up to the rounding of the vertex
+    nearest, _ = tree.query(centres[~inside])
+    empty = inside.copy()
+    empty[~inside] = nearest >= radii[~inside] * (1.0 - 1e-9)
+    exact = bounded & (np.bincount(owners[~empty], minlength=num_points) == 0)
+    # how far the spheres which hold other points reach beyond the box
+    beyond = np.maximum(lower - (centres[~empty] - radii[~empty,np.newaxis]), 
+                        (centres[~empty] + radii[~empty,np.newaxis]) - upper)
+    reach = np.max(beyond) if beyond.size > 0 else 0.0
+    return exact, bounded, reach
+    
+# Splits the points at the given indices into num_domains subdomains of about 
+# equal numbers of points, by splitting them recursively at the quantile along 
+# the axis on which they are widest. Returns the list of the indices of each.
+def _splitPoints(all_points, indices, num_domains):
+    if num_domains <= 1 or len(indices) < 2:
+        return [indices]
+    num_left = num_domains // 2
+    subset = all_points[indices,:]
+    axis = np.argmax(np.max(subset, axis=0) - np.min(subset, axis=0))
+    order = np.argsort(subset[:,axis], kind='mergesort')
+    split = len(indices) * num_left // num_domains
+    return _splitPoints(all_points, indices[order[0:split]], num_left) + \
+           _splitPoints(all_points, indices[order[split:]], num_domains - num_left)
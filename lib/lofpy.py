@@ -1,27 +1,34 @@
 from sklearn.neighbors import NearestNeighbors
 import numpy as np
 
-def getLOF(k, X):
-    num_points = X.shape[0]
-    lof = np.zeros((num_points,1), np.float)
-    lrd = np.zeros((num_points,1), np.float)
-    # determine the k nearest neighbours in the set X
-    nbrs = NearestNeighbors(n_neighbors=k+1).fit(X)
-    distances, indices = nbrs.kneighbors(X)
+# Returns the distances to, and indices of, the k nearest neighbours of every
+# point in X (the first column being the point itself).
+# nbrs may be an already fitted NearestNeighbors object, in which case the tree
+# is reused rather than rebuilt.
+def getNeighbors(k, X, nbrs=None):
+    if nbrs is None:
+        nbrs = NearestNeighbors(n_neighbors=k+1).fit(X)
+    return nbrs.kneighbors(X, n_neighbors=k+1)
+
+# Calculates the Local Outlier Factor of every point in X, using the k nearest
+# neighbours. The neighbour search can be skipped by passing in either a fitted
+# NearestNeighbors object or the (distances, indices) tuple returned by 
+# getNeighbors. Returns a flat (n,) array.
+def getLOF(k, X, neighbors=None):
+    if neighbors is None or isinstance(neighbors, NearestNeighbors):
+        distances, indices = getNeighbors(k, X, neighbors)
+    else:
+        distances, indices = neighbors
     
+    nbr_indices = indices[:,1:k+1]
+    nbr_distances = distances[:,1:k+1]
     # find the k-distance for each point
-    kdistances = distances[:,-1]
+    kdistances = distances[:,k]
+    # reachability distance of each point from each of its neighbours
+    reach_dist = np.maximum(nbr_distances, kdistances[nbr_indices])
+    # local reachability density
+    lrd = float(k) / np.sum(reach_dist, axis=1)
     
-    for i in range(0, num_points):
-        # calculate the reachability distance for the  i-th point
-        i_nbrs = indices[i,1:]
-        i_kdist = kdistances[i_nbrs]
-        i_reach_dist = np.maximum(distances[i,1:],i_kdist)
-        # calculate the lrd for the i-th point
-        lrd[i] = float(k) / np.sum(i_reach_dist)
-        
-    for j in range(0, num_points):
-        j_nbrs = indices[j,1:]
-        lof[j] = (np.sum(lrd[j_nbrs]) / float(k)) / lrd[j]
+    lof = (np.sum(lrd[nbr_indices], axis=1) / float(k)) / lrd
            
-    return lof
\ No newline at end of file
+    return lof
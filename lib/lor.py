@@ -39,4 +39,121 @@ class LineOfResponse:
         
         
     
-        
\ No newline at end of file
+# Struct-of-arrays representation of every LOR in a frame. Holds the end points
+# of all the lines as (N,3) arrays so that the frame time, the number of points
+# per line and the discretization of the whole frame are each computed in a 
+# single vectorized pass, rather than once per LineOfResponse object.
+class LineBatch:
+    
+    # frame_data is the (N,7) block of [Ax,Ay,Az,Bx,By,Bz,t] rows
+    def __init__(self, frame_data):
+        self._A = frame_data[:,0:3]
+        self._B = frame_data[:,3:6]
+        self._times = frame_data[:,6]
+        self._V = self._B - self._A # vectors from A to B
+        self._num_lines = frame_data.shape[0]
+        self._lengths = np.sqrt(np.sum(self._V * self._V, axis=1))
+        self._start = None  # range of each line inside the field of view, if clipped
+        self._end = None
+        
+    def getNumLines(self):
+        return self._num_lines
+        
+    # returns the average of all the line times
+    def getMeanTime(self):
+        return np.sum(self._times)/self._num_lines
+        
+    # Clips every line to the part inside a field of view (see fov.py). Only the
+    # points of the full discretization of each line which are inside are kept,
+    # so that the spacing of the points is unchanged. Lines which miss the field 
+    # of view have no discrete points.
+    def clip(self, fov):
+        start, end = fov.getIntervals(self._A, self._V)
+        if self._start is not None:
+            # clipped to more than one field of view
+            start = np.maximum(start, self._start)
+            end = np.minimum(end, self._end)
+        # lines which miss are given a finite, empty range
+        missed = ~(end >= start)
+        start[missed] = 1.0
+        end[missed] = 0.0
+        self._start = start
+        self._end = end
+        
+    # returns an (N,) array with the number of discrete points on each line
+    def getNumPoints(self, spacing):
+        if self._start is None:
+            return self._getFullNumPoints(spacing)
+        first, last = self._getPositionRange(spacing)
+        return np.maximum(last - first + 1, 0)
+        
+    # returns a single line as a LineOfResponse object
+    def getLine(self, line_id):
+        return LineOfResponse(self._A[line_id,:].copy(), self._B[line_id,:].copy(), line_id)
+        
+    # Discretizes every line in the batch. Uses the same x_i = A + ri(B - A)
+    # scheme as LineOfResponse.getLineDiscretization, but for all lines at once.
+    # Returns the (total_points,3) array of points and the (total_points,) 
+    # array of the line ID's to which each point belongs.
+    def getDiscretization(self, spacing):
+        line_indices, positions = self.getPointPositions(spacing)
+        return self.getPoints(spacing, line_indices, positions), line_indices
+        
+    # Returns the line ID and the position i along its line of every discrete
+    # point, in order of line and then position
+    def getPointPositions(self, spacing):
+        num_points = self.getNumPoints(spacing)
+        total_points = int(np.sum(num_points))
+        
+        line_indices = np.repeat(np.arange(self._num_lines), num_points)
+        line_starts = np.cumsum(num_points) - num_points
+        positions = np.arange(total_points) - np.repeat(line_starts, num_points)
+        if self._start is not None:
+            first, _ = self._getPositionRange(spacing)
+            positions += first[line_indices]
+        return line_indices, positions
+        
+    # Returns the discrete points at the given positions of the given lines, e.g. 
+    # a subset of those returned by getPointPositions
+    def getPoints(self, spacing, line_indices, positions):
+        num_points = self._getFullNumPoints(spacing)
+        # lines shorter than the spacing consist only of the point A
+        divisor = np.maximum(num_points - 1.0, 1.0)
+        r = 1.0/divisor
+        
+        return self._A[line_indices,:] + r[line_indices,np.newaxis] * \
+               (positions[:,np.newaxis] * self._V[line_indices,:])
+        
+    # number of discrete points on each whole line
+    def _getFullNumPoints(self, spacing):
+        return np.floor(self._lengths/spacing).astype(int) + 1
+        
+    # first and last positions of each line inside the field of view
+    def _getPositionRange(self, spacing):
+        divisor = np.maximum(self._getFullNumPoints(spacing) - 1, 1)
+        first = np.ceil(self._start * divisor).astype(int)
+        last = np.floor(self._end * divisor).astype(int)
+        return first, last
+        
+# Discretization of a span of consecutive lines, e.g. the lines of several
+# overlapping frames. The seed points of any range of the lines are taken from
+# it, so that each line is discretized once rather than once per frame.
+class LineSpan:
+    
+    # span_data is the (N,7) block of rows, which are clipped to the field of 
+    # view fov if it is given
+    def __init__(self, span_data, spacing, fov=None):
+        lines = LineBatch(span_data)
+        if fov is not None:
+            lines.clip(fov)
+        self._points, self._line_indices = lines.getDiscretization(spacing)
+        num_points = lines.getNumPoints(spacing)
+        self._offsets = np.zeros(len(num_points) + 1, int)  # of the first point of each line
+        np.cumsum(num_points, out=self._offsets[1:])
+        
+    # Returns the (points, line_indices) of the discretization of the lines from
+    # row start to stop, as LineBatch.getDiscretization does for those rows
+    def getSeedPoints(self, start, stop):
+        first = self._offsets[start]
+        last = self._offsets[stop]
+        return self._points[first:last,:], self._line_indices[first:last] - start
@@ -2,6 +2,13 @@ from mpl_toolkits.mplot3d import Axes3D
 import scipy.stats
 import matplotlib.pyplot as plt
 import numpy as np
+from lib import vmptutils as vuti
+
+# The ...File methods read a location output file (locations.csv or
+# locations.bin) in chunks of chunk_rows rows, using the get... methods, and plot
+# a binned or decimated summary of it, so that outputs larger than memory can be
+# plotted in one or two passes. The other methods plot arrays in memory.
+COLUMNS = {'x':0, 'y':1, 'z':2, 't':3}
 
 def scatter3D(data):
     fig = plt.figure()
@@ -42,7 +49,7 @@ def histogram(data, nbins=None,
     plt.show()
     
 def cumulativeFrequency(data, nbins=None):
-    data.sort()
+    data = np.sort(data)
     fig, ax = plt.subplots(1,1)
     if nbins is None:
         density, base = np.histogram(data)
@@ -57,3 +64,103 @@ def cumulativeFrequency(data, nbins=None):
     cdf_fitted = dist.cdf(data, *param[:-2], loc=param[0],scale=param[1]) * len(data)
     ax.plot(data, cdf_fitted, c='r')
     plt.show()
+    
+# Returns the (2,4) array of the minimum and maximum of each column [x,y,z,t]
+def getBounds(file_path, chunk_rows=100000):
+    bounds = np.array([np.repeat(np.inf, 4), np.repeat(-np.inf, 4)])
+    for chunk in vuti.readLocations(file_path, chunk_rows):
+        bounds[0] = np.minimum(bounds[0], np.min(chunk, axis=0))
+        bounds[1] = np.maximum(bounds[1], np.max(chunk, axis=0))
+    return bounds
+    
+# Returns the number of locations in each cell of a 3D grid of bins cells per 
+# axis, and the edges of the cells along each axis. bounds is a (2,3) array of
+# the lower and upper corners of the grid, found from the data if not given.
+def getOccupancyGrid(file_path, bins=64, bounds=None, chunk_rows=100000):
+    if bounds is None:
+        bounds = getBounds(file_path, chunk_rows)[:,0:3]
+    edges = [np.linspace(bounds[0][i], bounds[1][i], bins + 1) for i in range(3)]
+    counts = np.zeros((bins, bins, bins))
+    for chunk in vuti.readLocations(file_path, chunk_rows):
+        chunk_counts, _ = np.histogramdd(chunk[:,0:3], bins=edges)
+        counts += chunk_counts
+    return counts, edges
+    
+# Returns the histogram of one column ('x', 'y', 'z' or 't') of the locations,
+# as (counts, edges). value_range is the (min, max) of the bins, found from the
+# data if not given.
+def getHistogram(file_path, column, bins=100, value_range=None, chunk_rows=100000):
+    index = COLUMNS[column]
+    if value_range is None:
+        bounds = getBounds(file_path, chunk_rows)
+        value_range = (bounds[0][index], bounds[1][index])
+    edges = np.linspace(value_range[0], value_range[1], bins + 1)
+    counts = np.zeros(bins)
+    for chunk in vuti.readLocations(file_path, chunk_rows):
+        chunk_counts, _ = np.histogram(chunk[:,index], bins=edges)
+        counts += chunk_counts
+    return counts, edges
+    
+# Returns a subsample of the locations with at most max_per_window locations in
+# each time window of length window, chosen at random. The output is assumed to 
+# be in time order, as written by location_p.py, so that only the window being
+# read is held in memory.
+def getTimeSubsample(file_path, window, max_per_window=100, seed=0, chunk_rows=100000):
+    rng = np.random.RandomState(seed)
+    samples = []
+    pending = np.zeros((0,5))   # candidates of the last window read, with their keys
+    for chunk in vuti.readLocations(file_path, chunk_rows):
+        rows = np.concatenate((pending, np.column_stack((chunk, rng.rand(chunk.shape[0])))))
+        # the rows of each window with the smallest random keys are kept
+        windows = np.floor(rows[:,3] / window)
+        order = np.lexsort((rows[:,4], windows))
+        rows = rows[order]
+        windows = windows[order]
+        window_starts = np.searchsorted(windows, windows)
+        rows = rows[np.arange(rows.shape[0]) - window_starts < max_per_window]
+        windows = np.floor(rows[:,3] / window)
+        # the last window may continue in the next chunk
+        last = windows == windows[-1]
+        samples.append(rows[~last,0:4])
+        pending = rows[last]
+    samples.append(pending[:,0:4])
+    return np.concatenate(samples)
+    
+# Plots the projections of the occupancy grid onto the xy, xz and yz planes, on 
+# a log scale
+def plotOccupancyFile(file_path, bins=64, bounds=None, chunk_rows=100000):
+    counts, edges = getOccupancyGrid(file_path, bins, bounds, chunk_rows)
+    fig, axes = plt.subplots(1,3, figsize=(15,5))
+    for ax, (i, j), summed_axis in zip(axes, [(0,1), (0,2), (1,2)], [2, 1, 0]):
+        projection = np.sum(counts, axis=summed_axis)
+        extent = [edges[i][0], edges[i][-1], edges[j][0], edges[j][-1]]
+        image = ax.imshow(np.log10(projection.T + 1), origin='lower', extent=extent, aspect='auto')
+        ax.set_xlabel('XYZ'[i])
+        ax.set_ylabel('XYZ'[j])
+        fig.colorbar(image, ax=ax, label='log10(count + 1)')
+    plt.show()
+    
+# Plots a 3D scatter of a time windowed subsample of the locations, coloured by
+# time
+def scatter3DFile(file_path, window, max_per_window=100, chunk_rows=100000):
+    data = getTimeSubsample(file_path, window, max_per_window, chunk_rows=chunk_rows)
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    
+    points = ax.scatter(data[:,0], data[:,1], data[:,2], c=data[:,3], marker='o')
+    fig.colorbar(points, ax=ax, label='T')
+    
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    
+    plt.show()
+    
+# Plots the histogram of one column ('x', 'y', 'z' or 't') of the locations
+def histogramFile(file_path, column, bins=100, value_range=None, chunk_rows=100000):
+    counts, edges = getHistogram(file_path, column, bins, value_range, chunk_rows)
+    plt.bar(edges[:-1], counts, width=np.diff(edges), align='edge')
+    plt.title('Histogram of ' + column)
+    plt.xlabel(column)
+    plt.ylabel('Frequency')
+    plt.show()
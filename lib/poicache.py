@@ -0,0 +1,130 @@
+import numpy as np
+import hashlib
+import os
+import glob
+import shutil
+import itertools
+
+HASH_BLOCK_BYTES = 16 * 1024 * 1024   # size of the blocks read when hashing a file
+TEMP_SUFFIX = '.tmp'                  # of entries being written
+
+# Returns the SHA-1 hash of the contents of a file
+def getFileHash(file_path):
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        block = f.read(HASH_BLOCK_BYTES)
+        while len(block) > 0:
+            file_hash.update(block)
+            block = f.read(HASH_BLOCK_BYTES)
+    return file_hash.hexdigest()
+
+# On-disk cache of the points of interest of every frame of a file, so that they
+# are only calculated once when the later stages are rerun with other parameters.
+# Entries are keyed by the hash of the file contents, the point of interest
+# engine, the frame size and the discretization spacing. Each entry is a folder
+# of parts holding the points of interest of consecutive frames, so that an
+# entry is written and read a part at a time, and memory use does not depend
+# on the size of the file. Once the cache exceeds max_bytes, the least recently
+# used entries are deleted.
+class POICache:
+    def __init__(self, cache_folder, max_bytes):
+        self._cache_folder = cache_folder
+        self._max_bytes = max_bytes
+        if not os.path.isdir(cache_folder):
+            os.makedirs(cache_folder)
+            
+    # Returns the path of the cache entry for the given key
+    def getEntryPath(self, file_hash, engine, frame_size, spacing):
+        name = '%s_%s_%d_%r' % (file_hash, engine, frame_size, float(spacing))
+        return os.path.join(self._cache_folder, name)
+    
+    # Returns a generator of the per frame (points, volumes, time) tuples stored
+    # for the key, which reads one part of the entry at a time, or None if there
+    # is no entry
+    def load(self, file_hash, engine, frame_size, spacing):
+        entry_path = self.getEntryPath(file_hash, engine, frame_size, spacing)
+        if not os.path.isdir(entry_path):
+            return None
+        os.utime(entry_path, None) # marks the entry as recently used
+        part_paths = sorted(glob.glob(os.path.join(entry_path, 'part*.npz')))
+        return _readParts(part_paths)
+    
+    # Stores the per frame (points, volumes, time) tuples of the iterable for the
+    # key, in parts of part_frames frames, so that only one part is held at a 
+    # time. This is a generator, which yields the tuples once their part is 
+    # written, so that the frames can be used as they are found. The entry is
+    # written under a temporary name, and only becomes complete, to be loaded by
+    # later runs, once every tuple has been yielded.
+    def store(self, file_hash, engine, frame_size, spacing, frame_pois, part_frames=100):
+        entry_path = self.getEntryPath(file_hash, engine, frame_size, spacing)
+        temp_path = entry_path + TEMP_SUFFIX
+        if os.path.isdir(temp_path):
+            shutil.rmtree(temp_path) # left by a run which was stopped
+        os.makedirs(temp_path)
+        try:
+            frame_pois = iter(frame_pois)
+            part_num = 0
+            while True:
+                part = list(itertools.islice(frame_pois, part_frames))
+                if len(part) == 0:
+                    break
+                _writePart(os.path.join(temp_path, 'part%06d.npz' % part_num), part)
+                part_num += 1
+                for poi in part:
+                    yield poi
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            os.rename(temp_path, entry_path)
+        finally:
+            if os.path.isdir(temp_path):
+                shutil.rmtree(temp_path)
+        self.evict()
+        
+    # Deletes the least recently used entries until the cache is within its size.
+    # Entries still being written are neither counted nor deleted.
+    def evict(self):
+        entries = [entry for entry in glob.glob(os.path.join(self._cache_folder, '*')) \
+                   if not entry.endswith(TEMP_SUFFIX)]
+        entries.sort(key=os.path.getmtime)
+        entry_bytes = dict((entry, _getSize(entry)) for entry in entries)
+        total_bytes = sum(entry_bytes.values())
+        # the most recent entry is always kept
+        for entry in entries[:-1]:
+            if total_bytes <= self._max_bytes:
+                break
+            total_bytes -= entry_bytes[entry]
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            else:
+                os.remove(entry)
+
+# Writes the list of per frame (points, volumes, time) tuples of one part of an
+# entry. The frames are stored together, as one array of each quantity.
+def _writePart(part_path, frame_pois):
+    offsets = np.zeros(len(frame_pois) + 1, int)
+    offsets[1:] = np.cumsum([len(volumes) for _, volumes, _ in frame_pois])
+    points = np.zeros((offsets[-1],3))
+    volumes = np.zeros(offsets[-1])
+    for i, (frame_points, frame_volumes, _) in enumerate(frame_pois):
+        points[offsets[i]:offsets[i+1],:] = frame_points
+        volumes[offsets[i]:offsets[i+1]] = frame_volumes
+    times = np.array([time_i for _, _, time_i in frame_pois], float)
+    np.savez(part_path, points=points, volumes=volumes, offsets=offsets, times=times)
+
+# Generator of the per frame (points, volumes, time) tuples of the parts of an
+# entry, in order
+def _readParts(part_paths):
+    for part_path in part_paths:
+        with np.load(part_path) as part:
+            points = part['points']
+            volumes = part['volumes']
+            offsets = part['offsets']
+            times = part['times']
+        for i in range(len(times)):
+            yield points[offsets[i]:offsets[i+1],:], volumes[offsets[i]:offsets[i+1]], times[i]
+
+# Returns the size of an entry, or of a file left by an older version
+def _getSize(entry):
+    if os.path.isdir(entry):
+        return sum(os.path.getsize(path) for path in glob.glob(os.path.join(entry, '*')))
+    return os.path.getsize(entry)
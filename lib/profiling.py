@@ -0,0 +1,190 @@
+import numpy as np
+import time
+
+# Records the time spent in each stage of locating the tracers in one frame, 
+# along with the sizes of the data at each stage (e.g. number of seed points).
+# Each call to mark() ends the current stage.
+class StageTimer:
+    def __init__(self):
+        self._stages = []
+        self._times = {}
+        self._counts = []
+        self._last = time.time()
+    
+    # Starts timing the next stage from now
+    def reset(self):
+        self._last = time.time()
+        
+    # Ends the current stage, adding the time since the previous mark to it
+    def mark(self, stage):
+        now = time.time()
+        if stage not in self._times:
+            self._stages.append(stage)
+            self._times[stage] = 0.0
+        self._times[stage] += now - self._last
+        self._last = now
+        
+    # Records the size of some quantity in the frame
+    def count(self, name, value):
+        self._counts.append((name, int(value)))
+        
+    # Ends stages that were run in parallel, e.g. in threads each with its own 
+    # timer, given the records of those timers. The time since the previous mark
+    # is split between their stages in proportion to the total time of each 
+    # stage, and the counts of the same name are summed.
+    def merge(self, records):
+        now = time.time()
+        stages = []
+        stage_times = {}
+        names = []
+        counts = {}
+        for record in records:
+            for stage, stage_time in record['times']:
+                if stage not in stage_times:
+                    stages.append(stage)
+                    stage_times[stage] = 0.0
+                stage_times[stage] += stage_time
+            for name, value in record['counts']:
+                if name not in counts:
+                    names.append(name)
+                    counts[name] = 0
+                counts[name] += value
+        total_time = sum(stage_times.values())
+        for stage in stages:
+            if stage not in self._times:
+                self._stages.append(stage)
+                self._times[stage] = 0.0
+            if total_time > 0:
+                self._times[stage] += (now - self._last) * stage_times[stage] / total_time
+        for name in names:
+            self._counts.append((name, counts[name]))
+        self._last = now
+        
+    # Returns the record of the frame, to be passed back from a worker process
+    def getRecord(self):
+        return {'times':[(stage, self._times[stage]) for stage in self._stages],
+                'counts':self._counts}
+
+# Timer used when profiling is disabled, which does nothing
+class _NullTimer:
+    def reset(self):
+        return None
+    def mark(self, stage):
+        return None
+    def count(self, name, value):
+        return None
+    def merge(self, records):
+        return None
+    def getRecord(self):
+        return None
+
+NULL_TIMER = _NullTimer()
+
+# Wraps a method, called as func(arg, timer), so that it can be passed to a Pool
+# and return (output, record) for each frame
+class Profiled:
+    def __init__(self, func):
+        self._func = func
+        
+    def __call__(self, arg):
+        timer = StageTimer()
+        output = self._func(arg, timer)
+        return output, timer.getRecord()
+
+# Aggregates the records of many frames, e.g. for one file or the whole run
+class ProfileSummary:
+    def __init__(self):
+        self._num_frames = 0
+        self._stages = []
+        self._times = {}
+        self._count_names = []
+        self._counts = {}
+        
+    def add(self, record):
+        self._num_frames += 1
+        for stage, stage_time in record['times']:
+            if stage not in self._times:
+                self._stages.append(stage)
+                self._times[stage] = []
+            self._times[stage].append(stage_time)
+        for name, value in record['counts']:
+            if name not in self._counts:
+                self._count_names.append(name)
+                self._counts[name] = []
+            self._counts[name].append(value)
+            
+    def getNumFrames(self):
+        return self._num_frames
+    
+    # Returns a list of (stage, mean time in seconds) in the order the stages ran
+    def getStageMeans(self):
+        return [(stage, np.mean(self._times[stage])) for stage in self._stages]
+    
+    # Prints the percentiles of the time taken by each stage, and of the sizes, 
+    # together with the frame rate over the elapsed (wall clock) time
+    def printSummary(self, title, elapsed):
+        print('-- Profile: ' + title + ' --')
+        if self._num_frames == 0:
+            print('No frames profiled')
+            return
+        print('%d frames in %.2fs (%.2f frames/s)' % (self._num_frames, elapsed, self._num_frames / max(elapsed, 1e-9)))
+        
+        total_time = sum(np.sum(self._times[stage]) for stage in self._stages)
+        print('%-20s %10s %10s %10s %10s %8s' % ('stage (ms)', 'mean', 'p50', 'p90', 'p99', 'share'))
+        for stage in self._stages:
+            times = 1000.0 * np.array(self._times[stage])
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            print('%-20s %10.2f %10.2f %10.2f %10.2f %7.1f%%' % (stage, np.mean(times), p50, p90, p99, 
+                                                               100.0 * np.sum(times) / max(1000.0 * total_time, 1e-9)))
+        print('%-20s %10s %10s %10s %10s' % ('size', 'mean', 'p50', 'min', 'max'))
+        for name in self._count_names:
+            counts = np.array(self._counts[name])
+            print('%-20s %10.1f %10.1f %10d %10d' % (name, np.mean(counts), np.percentile(counts, 50), 
+                                                  np.min(counts), np.max(counts)))
+
+# Records the latency of each frame in a stream, from the arrival of its last line
+# to the output of its locations, and prints a report every report_interval
+# seconds of the frame rate, the latency percentiles and the number of frames
+# waiting to be processed over the interval.
+class LatencyMonitor:
+    def __init__(self, report_interval):
+        self._report_interval = report_interval
+        self._start = time.time()
+        self._last_report = self._start
+        self._num_frames = 0
+        self._latencies = []
+        self._backlogs = []
+        self._num_stalls = 0
+        
+    # Adds the latency of one frame, and the number of frames read but not yet output
+    def add(self, latency, backlog):
+        self._num_frames += 1
+        self._latencies.append(latency)
+        self._backlogs.append(backlog)
+        
+    # Records that reading was held back because too many frames were waiting
+    def addStall(self):
+        self._num_stalls += 1
+        
+    def getNumFrames(self):
+        return self._num_frames
+        
+    # Prints a report if report_interval has passed since the last one
+    def update(self):
+        if time.time() - self._last_report >= self._report_interval:
+            self.printReport()
+        
+    # Prints the report of the frames since the last report, if there are any
+    def printReport(self):
+        now = time.time()
+        elapsed = now - self._last_report
+        if len(self._latencies) > 0:
+            latencies = 1000.0 * np.array(self._latencies)
+            p50, p90, max_latency = np.percentile(latencies, [50, 90, 100])
+            print('-- Stream: %d frames in %.1fs (%.2f frames/s), latency (ms) p50 %.1f p90 %.1f max %.1f, '
+                  'backlog max %d, stalls %d --' % (len(latencies), elapsed, len(latencies) / max(elapsed, 1e-9),
+                                                    p50, p90, max_latency, max(self._backlogs), self._num_stalls))
+        self._latencies = []
+        self._backlogs = []
+        self._num_stalls = 0
+        self._last_report = now
@@ -0,0 +1,39 @@
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import NearestNeighbors
+
+# A single spatial index over the points of interest of a frame, shared by the
+# LOF, filtering and clustering stages of the location algorithm so that the 
+# tree is only built once per frame.
+class SpatialIndex:
+    def __init__(self, points, k, eps):
+        self._points = points
+        self._num_points = points.shape[0]
+        self._k = k
+        self._eps = eps
+        self._nbrs = NearestNeighbors(n_neighbors=k+1, radius=eps).fit(points)
+        self._kneighbors = None
+        
+    # Returns the (distances, indices) of the k nearest neighbours of every point,
+    # in the format used by lofpy.getLOF. The query is only performed once.
+    def getKNeighbors(self):
+        if self._kneighbors is None:
+            self._kneighbors = self._nbrs.kneighbors(self._points, n_neighbors=self._k+1)
+        return self._kneighbors
+        
+    # Returns the sparse (m,m) graph of distances no greater than eps between the
+    # m points at the given indices, for use with metric='precomputed' in DBSCAN.
+    # Points which are not in the subset are masked out of the graph rather than 
+    # being placed in a new tree. A point is not stored as its own neighbour.
+    def getRadiusGraph(self, indices=None):
+        if indices is None:
+            indices = np.arange(self._num_points)
+        num_subset = len(indices)
+        
+        graph = self._nbrs.radius_neighbors_graph(self._points[indices,:], self._eps, mode='distance')
+        graph = graph.tocsc()[:,indices].tocoo()
+        
+        off_diagonal = graph.row != graph.col
+        return sparse.csr_matrix((graph.data[off_diagonal], 
+                                  (graph.row[off_diagonal], graph.col[off_diagonal])),
+                                  shape=(num_subset, num_subset))
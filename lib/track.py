@@ -1,110 +1,405 @@
 # Class define a 'track', which contains a location history for a single tracer.
-# All tracks for a given location set will have the same length, being equal to
-# the number of unique time steps. Where a location does not exist at a time t_i,
-# the location x_i is set to [nan, nan, nan] 
+# The histories of all tracks are held in a shared TrackSet, in which each track
+# only stores the time steps at which it has a location, so that the memory used
+# does not depend on the length of the experiment.
 import numpy as np
+from scipy.spatial import cKDTree
 
 class Track:
-    def __init__(self, track_length, start_index, times, initial_point=None):
+    def __init__(self, track_set, initial_point=None, time_index=0):
         self.MAX_SKIPS = 5          # The maximum number of consecutive skips before a track is terminated
         self.MIN_ENTRIES = 100      # The minimum number of entries needed for the track to be saved
         self.MIN_DENSITY = 0.5      # The minimum track density needed for the track to be saved
         self.EXTRAP_LEN = 15        # Number of entries used for extrapolation. Must be more than MAX_SKIPS
-        self.QUAD_SIZE = 10          # Number of entries needed to use a quadratic extrapolation (less than EXTRAP_LEN)      
-        
-        self.START_INDEX = start_index # Location at which the actual entries start
-        
+        self.QUAD_SIZE = 10          # Number of entries needed to use a quadratic extrapolation (less than EXTRAP_LEN)
+
         self.search_radius = 20
-        
+
         self.n_skips = 0            # Number of consecutive skips
-        self.length = track_length  # Total length of the track. Equal for all tracks.
-        if initial_point is None:   # Empty initialization
-            self.x_0 = np.array([np.nan, np.nan, np.nan])
-            self.num_entries = 0
-        else:
-            self.x_0 = initial_point[0:3]
-            self.num_entries = 1
-            
-        self.location_history = np.empty((self.length,3),float) 
-        self.location_history.fill(np.nan)   # History is initialized to a matrix of NaN's  
-        self.velocity_history = np.empty((self.length,3),float)
-        self.velocity_history.fill(np.nan)   # Corresponding velocity history for track
-        
-        self.time_history = times
-        
-        self.pointer = start_index  # Index to the most recent entry
-        
-        self.location_history[self.pointer,:] = self.x_0
-      
+        self.track_set = track_set
+        self.track_id = track_set.addTracks(1)[0]
+        self.time_index = time_index    # Index of the next time step
+        if initial_point is not None:
+            self.appendLocation(initial_point)
+
     # Adds an entry to the end of the track history.
     # new_location is a numpy array with format [x,y,z,t]
     def appendLocation(self, new_location):
-        self.pointer = self.pointer + 1
-        self.num_entries = self.num_entries + 1
         self.n_skips = 0
-        
-        self.location_history[self.pointer,:] = new_location
-        
-        self._updateVelocity()
+        self.track_set.append(np.array([self.track_id]), new_location[np.newaxis,0:3],
+                              new_location[3:4], np.array([self.time_index]))
+        self.time_index = self.time_index + 1
         return None
-    
+
     # Used when no new location is found for the new time step.
     def appendNone(self, new_time):
-        self.pointer = self.pointer + 1
         self.n_skips = self.n_skips + 1
-        self.num_entries = self.num_entries + 1
+        self.time_index = self.time_index + 1
         return None
-      
+
+    # Returns the number of locations in the track
+    def getNumEntries(self):
+        return self.track_set.getLengths(np.array([self.track_id]))[0]
+
     # Returns the theoretical next position based on the most recent locations.
     # t_ext is the time for which the extrapolated position is calculated.
     def getExtrapolatedPosition(self, t_ext):
-        end_extrap = self.pointer + 1
-        if self.num_entries <= self.EXTRAP_LEN:
-            start_extrap = self.START_INDEX
-        else:
-            start_extrap = end_extrap - self.EXTRAP_LEN
-            
         # The most recent EXTRAP_LEN entries are used as data points for the extrapolation
         # (except in the case when there are fewer than EXTRAP_LEN entries total).
-        # Once these entries are extracted, the ones that are actually used are those that 
-        # do not have NaN values.
-        extrap_set = self.location_history[start_extrap:end_extrap,:]
-        extrap_times = self.time_history[start_extrap:end_extrap]
-        
-        extrap_indices = ~np.isnan(extrap_set).any(axis=1)
-        
-        extrap_set = extrap_set[extrap_indices]
-        extrap_times = extrap_times[extrap_indices]
-        
-        # If the number of entries used in extrapolation is found to be less than EXTRAP_LEN,
-        # a linear extrapolation method is used. If it is equal to or greater than QUAD_SIZE, 
-        # a quadratic method is used.
-        num_extrap_entries = extrap_set.shape[0]
-        if num_extrap_entries < self.QUAD_SIZE:
-            extrap_degree = 1
-        else:
-            extrap_degree = 2
-        
-        extrapolated = np.zeros(1,3)
-        # For each of x,y & z vs t, fit a polynomial P_i to the data set and find P_i(t_ext)
-        for i in range(0,3):
-            xi_fit = np.polyfit(extrap_times, extrap_set[:,i], extrap_degree)
-            xi_poly = np.poly1d(xi_fit)
-            extrapolated[i] = xi_poly(t_ext)
-        
-        return extrapolated
-    
+        extrap_times, extrap_set = self.track_set.getRecent(np.array([self.track_id]), self.EXTRAP_LEN)
+        extrapolated = extrapolate(extrap_times, extrap_set, np.array([t_ext]), self.QUAD_SIZE)
+        return extrapolated[0]
+
+    # Returns the (N,8) array of [track,x,y,z,t,vx,vy,vz] entries of the track
+    def getHistory(self):
+        return self.track_set.export(np.array([self.track_id]))
+
     def getSearchRadius(self):
         #! Search radius should be defined in getExtrapolatedPosition, and should be a function
-        #! of number of entries used for fitting and the RMSE of the fit. 
+        #! of number of entries used for fitting and the RMSE of the fit.
         return self.search_radius
-    
-    # Private method to update the history (positions, velocities etc.)
-    def _updateVelocity(self):
-        
-        return None
-        
-    
-            
-        
 
+# Stores the entries of many tracks in shared arrays of time index, location,
+# time and velocity. Each track has a block of the arrays, found from its offset,
+# in which its entries are kept in order. When a block is full it is moved to the
+# end of the arrays with twice the capacity, and the arrays are compacted once
+# more than half of them is unused, so that appending is amortized O(1) and the
+# memory used is proportional to the number of entries stored. Tracks are
+# identified by the ids returned by addTracks, and the methods take arrays of
+# ids so that many tracks are updated at once.
+class TrackSet:
+    def __init__(self, block_capacity=8, initial_capacity=1024):
+        self._block_capacity = block_capacity   # initial capacity of each track
+        self._num_tracks = 0
+        self._offsets = np.zeros(initial_capacity, int)
+        self._lengths = np.zeros(initial_capacity, int)
+        self._capacities = np.zeros(initial_capacity, int)
+        self._live = np.zeros(initial_capacity, bool)
+
+        self._time_indices = np.zeros(initial_capacity, int)
+        self._locations = np.zeros((initial_capacity,3))
+        self._times = np.zeros(initial_capacity)
+        self._velocities = np.zeros((initial_capacity,3))
+        self._used = 0              # end of the last block allocated
+        self._num_free = 0          # entries in blocks which have been moved or removed
+
+    # Adds num_tracks empty tracks, returning their ids
+    def addTracks(self, num_tracks):
+        ids = np.arange(self._num_tracks, self._num_tracks + num_tracks)
+        if ids.shape[0] > 0 and ids[-1] >= self._offsets.shape[0]:
+            capacity = max(2 * self._offsets.shape[0], ids[-1] + 1)
+            self._offsets = _resize(self._offsets, capacity)
+            self._lengths = _resize(self._lengths, capacity)
+            self._capacities = _resize(self._capacities, capacity)
+            self._live = _resize(self._live, capacity)
+        self._num_tracks += num_tracks
+        self._live[ids] = True
+        self._allocate(ids, np.repeat(self._block_capacity, num_tracks))
+        return ids
+
+    # Appends one entry to each of the tracks with the given (n,) ids, which must
+    # be distinct. locations is (n,3), and times and time_indices are (n,). The
+    # velocity of each entry is found from the previous entry of its track.
+    def append(self, ids, locations, times, time_indices):
+        full = self._lengths[ids] == self._capacities[ids]
+        if np.any(full):
+            self._allocate(ids[full], 2 * self._capacities[ids[full]])
+
+        positions = self._offsets[ids] + self._lengths[ids]
+        self._time_indices[positions] = time_indices
+        self._locations[positions,:] = locations
+        self._times[positions] = times
+
+        velocities = np.empty((len(ids),3))
+        velocities.fill(np.nan)
+        previous = self._lengths[ids] > 0
+        previous_positions = positions[previous] - 1
+        dt = self._times[positions[previous]] - self._times[previous_positions]
+        velocities[previous,:] = (self._locations[positions[previous],:] -
+                                  self._locations[previous_positions,:]) / dt[:,np.newaxis]
+        self._velocities[positions,:] = velocities
+        self._lengths[ids] += 1
+
+    # Returns the number of entries of each track
+    def getLengths(self, ids):
+        return self._lengths[ids]
+
+    # Returns the time indices of the first and last entries of each track, which
+    # must not be empty
+    def getTimeIndexRange(self, ids):
+        first = self._time_indices[self._offsets[ids]]
+        last = self._time_indices[self._offsets[ids] + self._lengths[ids] - 1]
+        return first, last
+
+    # Returns the (A,num) times and (A,num,3) locations of the last num entries
+    # of each of the A tracks, in order. Tracks with fewer entries are padded at
+    # the start with NaN locations, in the format used by extrapolate.
+    def getRecent(self, ids, num):
+        lengths = self._lengths[ids]
+        columns = np.arange(num)
+        valid = columns[np.newaxis,:] >= (num - lengths)[:,np.newaxis]
+        positions = (self._offsets[ids] + lengths - num)[:,np.newaxis] + columns
+        positions = np.where(valid, positions, 0)
+        times = np.where(valid, self._times[positions], 0.0)
+        locations = np.where(valid[:,:,np.newaxis], self._locations[positions], np.nan)
+        return times, locations
+
+    # Returns the (N,8) array of [track,x,y,z,t,vx,vy,vz] entries of the tracks,
+    # ordered by track (in the order given) then time
+    def export(self, ids):
+        lengths = self._lengths[ids]
+        positions = _getBlockIndices(self._offsets[ids], lengths)
+        return np.column_stack((np.repeat(ids, lengths), self._locations[positions],
+                                self._times[positions], self._velocities[positions]))
+
+    # Removes the tracks, freeing their entries
+    def remove(self, ids):
+        self._num_free += np.sum(self._capacities[ids])
+        self._live[ids] = False
+        self._lengths[ids] = 0
+        self._capacities[ids] = 0
+
+    # Gives each track a new block of the given capacity at the end of the arrays,
+    # to which its entries are moved
+    def _allocate(self, ids, capacities):
+        if len(ids) == 0:
+            return
+        if self._num_free > self._used // 2:
+            self._compact()
+        required = self._used + np.sum(capacities)
+        if required > self._times.shape[0]:
+            capacity = max(2 * self._times.shape[0], required)
+            self._time_indices = _resize(self._time_indices, capacity)
+            self._locations = _resize(self._locations, capacity)
+            self._times = _resize(self._times, capacity)
+            self._velocities = _resize(self._velocities, capacity)
+
+        offsets = self._used + np.concatenate(([0], np.cumsum(capacities)[:-1]))
+        self._moveEntries(ids, offsets)
+        self._num_free += np.sum(self._capacities[ids])
+        self._offsets[ids] = offsets
+        self._capacities[ids] = capacities
+        self._used = required
+
+    # Packs the blocks of the live tracks at the start of the arrays
+    def _compact(self):
+        ids = np.flatnonzero(self._live[0:self._num_tracks])
+        capacities = self._capacities[ids]
+        offsets = np.concatenate(([0], np.cumsum(capacities)[:-1]))
+        # blocks that were reallocated lie after blocks of later ids, so the new
+        # ranges may overlap the old ranges of other blocks. This is safe only
+        # because _moveEntries gathers every source entry (the fancy-indexed
+        # right hand side is a copy) before it writes any destination
+        self._moveEntries(ids, offsets)
+        self._offsets[ids] = offsets
+        self._used = np.sum(capacities)
+        self._num_free = 0
+
+    def _moveEntries(self, ids, offsets):
+        lengths = self._lengths[ids]
+        source = _getBlockIndices(self._offsets[ids], lengths)
+        destination = _getBlockIndices(offsets, lengths)
+        for values in (self._time_indices, self._locations, self._times, self._velocities):
+            values[destination] = values[source]
+
+# Returns the indices of the blocks of the given starts and lengths, concatenated
+def _getBlockIndices(starts, lengths):
+    if len(lengths) == 0:
+        return np.zeros(0, int)
+    block_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.repeat(starts - block_starts, lengths) + np.arange(np.sum(lengths))
+
+# Returns a copy of the array with its first dimension resized to capacity
+def _resize(values, capacity):
+    resized = np.zeros((capacity,) + values.shape[1:], values.dtype)
+    resized[0:values.shape[0]] = values
+    return resized
+
+# Extrapolates every track at once. times is an (A,L) array of the times of the
+# last L entries of A tracks, positions is the (A,L,3) array of their locations
+# (NaN where a track has no entry), and t_ext the (A,) times for which the
+# positions are found. A polynomial is fitted to each track by least squares:
+# quadratic if it has at least quad_size entries, linear if it has at least two,
+# and constant otherwise. Returns the (A,3) extrapolated positions.
+def extrapolate(times, positions, t_ext, quad_size):
+    valid = ~np.isnan(positions).any(axis=2)
+    num_valid = np.sum(valid, axis=1)
+    degrees = np.where(num_valid >= quad_size, 2, np.where(num_valid >= 2, 1, 0))
+
+    # the polynomials are in the time relative to t_ext, so that the extrapolated
+    # position is the constant term
+    tau = np.where(valid, times - t_ext[:,np.newaxis], 0.0)
+    filled = np.where(valid[:,:,np.newaxis], positions, 0.0)
+    weights = valid.astype(float)
+
+    extrapolated = np.empty((positions.shape[0],3))
+    extrapolated.fill(np.nan)
+    for degree in range(3):
+        tracks = np.flatnonzero((degrees == degree) & (num_valid > 0))
+        if len(tracks) == 0:
+            continue
+        # normal equations (V^T W V) c = V^T W x for each track, with V the
+        # Vandermonde matrix of its times and W its valid entries
+        V = tau[tracks,:,np.newaxis] ** np.arange(degree + 1)
+        VW = V * weights[tracks,:,np.newaxis]
+        normal = np.einsum('ali,alj->aij', VW, V)
+        rhs = np.einsum('ali,alk->aik', VW, filled[tracks])
+        coefficients = np.linalg.solve(normal, rhs)
+        extrapolated[tracks,:] = coefficients[:,0,:]
+    return extrapolated
+
+# Links the locations of every tracer into tracks, one time step at a time.
+# The entries of the tracks are held in a TrackSet, and the ids of the active
+# tracks in an array, so that at each step they are all extrapolated to the new
+# time at once, and matched to the new locations using a KD-tree. Each location
+# is given to at most one track, the closest pairs being matched first, and only
+# if it is within the track's search radius. The radius grows with the number
+# of consecutive steps the track has been skipped, as the extrapolation is then
+# over a longer time. A track is terminated once it has been skipped for more
+# than max_skips steps, and is kept only if it has at least min_entries
+# locations and a density (the fraction of the steps from its first to its last
+# location at which it has a location) of at least min_density. Locations which
+# are not matched start new tracks.
+class TrackLinker:
+    def __init__(self, search_radius=20.0, max_skips=5, min_entries=100, min_density=0.5,
+                 extrap_len=15, quad_size=10, num_candidates=4):
+        self._search_radius = search_radius
+        self._max_skips = max_skips
+        self._min_entries = min_entries
+        self._min_density = min_density
+        self._extrap_len = extrap_len
+        self._quad_size = quad_size
+        self._num_candidates = num_candidates   # nearest locations considered for each track
+
+        self._step = 0              # index of the next time step
+        self._num_kept = 0
+        self._track_set = TrackSet()
+        self._ids = np.zeros(0, int)            # ids of the active tracks
+        self._skips = np.zeros(0, int)          # consecutive skips of each active track
+        self._kept_ids = []         # ids of the tracks kept since the last getTracks
+
+    # Adds the (n,3) locations found at the given time, which must be later than
+    # that of the previous step
+    def addLocations(self, time, locations):
+        locations = np.asarray(locations, float).reshape(-1,3)
+        num_tracks = len(self._ids)
+
+        track_indices, location_indices = self._match(time, locations)
+        matched = np.zeros(num_tracks, bool)
+        matched[track_indices] = True
+        self._skips[matched] = 0
+        self._skips[~matched] += 1
+
+        # locations which were not matched start new tracks
+        unmatched = np.ones(locations.shape[0], bool)
+        unmatched[location_indices] = False
+        new_ids = self._track_set.addTracks(np.sum(unmatched))
+        self._ids = np.concatenate((self._ids, new_ids))
+        self._skips = np.concatenate((self._skips, np.zeros(len(new_ids), int)))
+
+        entry_ids = np.concatenate((self._ids[track_indices], new_ids))
+        entry_locations = np.concatenate((locations[location_indices], locations[unmatched]))
+        self._track_set.append(entry_ids, entry_locations, np.repeat(float(time), len(entry_ids)),
+                               np.repeat(self._step, len(entry_ids)))
+
+        self._step += 1
+        self._terminate(self._skips > self._max_skips)
+
+    # Skips num_steps time steps at which no locations were found, e.g. frames in
+    # which no tracer was located, ageing the active tracks as if each had been
+    # added with no locations
+    def skip(self, num_steps):
+        if num_steps <= 0:
+            return
+        self._skips += num_steps
+        self._step += num_steps
+        self._terminate(self._skips > self._max_skips)
+
+    # Terminates all active tracks, e.g. at the end of the data
+    def finish(self):
+        self._terminate(np.ones(len(self._ids), bool))
+
+    # Returns the (N,8) array of [track,x,y,z,t,vx,vy,vz] entries of the tracks
+    # which have been kept since the last call, ordered by track then time. The
+    # velocity of the first entry of each track is NaN. Tracks are numbered from
+    # 0 in the order in which they are terminated. The entries of the active
+    # tracks are held until they are terminated.
+    def getTracks(self):
+        kept_ids = np.array(self._kept_ids, int)
+        tracks = self._track_set.export(kept_ids)
+        first_number = self._num_kept - len(kept_ids)
+        tracks[:,0] = np.repeat(np.arange(first_number, self._num_kept),
+                                self._track_set.getLengths(kept_ids))
+        self._track_set.remove(kept_ids)
+        self._kept_ids = []
+        return tracks
+
+    # Returns the number of tracks which are active
+    def getNumActive(self):
+        return len(self._ids)
+
+    # Returns the number of tracks kept so far
+    def getNumKept(self):
+        return self._num_kept
+
+    # Returns the (track, location) indices of the matched pairs
+    def _match(self, time, locations):
+        num_tracks = len(self._ids)
+        if num_tracks == 0 or locations.shape[0] == 0:
+            return np.zeros(0, int), np.zeros(0, int)
+
+        recent_times, recent_locations = self._track_set.getRecent(self._ids, self._extrap_len)
+        extrapolated = extrapolate(recent_times, recent_locations,
+                                   np.repeat(float(time), num_tracks), self._quad_size)
+        radii = self._search_radius * (1 + self._skips)
+
+        num_candidates = min(self._num_candidates, locations.shape[0])
+        distances, candidates = cKDTree(locations).query(extrapolated, k=num_candidates,
+                                                         distance_upper_bound=np.max(radii))
+        distances = distances.reshape(num_tracks, num_candidates)
+        candidates = candidates.reshape(num_tracks, num_candidates)
+        within = distances <= radii[:,np.newaxis]
+        pair_tracks = np.nonzero(within)[0]
+        pair_locations = candidates[within]
+        order = np.argsort(distances[within], kind='mergesort')
+        pair_tracks = pair_tracks[order]
+        pair_locations = pair_locations[order]
+
+        # the closest pair of each track and location is accepted, and the other
+        # pairs of the tracks and locations accepted removed, until none remain
+        track_indices = []
+        location_indices = []
+        while len(pair_tracks) > 0:
+            _, first = np.unique(pair_tracks, return_index=True)
+            first = np.sort(first)
+            _, unique_locations = np.unique(pair_locations[first], return_index=True)
+            accepted = first[unique_locations]
+            track_indices.append(pair_tracks[accepted])
+            location_indices.append(pair_locations[accepted])
+            remaining = ~np.in1d(pair_tracks, pair_tracks[accepted]) & \
+                        ~np.in1d(pair_locations, pair_locations[accepted])
+            pair_tracks = pair_tracks[remaining]
+            pair_locations = pair_locations[remaining]
+
+        if len(track_indices) == 0:
+            return np.zeros(0, int), np.zeros(0, int)
+        return np.concatenate(track_indices), np.concatenate(location_indices)
+
+    # Removes the active tracks selected by the boolean array. The entries of the
+    # tracks kept are held until getTracks is called, and those of the others
+    # are freed.
+    def _terminate(self, terminated):
+        if not np.any(terminated):
+            return
+        ids = self._ids[terminated]
+        num_entries = self._track_set.getLengths(ids)
+        first, last = self._track_set.getTimeIndexRange(ids)
+        keep = (num_entries >= self._min_entries) & \
+               (num_entries >= self._min_density * (last - first + 1))
+        self._kept_ids.extend(ids[keep])
+        self._num_kept += np.sum(keep)
+        self._track_set.remove(ids[~keep])
+
+        active = ~terminated
+        self._ids = self._ids[active]
+        self._skips = self._skips[active]
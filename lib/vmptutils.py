@@ -1,10 +1,16 @@
 import numpy as np
+import os
 import os.path
+import json
+import itertools
+import threading
     
+# Returns the indices of the entries in data which are no larger than the 
+# value found at the given fraction of the sorted data
 def getLowFraction(data, fraction):
-    sorted_data = list(data)
-    sorted_data.sort()
-    largest_valid = sorted_data[int(len(data) * fraction)]
+    data = np.asarray(data)
+    cutoff = int(len(data) * fraction)
+    largest_valid = np.partition(data, cutoff, axis=0)[cutoff]
     
     indices = np.argwhere(data <= largest_valid)
         
@@ -22,10 +28,212 @@ def writeOutputToFile(output_folder, location_output):
         np.savetxt(output_fname, stripped_location, delimiter=',')
     return None
     
+# Collects location output as it is produced and writes it to the output folder
+# whenever max_output entries have been stored, so that the memory used does not
+# depend on the number of frames. output_format is either 'csv', for comma 
+# separated text in locations.csv, or 'binary', for rows of four little-endian
+# float64 values [x,y,z,t] in locations.bin. Both are appended to if they exist,
+# after truncating the file to truncate_to bytes if given.
+# The locations of a frame are never split between two writes, so the file 
+# always holds the output of a whole number of frames.
+class OutputWriter:
+    def __init__(self, output_folder, max_output, output_format='csv', truncate_to=None):
+        if output_format == 'csv':
+            self._output_fname = output_folder + "/locations.csv"
+        elif output_format == 'binary':
+            self._output_fname = output_folder + "/locations.bin"
+        else:
+            raise ValueError('Unknown output format: ' + str(output_format))
+        self._output_format = output_format
+        self._buffer = np.zeros((max(int(max_output), 1),4))
+        self._num_stored = 0
+        self._num_written = 0
+        self._num_frames = 0            # frames appended
+        self._num_frames_written = 0    # frames whose locations are all on disk
+        self._f_handle = open(self._output_fname, 'ab')
+        if truncate_to is not None:
+            self._f_handle.truncate(truncate_to)
+        
+    # Adds the (n,4) array of locations of one frame to the output
+    def append(self, locations):
+        locations = locations[~np.all(locations == 0, axis=1)] # removes rows of zeros
+        num_locations = locations.shape[0]
+        if self._num_stored + num_locations > self._buffer.shape[0]:
+            self.flush()
+        if num_locations > self._buffer.shape[0]:
+            self._write(locations) # too many to store; written directly
+        else:
+            self._buffer[self._num_stored:self._num_stored + num_locations,:] = locations
+            self._num_stored += num_locations
+        self._num_frames += 1
+        
+        if self._num_stored == self._buffer.shape[0] or num_locations > self._buffer.shape[0]:
+            self.flush()
+        
+    # Writes all stored locations to disk
+    def flush(self):
+        if self._num_stored > 0:
+            self._write(self._buffer[0:self._num_stored,:])
+            self._num_stored = 0
+        self._f_handle.flush()
+        self._num_frames_written = self._num_frames
+        
+    # Returns the total number of locations written to disk
+    def getNumWritten(self):
+        return self._num_written
+    
+    # Returns the number of frames whose output has been written to disk
+    def getNumFramesWritten(self):
+        return self._num_frames_written
+    
+    # Returns the size of the output file, as of the last flush
+    def getOutputBytes(self):
+        return os.fstat(self._f_handle.fileno()).st_size
+        
+    def close(self):
+        self.flush()
+        self._f_handle.close()
+        
+    def _write(self, locations):
+        if self._output_format == 'csv':
+            np.savetxt(self._f_handle, locations, delimiter=',')
+        else:
+            self._f_handle.write(locations.astype('<f8').tobytes())
+        self._num_written += locations.shape[0]
+        
+# Generator yielding the [x,y,z,t] rows of a location output file, as written by
+# OutputWriter, in arrays of at most chunk_rows rows, so that files larger than 
+# memory can be read in one pass. The format is found from the file extension:
+# .bin for binary output, and csv otherwise.
+def readLocations(file_path, chunk_rows=100000):
+    if file_path.endswith('.bin'):
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = np.fromfile(f, '<f8', count=chunk_rows*4)
+                if chunk.shape[0] == 0:
+                    return
+                yield chunk.reshape(-1,4)
+    else:
+        with open(file_path, 'r') as f:
+            while True:
+                lines = list(itertools.islice(f, chunk_rows))
+                if len(lines) == 0:
+                    return
+                yield np.loadtxt(lines, delimiter=',', ndmin=2)
+        
+# Manifest of the progress of a run, kept in the output folder so that the run can
+# be resumed after it is stopped. Records the settings of the run, the number of 
+# frames of each input file whose output has been written, whether each file is
+# complete, and the size of the output file at that point.
+class Checkpoint:
+    def __init__(self, output_folder):
+        self._manifest_fname = os.path.join(output_folder, 'checkpoint.json')
+        self._manifest = {'settings':{}, 'files':{}, 'output_bytes':0}
+        
+    def exists(self):
+        return os.path.isfile(self._manifest_fname)
+        
+    def load(self):
+        with open(self._manifest_fname, 'r') as f:
+            self._manifest = json.load(f)
+            
+    # Starts a new manifest for a run with the given settings
+    def start(self, settings):
+        self._manifest = {'settings':settings, 'files':{}, 'output_bytes':0}
+        self._save()
+        
+    def getSettings(self):
+        return self._manifest['settings']
+        
+    def getFramesDone(self, file_path):
+        return self._manifest['files'].get(file_path, {}).get('frames_done', 0)
+        
+    def isComplete(self, file_path):
+        return self._manifest['files'].get(file_path, {}).get('complete', False)
+        
+    # Returns the size of the output file when the manifest was last committed
+    def getOutputBytes(self):
+        return self._manifest['output_bytes']
+    
+    # Records that the output of the first frames_done frames of the file has been
+    # written, and that the output file is output_bytes long
+    def commit(self, file_path, frames_done, output_bytes, complete=False):
+        self._manifest['files'][file_path] = {'frames_done':frames_done, 'complete':complete}
+        self._manifest['output_bytes'] = output_bytes
+        self._save()
+        
+    # the manifest is replaced in one step, so it is never left partially written
+    def _save(self):
+        temp_fname = self._manifest_fname + '.tmp'
+        with open(temp_fname, 'w') as f:
+            json.dump(self._manifest, f, indent=1)
+        os.rename(temp_fname, self._manifest_fname)
+    
 def printProgress(file_num, progress, average_tracers):
     print('-')
     print("File " + str(file_num + 1) + " progress: " + str(progress) + "%")
     print("Average number of tracers per frame: %.2f" % average_tracers)
-    
-    
 
+# Limits the number of items taken from an iterable which have not yet been
+# released, e.g. the frames passed to a Pool whose output has not been written.
+class Throttle:
+    def __init__(self, max_in_flight):
+        self._semaphore = threading.Semaphore(max_in_flight)
+        self._stopped = False
+        
+    # Generator which waits for a free slot before yielding each item. If given,
+    # on_wait is called each time there is no free slot and it has to wait.
+    # The slot is taken before the item, so no item is read while waiting.
+    def wrap(self, iterable, on_wait=None):
+        iterator = iter(iterable)
+        while True:
+            if not self._semaphore.acquire(False):
+                if on_wait is not None:
+                    on_wait()
+                self._semaphore.acquire()
+            if self._stopped:
+                return
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            yield item
+            
+    # Frees the slot of an item which has been processed
+    def release(self):
+        self._semaphore.release()
+        
+    # Ends the iteration, waking the generator if it is waiting
+    def stop(self):
+        self._stopped = True
+        self._semaphore.release()
+
+# Generator which groups the items of an iterable into lists of chunk_size items
+def getChunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+# Wraps a method so that it can be passed a chunk of inputs by a Pool, and 
+# returns the list of outputs. Used in place of the chunksize of Pool.imap,
+# which does not allow a timeout when waiting for the results.
+class ChunkTask:
+    def __init__(self, func):
+        self._func = func
+        
+    def __call__(self, chunk):
+        return [self._func(item) for item in chunk]
+
+# Generator over the results of Pool.imap which waits with a timeout, as
+# otherwise a KeyboardInterrupt is not received while waiting for a result
+def iterResults(results, timeout=1e6):
+    while True:
+        try:
+            yield results.next(timeout)
+        except StopIteration:
+            return
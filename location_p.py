@@ -1,16 +1,26 @@
 # built-in libraries
 import numpy as np
 import os
+import sys
 import glob
 import shutil
+import itertools
+import signal
 import multiprocessing
+import multiprocessing.pool
 import time
 from ConfigParser import SafeConfigParser
+from scipy.spatial.qhull import QhullError
 from sklearn.cluster import DBSCAN
 # custom classes
 from lib import dataset
+from lib import distributed
+from lib import fov
 from lib import frame
 from lib import lofpy
+from lib import lor
+from lib import profiling
+from lib import spatialindex
 from lib import vmptutils as vuti
 
 
@@ -18,31 +28,69 @@ from lib import vmptutils as vuti
 #     This is the method that is called by the Pool object, and
 #     which runs in parallel across the desired number of CPU cores.
 #     It takes one frame of data as a parameter and determines the locations 
-#     of the tracers within that frame
+#     of the tracers within that frame.
+#     If a profiling.StageTimer is given, the time taken by each stage and the
+#     number of points remaining after each stage are recorded in it.
 #==============================================================================
-def locate(frame_data_i):
+def locate(frame_data_i, timer=profiling.NULL_TIMER):
+    timer.reset()
+    all_points, all_vols, time_i = findPointsOfInterest(frame_data_i, EPS, timer)
+    return locatePoints(all_points, all_vols, time_i, EPS, K, LOF_FRAC, VOL_FRAC, timer)
+#end locate() method
+
+#==============================================================================
+#     The first, and most expensive, part of locate. Discretizes the LOR's of
+#     the frame with the given spacing (clipped to the field of view FOV, and
+#     adaptively if COARSE_FACTOR > 1) and finds the point of interest on each.
+#     If a focus is given (a fov.SpheresFOV), only the seed points inside it
+#     are used. If seed_points are given, the lines are not discretized again.
+#     No points are found if there are fewer than min_seed_points seed points.
+#     Returns the points, their Voronoi volumes (or density estimates) and the
+#     time of the frame.
+#==============================================================================
+def findPointsOfInterest(frame_data_i, spacing, timer=profiling.NULL_TIMER, focus=None, seed_points=None,
+                         min_seed_points=0):
     # Create a Frame object from the data
-    frame_i = frame.Frame(frame_data_i)
-    # Discretize LOR's and generate Voronoi tessellations to determine the 
-    #   smallest cell for each LOR.
-    poi = frame_i.getPointsOfInterest(EPS)
+    frame_i = frame.Frame(frame_data_i, FOV, focus, seed_points)
+    timer.mark('frame')
+    # Discretize LOR's and generate Voronoi tessellations (or density estimates)
+    #   to determine the smallest cell for each LOR.
+    poi = frame_i.getPointsOfInterest(spacing, POI_ENGINE, DENSITY_K, timer, COARSE_FACTOR, MIN_NEIGHBOURS,
+                                      SUBDOMAINS, SUBDOMAIN_OVERLAP, SUBDOMAIN_THREADS, min_seed_points)
     all_points = frame_i.getPointsAt(poi['ind'])
-    all_vols = poi['vol']
+    all_vols = np.array(poi['vol'])
     # Get the average time for the frame
     time_i = frame_i.getFrameTime()
-    del frame_i
+    return all_points, all_vols, time_i
+#end findPointsOfInterest() method
+
+#==============================================================================
+#     The second part of locate. Filters the points of interest of a frame and
+#     clusters the remaining points, returning the [x,y,z,t] of each cluster.
+#==============================================================================
+def locatePoints(all_points, all_vols, time_i, eps, k, lof_frac, vol_frac, timer=profiling.NULL_TIMER):
+    # Build a single spatial index over the points of interest, which is 
+    #   reused by each of the following stages
+    index = spatialindex.SpatialIndex(all_points, k, eps)
+    timer.mark('spatial_index')
     # Perform a Local Outlier Factor analysis on the points of interest
-    lof = lofpy.getLOF(K, all_points)
-    low_lof = vuti.getLowFraction(lof, LOF_FRAC)
-    lof_smoothed = all_points[low_lof,:]
-    lof_smoothed_vols = np.array(all_vols)[low_lof]
+    lof = lofpy.getLOF(k, all_points, index.getKNeighbors())
+    timer.mark('lof')
+    low_lof = vuti.getLowFraction(lof, lof_frac)
+    lof_smoothed_vols = all_vols[low_lof]
+    timer.count('after_lof_filter', len(low_lof))
     # Clean the data further by discarding the points with large Voronoi cells
-    low_vol = vuti.getLowFraction(lof_smoothed_vols, VOL_FRAC)
-    remainders = lof_smoothed[low_vol,:]
-    # Perform DBSCAN clustering
-    db = DBSCAN(eps=EPS, min_samples=K).fit(remainders)
+    low_vol = vuti.getLowFraction(lof_smoothed_vols, vol_frac)
+    remainder_inds = low_lof[low_vol]
+    remainders = all_points[remainder_inds,:]
+    timer.count('after_vol_filter', len(remainder_inds))
+    timer.mark('filters')
+    # Perform DBSCAN clustering on the neighbour graph of the remaining points
+    db = DBSCAN(eps=eps, min_samples=k, metric='precomputed').fit(index.getRadiusGraph(remainder_inds))
     labels = db.labels_
     n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+    timer.mark('dbscan')
+    timer.count('clusters', n_clusters)
     locations = np.zeros((n_clusters,4))
     # Calculate geometric mean of each cluster
     for cluster in range(0, n_clusters):
@@ -51,79 +99,382 @@ def locate(frame_data_i):
         locations[cluster,0:3] = location
         locations[cluster,3] = time_i
     #end if
+    timer.mark('centroids')
     return locations
-#end locate() method
+#end locatePoints() method
+
+#==============================================================================
+#     Used in place of locate in the warm start mode. previous is the array of
+#     locations found in the previous frame, or None. The frame is first
+#     searched only within WARM_RADIUS of the previous locations, and then
+#     fully if that does not give NUM_TRACERS locations. The 'warm_start' count
+#     is 1 for frames located by the first search.
+#==============================================================================
+def locateWarmStart(frame_data_i, previous, timer=profiling.NULL_TIMER, seed_points=None):
+    timer.reset()
+    if previous is not None:
+        focus = fov.SpheresFOV(previous[:,0:3], WARM_RADIUS)
+        # LOF needs more than K points of interest, so more than K seed points,
+        # and a tessellation needs at least 5. The seed points in the focus may
+        # also all lie in a plane, which cannot be tessellated
+        try:
+            all_points, all_vols, time_i = findPointsOfInterest(frame_data_i, EPS, timer, focus, seed_points,
+                                                                max(K + 1, 5))
+        except QhullError:
+            all_points = np.zeros((0,3))
+        #end try
+        if all_points.shape[0] > K:
+            locations = locatePoints(all_points, all_vols, time_i, EPS, K, LOF_FRAC, VOL_FRAC, timer)
+            if locations.shape[0] == NUM_TRACERS:
+                timer.count('warm_start', 1)
+                return locations
+            #end if
+        #end if
+    #end if
+    timer.count('warm_start', 0)
+    all_points, all_vols, time_i = findPointsOfInterest(frame_data_i, EPS, timer, seed_points=seed_points)
+    return locatePoints(all_points, all_vols, time_i, EPS, K, LOF_FRAC, VOL_FRAC, timer)
+#end locateWarmStart() method
+
+#==============================================================================
+#     Used in place of vuti.ChunkTask in the warm start mode. Locates a chunk
+#     of consecutive frames in order, each starting from the locations of the 
+#     previous frame. The first frame of each chunk is searched fully. Takes
+#     the frames, or their ranges in a binary cache. If profile is set, returns
+#     the (locations, record) of each frame, as profiling.Profiled does.
+#==============================================================================
+class WarmStartTask:
+    def __init__(self, profile=False):
+        self._profile = profile
+    
+    def __call__(self, chunk):
+        outputs = []
+        previous = None
+        for frame_source in chunk:
+            if isinstance(frame_source, tuple):
+                frame_source = getFrameData(frame_source)
+            #end if
+            timer = profiling.NULL_TIMER
+            if self._profile:
+                timer = profiling.StageTimer()
+            #end if
+            locations = locateWarmStart(frame_source, previous, timer)
+            previous = None
+            if locations.shape[0] == NUM_TRACERS:
+                previous = locations
+            #end if
+            if self._profile:
+                outputs.append((locations, timer.getRecord()))
+            else:
+                outputs.append(locations)
+            #end if
+        #end for frame_source
+        return outputs
+#end WarmStartTask class
+
+#==============================================================================
+#     Used in place of vuti.ChunkTask when frames overlap. Takes a chunk of
+#     consecutive frames, as their data or as their (cache_path, start, stop) 
+#     ranges in a binary cache, and discretizes the lines of all of the frames
+#     once, so that the lines shared by overlapping frames are not discretized
+#     again for each frame. The frames are then located in order (with the warm
+#     start if WARM_START is set). The adaptive discretization, which depends on
+#     the other lines of the frame, is done per frame.
+#     If profile is set, returns the (locations, record) of each frame.
+#==============================================================================
+class WindowTask:
+    def __init__(self, profile=False):
+        self._profile = profile
+    
+    def __call__(self, chunk):
+        span = None
+        if COARSE_FACTOR <= 1:
+            if isinstance(chunk[0], tuple):
+                cache_path = chunk[0][0]
+                span_start = min(frame_start for _, frame_start, _ in chunk)
+                span_end = max(frame_end for _, _, frame_end in chunk)
+                span_data = getFrameData((cache_path, span_start, span_end))
+                frame_ranges = [(frame_start - span_start, frame_end - span_start) \
+                                for _, frame_start, frame_end in chunk]
+            else:
+                span_data, frame_ranges = joinFrames(chunk)
+            #end if
+            span = lor.LineSpan(span_data, EPS, FOV)
+        #end if
+        
+        outputs = []
+        previous = None
+        for frame_num, frame_source in enumerate(chunk):
+            seed_points = None
+            if span is not None:
+                frame_start, frame_end = frame_ranges[frame_num]
+                frame_source = span_data[frame_start:frame_end,:]
+                seed_points = span.getSeedPoints(frame_start, frame_end)
+            elif isinstance(frame_source, tuple):
+                frame_source = getFrameData(frame_source)
+            #end if
+            timer = profiling.NULL_TIMER
+            if self._profile:
+                timer = profiling.StageTimer()
+            #end if
+            if WARM_START:
+                locations = locateWarmStart(frame_source, previous, timer, seed_points)
+            else:
+                timer.reset()
+                all_points, all_vols, time_i = findPointsOfInterest(frame_source, EPS, timer, 
+                                                                    seed_points=seed_points)
+                locations = locatePoints(all_points, all_vols, time_i, EPS, K, LOF_FRAC, VOL_FRAC, timer)
+            #end if
+            previous = None
+            if locations.shape[0] == NUM_TRACERS:
+                previous = locations
+            #end if
+            if self._profile:
+                outputs.append((locations, timer.getRecord()))
+            else:
+                outputs.append(locations)
+            #end if
+        #end for frame_num
+        return outputs
+#end WindowTask class
+
+#==============================================================================
+#     Returns the rows of a chunk of consecutive frames given as data, with the
+#     rows shared by overlapping frames once, and the (start, stop) rows of 
+#     each frame in them. Each frame starts at the first row of the previous 
+#     frame from which the rows of the two frames are the same, so the stride
+#     need not be known, and the last frame of a file, which is shifted back to
+#     end at the last row, is found too. Frames which share no rows with the 
+#     previous frame follow it.
+#==============================================================================
+def joinFrames(chunk):
+    blocks = [chunk[0]]
+    frame_ranges = [(0, chunk[0].shape[0])]
+    for previous, frame_data in zip(chunk[:-1], chunk[1:]):
+        offset = previous.shape[0]
+        for row in np.flatnonzero(np.all(previous == frame_data[0,:], axis=1)):
+            num_shared = previous.shape[0] - row
+            if num_shared <= frame_data.shape[0] and \
+               np.array_equal(previous[row:,:], frame_data[0:num_shared,:]):
+                offset = row
+                break
+            #end if
+        #end for row
+        frame_start = frame_ranges[-1][0] + offset
+        blocks.append(frame_data[previous.shape[0] - offset:,:])
+        frame_ranges.append((frame_start, frame_start + frame_data.shape[0]))
+    #end for frame_data
+    return np.concatenate(blocks), frame_ranges
+#end joinFrames() method
+
+#==============================================================================
+#     Returns the frame data for the (cache_path, start, stop) rows of one 
+#     frame in a binary cache. Each process maps the cache file once and
+#     reuses it for every frame.
+#==============================================================================
+_cache_data = {}
+def getFrameData(frame_range_i):
+    cache_path, frame_start, frame_end = frame_range_i
+    if cache_path not in _cache_data:
+        _cache_data.clear()
+        _cache_data[cache_path] = dataset.openCache(cache_path)
+    #end if
+    return _cache_data[cache_path][frame_start:frame_end,:]
+#end getFrameData() method
+
+#==============================================================================
+#     Used in place of locate when the data is read from a binary cache.
+#     Takes the path of the cache and the (start, stop) rows of one frame, 
+#     so that only the offsets are passed to the process rather than the data.
+#==============================================================================
+def locateRange(frame_range_i, timer=profiling.NULL_TIMER):
+    return locate(getFrameData(frame_range_i), timer)
+#end locateRange() method
 
 #==============================================================================
-#     Called when a thread is created.
+#     Prepares an input file for location. Run in a background thread, so that
+#     the next file is loaded (and its cache created) while the current one is 
+#     being located. Returns the iterable of inputs for the pool, and the
+#     method to which they are passed. Frames start stride lines apart, or
+#     frame_size lines apart if the stride is 0.
+#==============================================================================
+def loadFile(file_path, frame_size, use_cache, stride=0):
+    if use_cache:
+        # the cache is created on the first run, and mapped by each process
+        data_file = dataset.DataSet(file_path, frame_size, use_cache=True, stride=stride)
+        cache_path = data_file.getCachePath()
+        frames = [(cache_path, frame_start, frame_end) \
+                  for frame_start, frame_end in data_file.getFrameRanges()]
+        return frames, locateRange
+    else:
+        return dataset.FrameReader(file_path, frame_size, stride=stride), locate
+    #end if
+#end loadFile() method
+
+#==============================================================================
+#     Called when a thread is created. Interrupts are handled by the main
+#     process only, which stops the threads.
 #==============================================================================
 def start_process():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     print 'Starting ', multiprocessing.current_process().name
 #end start_process() method
 
+#==============================================================================
+#     Asks for the name of the folder to which the output will be written,
+#     and creates it (deleting it first if it exists and the user agrees).
+#     Returns the name of the folder.
+#==============================================================================
+def createOutputFolder():
+    folder_exists = 1
+    while folder_exists:
+        output_folder = raw_input('Enter the name of the folder to which the output will be written: ')
+        folder_exists = os.path.exists(output_folder)
+        if folder_exists:
+            delete_folder = raw_input("Folder exists, delete? (y/n) ")
+            if delete_folder == "y" or delete_folder == "Y":
+                shutil.rmtree(output_folder)
+                os.makedirs(output_folder)
+                folder_exists = 0
+        else:
+            os.makedirs(output_folder)
+        #end if
+    #end while folder_exists
+    return output_folder
+#end createOutputFolder() method
+
 #==============================================================================
 #     Main method.
 #     Initiates constants used in the process by loading the config.ini file.
 #     Asks for user input, namely for the folder containing the input files,
 #         the folder to which the output will be written, and the number
 #         of tracers used in the experiment.
-#     For each input file, the data is split into frames. The set of frames is
-#         passed to the Pool object to be used as parameters for the locate 
-#         method.
-#     After a file has been processed, the output is written to the output file.
+#     A single Pool object is used for all of the input files. The frames of
+#         each file are passed to the Pool in order, to be used as parameters
+#         for the locate method, while the next file is loaded in the background.
+#     The output is written to the output file whenever MAX_OUTPUT locations
+#         have been found, and the progress recorded in a checkpoint file in
+#         the output folder. Run with --resume to continue a stopped run.
+#     Run with --distributed to send the frames to worker processes started
+#         with worker_p.py, on this or other hosts, in place of the Pool.
 #==============================================================================
 if __name__ == "__main__":
     ## Constants used throughout the algorithm, imported from the config.ini file ##
     config = SafeConfigParser()
     config.read('lib/config.ini')
     
-    global EPS, K, LOF_FRAC, VOL_FRAC
+    global EPS, K, LOF_FRAC, VOL_FRAC, POI_ENGINE, DENSITY_K, FOV, COARSE_FACTOR, MIN_NEIGHBOURS
+    global SUBDOMAINS, SUBDOMAIN_OVERLAP, SUBDOMAIN_THREADS
+    global WARM_START, WARM_RADIUS, NUM_TRACERS
     LINES_PER_TRACER = config.getint('Frame','Lines_Per_Tracer') # number of LOR's used per tracer
+    STRIDE_PER_TRACER = config.getint('Frame','Stride_Per_Tracer') # LOR's per tracer between the starts of frames
+    POI_ENGINE = config.get('Frame','Poi_Engine')                # method used to find the points of interest
+    DENSITY_K = config.getint('Frame','Density_K')               # neighbours used by the density engine
+    FOV = fov.fromConfig(config)                                 # field of view the lines are clipped to, or None
+    COARSE_FACTOR = config.getint('Frame','Coarse_Factor')       # adaptive discretization, if greater than 1
+    MIN_NEIGHBOURS = config.getint('Frame','Min_Neighbours')
+    SUBDOMAINS = config.getint('Frame','Subdomains')             # domain decomposition, if greater than 1
+    SUBDOMAIN_OVERLAP = config.getfloat('Frame','Subdomain_Overlap')
+    SUBDOMAIN_THREADS = config.getint('Frame','Subdomain_Threads')
+    WARM_START = config.getboolean('Frame','Warm_Start')         # search each frame near the previous locations
+    WARM_RADIUS = config.getfloat('Frame','Warm_Radius')
     EPS = config.getfloat('Cluster','Eps')                       # search distance used in both LOF and DBSCAN. Also separation distance
     K   = config.getint('Cluster','K')                           # number of points used in LOF and DBSCAN
     MAX_OUTPUT = config.getint('LocationOutput','Max_Output')    # maximum number of entries in the output array before writing to disk
+    OUTPUT_FORMAT = config.get('LocationOutput','Output_Format') # format of the output file, csv or binary
     PERCENT_INC = config.getfloat('LocationOutput','Percent_Inc')# progress display increment
     LOF_FRAC = config.getfloat('Filter','Lof_Frac')
     VOL_FRAC = config.getfloat('Filter','Vol_Frac')
     NUM_CORES = config.getint('Processing','Num_Cores')
+    BATCH_FRAMES = config.getint('Processing','Batch_Frames')    # maximum number of frames read ahead of the output
+    CHUNK_SIZE = config.getint('Processing','Chunk_Size')        # number of frames sent to a process at a time
+    USE_CACHE = config.getboolean('Processing','Use_Cache')      # map data from binary caches of the input files
+    PROFILE = config.getboolean('Processing','Profile')          # record and print the time taken by each stage
+    HOST = config.get('Distributed','Host')                      # interface on which the coordinator listens for workers
+    PORT = config.getint('Distributed','Port')
+    AUTHKEY = config.get('Distributed','Authkey')
+    TASK_FRAMES = config.getint('Distributed','Task_Frames')     # number of frames sent to a worker at a time
+    TASKS_PER_WORKER = config.getint('Distributed','Tasks_Per_Worker')
+    HEARTBEAT_TIMEOUT = config.getfloat('Distributed','Heartbeat_Timeout')
     
     # if the number of cores to use is greater than the number
     # of physical cores (or -1) set to maximum
-    if NUM_CORES > multiprocessing.cpu_count:
+    if NUM_CORES > multiprocessing.cpu_count():
         print('Number of cores requested greater than physical count. Using maximum.')
-        NUM_CORES = multiprocessing.cpu_count
+        NUM_CORES = multiprocessing.cpu_count()
     #end if
     if NUM_CORES == -1:
         print('Using maximum number of cores.')
-        NUM_CORES = multiprocessing.cpu_count
+        NUM_CORES = multiprocessing.cpu_count()
+    #end if
+    # by default, each process is sent several chunks per batch to balance the load
+    if CHUNK_SIZE <= 0:
+        CHUNK_SIZE = max(1, BATCH_FRAMES // (4 * NUM_CORES))
     #end if
+    # a chunk cannot hold more frames than are allowed to be read ahead
+    CHUNK_SIZE = min(CHUNK_SIZE, BATCH_FRAMES)
     
-    # get user input
-    input_folder = raw_input('Enter the path of the folder containing the input files: ')
-    # create the ouput folder (delete first if it exists)
-    folder_exists = 1
-    while folder_exists:
-        output_folder = raw_input('Enter the name of the folder to which the output will be written: ')
-        folder_exists = os.path.exists(output_folder)
-        if folder_exists:
-            delete_folder = raw_input("Folder exists, delete? (y/n) ")
-            if delete_folder == "y" or delete_folder == "Y":
-                shutil.rmtree(output_folder)
-                os.makedirs(output_folder)
-                folder_exists = 0
-        else:
-            os.makedirs(output_folder)
+    # a stopped run is resumed from its checkpoint with the --resume option
+    RESUME = '--resume' in sys.argv[1:]
+    DISTRIBUTED = '--distributed' in sys.argv[1:]
+    if DISTRIBUTED:
+        # other hosts cannot map the binary caches, so the frame data is sent
+        USE_CACHE = False
+        # workers on other hosts must know a key which is not shipped with the code
+        if not AUTHKEY and not distributed.isLoopback(HOST):
+            print('Set an Authkey in the [Distributed] section of config.ini to accept workers on ' + HOST)
+            raise SystemExit
         #end if
-    #end while folder_exists
-                  
-    num_tracers = int(raw_input('Enter the number of tracers expected: '))
+    #end if
+    settings = {'lines_per_tracer':LINES_PER_TRACER, 'poi_engine':POI_ENGINE, 'eps':EPS, 'k':K,
+                'lof_frac':LOF_FRAC, 'vol_frac':VOL_FRAC, 'output_format':OUTPUT_FORMAT, 'fov':repr(FOV),
+                'coarse_factor':COARSE_FACTOR, 'min_neighbours':MIN_NEIGHBOURS, 'density_k':DENSITY_K,
+                'subdomains':SUBDOMAINS, 'subdomain_overlap':SUBDOMAIN_OVERLAP,
+                'warm_start':WARM_START, 'warm_radius':WARM_RADIUS, 'stride_per_tracer':STRIDE_PER_TRACER}
+    if RESUME:
+        output_folder = raw_input('Enter the name of the folder of the run to resume: ')
+        checkpoint = vuti.Checkpoint(output_folder)
+        if not checkpoint.exists():
+            print('No checkpoint found in ' + output_folder)
+            raise SystemExit
+        #end if
+        checkpoint.load()
+        input_folder = checkpoint.getSettings()['input_folder']
+        num_tracers = checkpoint.getSettings()['num_tracers']
+        # a checkpoint written by an older version may not record every setting
+        for name in sorted(settings):
+            resumed_value = checkpoint.getSettings().get(name)
+            if resumed_value != settings[name]:
+                print('The setting ' + name + ' in config.ini (' + str(settings[name]) \
+                      + ') differs from the run being resumed (' + str(resumed_value) + ').')
+                raise SystemExit
+            #end if
+        #end for name
+    else:
+        # get user input
+        input_folder = raw_input('Enter the path of the folder containing the input files: ')
+        output_folder = createOutputFolder()
+                      
+        num_tracers = int(raw_input('Enter the number of tracers expected: '))
+        
+        settings['input_folder'] = input_folder
+        settings['num_tracers'] = num_tracers
+        checkpoint = vuti.Checkpoint(output_folder)
+        checkpoint.start(settings)
+    #end if
     
-    print('Starting location using ' + str(NUM_CORES) + ' physical cores.')
+    if DISTRIBUTED:
+        print('Starting location using workers connecting to port ' + str(PORT) + '.')
+    else:
+        print('Starting location using ' + str(NUM_CORES) + ' physical cores.')
+    #end if
     
     # search the input folder for all files with the correct filetype (.dat)
     print('\n Searching for .dat files in ' + input_folder)
     search_path = os.path.join(input_folder,'*.dat')
-    input_files = glob.glob(search_path)
+    # files already completed in a resumed run are skipped
+    input_files = [file_path for file_path in sorted(glob.glob(search_path)) \
+                   if not checkpoint.isComplete(file_path)]
     
     # define which files to triangulate
     num_files = len(input_files)
@@ -135,32 +486,140 @@ if __name__ == "__main__":
         
     # calculate the size (number of lines) of each frame
     frame_size = LINES_PER_TRACER * num_tracers
+    NUM_TRACERS = num_tracers   # used by the warm start, in each process
+    # frames overlap if they start less than frame_size lines apart
+    stride = dataset.getStride(frame_size, STRIDE_PER_TRACER * num_tracers)
     
-    for file_num in range(start_file, end_file):
-        try:
+    if end_file <= start_file:
+        print('No input files to process.')
+        raise SystemExit
+    #end if
+    
+    pool = None
+    coordinator = None
+    if DISTRIBUTED:
+        # the workers are sent the settings needed by locate when they connect
+        worker_settings = {'eps':EPS, 'k':K, 'lof_frac':LOF_FRAC, 'vol_frac':VOL_FRAC,
+                           'poi_engine':POI_ENGINE, 'density_k':DENSITY_K, 'fov':FOV,
+                           'coarse_factor':COARSE_FACTOR, 'min_neighbours':MIN_NEIGHBOURS,
+                           'subdomains':SUBDOMAINS, 'subdomain_overlap':SUBDOMAIN_OVERLAP,
+                           'subdomain_threads':SUBDOMAIN_THREADS,
+                           'warm_start':WARM_START, 'warm_radius':WARM_RADIUS, 'num_tracers':num_tracers,
+                           'overlapping':stride < frame_size, 'profile':PROFILE}
+        coordinator = distributed.Coordinator((HOST, PORT), AUTHKEY, worker_settings, TASKS_PER_WORKER,
+                                              max(1, BATCH_FRAMES // TASK_FRAMES), HEARTBEAT_TIMEOUT)
+    else:
+        pool = multiprocessing.Pool(processes=NUM_CORES, initializer=start_process)
+    #end if
+    # when resuming, any output written after the last checkpoint is discarded
+    writer = vuti.OutputWriter(output_folder, MAX_OUTPUT, OUTPUT_FORMAT, checkpoint.getOutputBytes())
+    loader = multiprocessing.pool.ThreadPool(processes=1)
+    next_file = loader.apply_async(loadFile, (input_files[start_file], frame_size, USE_CACHE, stride))
+    throttle = None
+    current_file = None
+    run_profile = profiling.ProfileSummary()
+    run_start = time.time()
+    try:
+        for file_num in range(start_file, end_file):
             file_path = input_files[file_num]
             print('==================================================')
             print('Loading data from file ' + file_path)
-            data_file = dataset.DataSet(file_path, frame_size);
-            pool_inputs = data_file.split()
-            print('Data loaded')
-            pool = multiprocessing.Pool(processes=NUM_CORES, initializer=start_process)
+            frames, locate_func = next_file.get()
+            if PROFILE and not DISTRIBUTED:
+                locate_func = profiling.Profiled(locate_func)
+            #end if
+            file_profile = profiling.ProfileSummary()
+            if file_num + 1 < end_file:
+                next_file = loader.apply_async(loadFile, (input_files[file_num + 1], frame_size, USE_CACHE, stride))
+            #end if
+            
+            # frames whose output was written before a run was stopped are skipped
+            frames_done = checkpoint.getFramesDone(file_path)
+            if frames_done > 0:
+                print('Resuming from frame ' + str(frames_done))
+                frames = itertools.islice(frames, frames_done, None)
+            #end if
+            frames_at_start = writer.getNumFramesWritten()
+            frames_committed = frames_at_start
+            current_file = file_path
             
             start = time.time()
-            pool_output = pool.map(locate, pool_inputs)
-            pool.close()
-            pool.join()
+            num_frames = 0
+            # the number of frames read ahead of the output is limited, so that
+            # memory use does not depend on the size of the file
+            if DISTRIBUTED:
+                # the workers run locate with the settings sent by the coordinator
+                results = coordinator.imap(vuti.getChunks(frames, TASK_FRAMES))
+            else:
+                throttle = vuti.Throttle(BATCH_FRAMES)
+                chunks = vuti.getChunks(throttle.wrap(frames), CHUNK_SIZE)
+                if stride < frame_size:
+                    task = WindowTask(PROFILE)
+                elif WARM_START:
+                    task = WarmStartTask(PROFILE)
+                else:
+                    task = vuti.ChunkTask(locate_func)
+                #end if
+                results = vuti.iterResults(pool.imap(task, chunks))
+            #end if
+            for locations in itertools.chain.from_iterable(results):
+                if throttle is not None:
+                    throttle.release()
+                #end if
+                if PROFILE:
+                    locations, record = locations
+                    file_profile.add(record)
+                    run_profile.add(record)
+                #end if
+                writer.append(locations)
+                num_frames += 1
+                # the checkpoint is updated whenever the output is written to disk
+                if writer.getNumFramesWritten() > frames_committed:
+                    frames_committed = writer.getNumFramesWritten()
+                    checkpoint.commit(file_path, frames_done + frames_committed - frames_at_start,
+                                      writer.getOutputBytes())
+                #end if
+            #end for locations
+            writer.flush()
+            checkpoint.commit(file_path, frames_done + num_frames, writer.getOutputBytes(), complete=True)
             end = time.time()
             
-            print('Finished processing ' + str(data_file.getNumFrames()) + ' frames of file: ' \
+            print('Finished processing ' + str(num_frames) + ' frames of file: ' \
                    + file_path + ' in ' + str(end-start) + 's')
-            vuti.writeOutputToFile(output_folder, np.vstack(np.array(pool_output)))
-        except KeyboardInterrupt, SystemExit:
+            if PROFILE:
+                file_profile.printSummary(file_path, end-start)
+            #end if
+        #end for file_num
+        if DISTRIBUTED:
+            coordinator.close()
+        else:
             pool.close()
             pool.join()
-            print('\n Operation cancelled, writing data to file...')
-            vuti.writeOutputToFile(output_folder, np.vstack(np.array(pool_output)))
-            raise
-        #end try
-    #end for file_num
+        #end if
+        if PROFILE:
+            run_profile.printSummary('all files', time.time() - run_start)
+        #end if
+    except (KeyboardInterrupt, SystemExit):
+        if throttle is not None:
+            throttle.stop()
+        #end if
+        if DISTRIBUTED:
+            coordinator.close()
+        else:
+            pool.terminate()
+            pool.join()
+        #end if
+        print('\n Operation cancelled, writing data to file...')
+        # the output of every frame received is written, and the checkpoint 
+        # updated so that the run can be continued with --resume
+        if current_file is not None and not checkpoint.isComplete(current_file):
+            writer.flush()
+            checkpoint.commit(current_file, frames_done + writer.getNumFramesWritten() - frames_at_start,
+                              writer.getOutputBytes())
+        #end if
+        raise
+    finally:
+        writer.close()
+        loader.terminate()
+    #end try
 #end main
\ No newline at end of file
@@ -0,0 +1,243 @@
+# built-in libraries
+import os
+import sys
+import socket
+import collections
+import multiprocessing
+import threading
+import time
+from ConfigParser import SafeConfigParser
+# custom classes
+import location_p
+from lib import dataset
+from lib import fov
+from lib import profiling
+from lib import vmptutils as vuti
+
+
+#==============================================================================
+#     Streaming mode. Locates the tracers in a live feed of LOR's, rather than
+#     in complete .dat files, so that an experiment can be watched while it
+#     runs. Frames of Lines_Per_Tracer * num_tracers lines are formed as the
+#     lines arrive and located by a Pool, and the locations are written in
+#     frame order to the output folder at least every Flush_Interval seconds.
+#     At most Backlog_Frames frames are located ahead of the output. The
+#     stream is read in a thread, which holds at most Backlog_Frames frames
+#     of lines ahead of those, so that the latency of each frame is measured
+#     from when its last line was received. When the processing falls
+#     further behind, the stream is not read, so the lines are held in the
+#     pipe or socket and the writer is held back; the time the lines wait
+#     there is not included in the latency.
+#     Each frame is located as soon as it is formed, so when frames overlap
+#     (Stride_Per_Tracer < Lines_Per_Tracer) the shared lines are discretized
+#     for each frame, unlike in location_p.py, which discretizes a chunk of
+#     frames at once; waiting for a chunk would add to the latency.
+#     Usage: python stream_p.py SOURCE OUTPUT_FOLDER NUM_TRACERS
+#     SOURCE is one of:
+#         -                standard input, e.g. piped from the acquisition
+#         unix:PATH        a Unix socket, to which this connects
+#         tcp:HOST:PORT    a TCP socket, to which this connects
+#         PATH             a FIFO (or file)
+#     Benchmarking/replay_lors.py replays a .dat file at a given rate, as a
+#     source for testing.
+#==============================================================================
+
+#==============================================================================
+#     Opens the source of the stream, returning an object with a fileno
+#==============================================================================
+def openStream(source):
+    if source == '-':
+        return sys.stdin
+    elif source.startswith('unix:'):
+        stream = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stream.connect(source[len('unix:'):])
+        return stream
+    elif source.startswith('tcp:'):
+        host, port = source[len('tcp:'):].rsplit(':', 1)
+        return socket.create_connection((host, int(port)))
+    else:
+        # opening a FIFO waits until the writer has opened it
+        return open(source, 'rb')
+    #end if
+#end openStream() method
+
+#==============================================================================
+#     Reads the blocks of lines of the stream in a thread as they arrive, and
+#     records the time at which each was received. At most max_rows rows are
+#     held, after which the thread waits and the lines are left in the pipe
+#     or socket. Iterating gives the blocks in order, and getReceiptTime the
+#     time at which the last block given was received.
+#==============================================================================
+class TimedReader:
+    def __init__(self, stream, max_rows):
+        self._max_rows = max_rows
+        self._blocks = collections.deque()      # of (receipt time, block)
+        self._num_rows = 0
+        self._done = False
+        self._error = None
+        self._receipt_time = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._read, args=(stream,))
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def __iter__(self):
+        while True:
+            with self._condition:
+                # waits with a timeout, so that the main thread can be interrupted
+                while len(self._blocks) == 0 and not self._done:
+                    self._condition.wait(1.0)
+                #end while
+                if len(self._blocks) == 0:
+                    break
+                #end if
+                self._receipt_time, block = self._blocks.popleft()
+                self._num_rows -= block.shape[0]
+                self._condition.notify()
+            #end with
+            yield block
+        #end while
+        if self._error is not None:
+            raise self._error
+        #end if
+    
+    def getReceiptTime(self):
+        return self._receipt_time
+    
+    def _read(self, stream):
+        try:
+            for block in dataset.readStreamBlocks(stream):
+                receipt_time = time.time()
+                with self._condition:
+                    while self._num_rows >= self._max_rows:
+                        self._condition.wait()
+                    #end while
+                    self._blocks.append((receipt_time, block))
+                    self._num_rows += block.shape[0]
+                    self._condition.notify()
+                #end with
+            #end for block
+        except Exception as error:
+            self._error = error
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify()
+            #end with
+        #end try
+#end TimedReader class
+
+#==============================================================================
+#     Generator which records the time at which each frame is complete, i.e.
+#     when the block holding its last line was received by the reader, before
+#     passing it on
+#==============================================================================
+def timeFrames(frames, reader, arrival_times):
+    for frame_data in frames:
+        arrival_times.append(reader.getReceiptTime())
+        yield frame_data
+    #end for frame_data
+#end timeFrames() method
+
+#==============================================================================
+#     Main method.
+#==============================================================================
+if __name__ == "__main__":
+    ## Constants used throughout the algorithm, imported from the config.ini file ##
+    config = SafeConfigParser()
+    config.read('lib/config.ini')
+
+    LINES_PER_TRACER = config.getint('Frame','Lines_Per_Tracer') # number of LOR's used per tracer
+    STRIDE_PER_TRACER = config.getint('Frame','Stride_Per_Tracer') # LOR's per tracer between the starts of frames
+    MAX_OUTPUT = config.getint('LocationOutput','Max_Output')    # maximum number of entries in the output array before writing to disk
+    OUTPUT_FORMAT = config.get('LocationOutput','Output_Format') # format of the output file, csv or binary
+    NUM_CORES = config.getint('Processing','Num_Cores')
+    BACKLOG_FRAMES = config.getint('Stream','Backlog_Frames')    # maximum number of frames read ahead of the output
+    FLUSH_INTERVAL = config.getfloat('Stream','Flush_Interval')  # maximum time before output is written to disk
+    REPORT_INTERVAL = config.getfloat('Stream','Report_Interval')
+    location_p.POI_ENGINE = config.get('Frame','Poi_Engine')
+    location_p.DENSITY_K = config.getint('Frame','Density_K')
+    location_p.FOV = fov.fromConfig(config)
+    location_p.COARSE_FACTOR = config.getint('Frame','Coarse_Factor')
+    location_p.MIN_NEIGHBOURS = config.getint('Frame','Min_Neighbours')
+    location_p.SUBDOMAINS = config.getint('Frame','Subdomains')
+    location_p.SUBDOMAIN_OVERLAP = config.getfloat('Frame','Subdomain_Overlap')
+    location_p.SUBDOMAIN_THREADS = config.getint('Frame','Subdomain_Threads')
+    location_p.EPS = config.getfloat('Cluster','Eps')
+    location_p.K = config.getint('Cluster','K')
+    location_p.LOF_FRAC = config.getfloat('Filter','Lof_Frac')
+    location_p.VOL_FRAC = config.getfloat('Filter','Vol_Frac')
+
+    if NUM_CORES == -1 or NUM_CORES > multiprocessing.cpu_count():
+        NUM_CORES = multiprocessing.cpu_count()
+    #end if
+
+    # the input is given on the command line, as standard input may be the stream
+    if len(sys.argv) != 4:
+        print('Usage: python stream_p.py SOURCE OUTPUT_FOLDER NUM_TRACERS')
+        raise SystemExit
+    #end if
+    source = sys.argv[1]
+    output_folder = sys.argv[2]
+    num_tracers = int(sys.argv[3])
+    if os.path.exists(output_folder):
+        print('The output folder ' + output_folder + ' already exists.')
+        raise SystemExit
+    #end if
+    os.makedirs(output_folder)
+    frame_size = LINES_PER_TRACER * num_tracers
+    stride = dataset.getStride(frame_size, STRIDE_PER_TRACER * num_tracers)
+    if stride < frame_size:
+        print('Warning: frames overlap, and the shared lines are discretized for each frame')
+    #end if
+
+    print('Waiting for the stream from ' + source)
+    stream = openStream(source)
+    print('Starting location using ' + str(NUM_CORES) + ' physical cores.')
+
+    pool = multiprocessing.Pool(processes=NUM_CORES, initializer=location_p.start_process)
+    writer = vuti.OutputWriter(output_folder, MAX_OUTPUT, OUTPUT_FORMAT)
+    monitor = profiling.LatencyMonitor(REPORT_INTERVAL)
+    throttle = vuti.Throttle(BACKLOG_FRAMES)
+    arrival_times = collections.deque()     # of the frames read but not yet output
+    try:
+        reader = TimedReader(stream, BACKLOG_FRAMES * frame_size)
+        frames = timeFrames(dataset.formFrames(reader, frame_size, stride=stride), reader, arrival_times)
+        results = pool.imap(location_p.locate, throttle.wrap(frames, monitor.addStall))
+        # the wait for each result ends at the next flush, so that the output
+        # is flushed every Flush_Interval seconds even while no frames arrive
+        last_flush = time.time()
+        while True:
+            try:
+                locations = results.next(max(last_flush + FLUSH_INTERVAL - time.time(), 0.0))
+            except multiprocessing.TimeoutError:
+                locations = None
+            except StopIteration:
+                break
+            #end try
+            if locations is not None:
+                throttle.release()
+                writer.append(locations)
+                monitor.add(time.time() - arrival_times.popleft(), len(arrival_times))
+            #end if
+            if time.time() - last_flush >= FLUSH_INTERVAL:
+                writer.flush()
+                last_flush = time.time()
+            #end if
+            monitor.update()
+        #end while
+        print('End of stream')
+        pool.close()
+        pool.join()
+    except (KeyboardInterrupt, SystemExit):
+        throttle.stop()
+        pool.terminate()
+        pool.join()
+        print('\n Operation cancelled, writing data to file...')
+        raise
+    finally:
+        writer.close()
+        monitor.printReport()
+        print('Located ' + str(monitor.getNumFrames()) + ' frames')
+    #end try
+#end main
@@ -0,0 +1,220 @@
+# built-in libraries
+import numpy as np
+import os
+import glob
+import itertools
+import multiprocessing
+import time
+import hashlib
+from ConfigParser import SafeConfigParser
+# custom classes
+import location_p
+from lib import fov
+from lib import poicache
+from lib import vmptutils as vuti
+
+
+#==============================================================================
+#     Parameter sweep mode. Locates the tracers in every input file once for
+#     each combination of the Eps, K, Lof_Frac and Vol_Frac values listed in
+#     the [Sweep] section of the config.ini file, writing the locations of 
+#     each combination to its own folder.
+#     The points of interest (discretization and Voronoi tessellation) depend
+#     only on the spacing, which is Eps, so they are found once per file and
+#     value of Eps and kept in an on-disk cache. Only the filtering and 
+#     clustering stages are run per combination.
+#==============================================================================
+
+#==============================================================================
+#     Called by the Pool object to find the points of interest of one frame.
+#     Takes the frame (or its range in a binary cache) and the spacing.
+#==============================================================================
+def findPointsTask(task):
+    frame_source, spacing = task
+    if isinstance(frame_source, tuple):
+        frame_source = location_p.getFrameData(frame_source)
+    #end if
+    return location_p.findPointsOfInterest(frame_source, spacing)
+#end findPointsTask() method
+
+#==============================================================================
+#     Generator of the points of interest of each frame, found by the Pool. 
+#     The frames are read lazily, and at most max_in_flight ahead of the 
+#     points of interest used.
+#==============================================================================
+def findPoints(pool, frames, spacing, max_in_flight):
+    throttle = vuti.Throttle(max_in_flight)
+    tasks = ((frame_source, spacing) for frame_source in throttle.wrap(frames))
+    for poi in vuti.iterResults(pool.imap(findPointsTask, tasks)):
+        throttle.release()
+        yield poi
+    #end for poi
+#end findPoints() method
+
+#==============================================================================
+#     Called by the Pool object to filter and cluster the points of interest
+#     of one frame with one combination of parameters.
+#==============================================================================
+def locatePointsTask(task):
+    all_points, all_vols, time_i, params = task
+    return location_p.locatePoints(all_points, all_vols, time_i, *params)
+#end locatePointsTask() method
+
+# Reads a comma separated list of values from the config file
+def getValues(config, section, option, value_type):
+    return [value_type(value) for value in config.get(section, option).split(',')]
+
+# Returns the name of the output folder for one combination of parameters
+def getCombinationName(params):
+    return 'eps_%g_k_%d_lof_%g_vol_%g' % params
+
+# Returns the name under which the points of interest are cached: the engine 
+# (with its number of neighbours for the density engine), followed by the field
+# of view, adaptive discretization and subdomains if they are used
+def getPoiKey():
+    poi_key = location_p.POI_ENGINE
+    if location_p.POI_ENGINE == 'density':
+        poi_key += '-k%d' % location_p.DENSITY_K
+    if location_p.FOV is not None:
+        poi_key += '-fov' + hashlib.sha1(repr(location_p.FOV)).hexdigest()[0:8]
+    if location_p.COARSE_FACTOR > 1:
+        poi_key += '-coarse%d-%d' % (location_p.COARSE_FACTOR, location_p.MIN_NEIGHBOURS)
+    if location_p.POI_ENGINE == 'voronoi' and location_p.SUBDOMAINS > 1:
+        poi_key += '-sub%d-%g' % (location_p.SUBDOMAINS, location_p.SUBDOMAIN_OVERLAP)
+    return poi_key
+
+#==============================================================================
+#     Main method.
+#     Asks for the same user input as location_p.py. For each input file, the
+#         points of interest are loaded from the cache or calculated, and then
+#         located with each combination of parameters.
+#==============================================================================
+if __name__ == "__main__":
+    ## Constants used throughout the algorithm, imported from the config.ini file ##
+    config = SafeConfigParser()
+    config.read('lib/config.ini')
+    
+    LINES_PER_TRACER = config.getint('Frame','Lines_Per_Tracer') # number of LOR's used per tracer
+    MAX_OUTPUT = config.getint('LocationOutput','Max_Output')    # maximum number of entries in the output array before writing to disk
+    OUTPUT_FORMAT = config.get('LocationOutput','Output_Format') # format of the output file, csv or binary
+    NUM_CORES = config.getint('Processing','Num_Cores')
+    USE_CACHE = config.getboolean('Processing','Use_Cache')      # map data from binary caches of the input files
+    BATCH_FRAMES = config.getint('Processing','Batch_Frames')    # frames whose points of interest are held at a time
+    CHUNK_SIZE = config.getint('Processing','Chunk_Size')        # number of frames sent to a process at a time
+    EPS_VALUES = getValues(config, 'Sweep', 'Eps_Values', float)
+    K_VALUES = getValues(config, 'Sweep', 'K_Values', int)
+    LOF_FRAC_VALUES = getValues(config, 'Sweep', 'Lof_Frac_Values', float)
+    VOL_FRAC_VALUES = getValues(config, 'Sweep', 'Vol_Frac_Values', float)
+    CACHE_FOLDER = config.get('Sweep', 'Cache_Folder')           # folder of the point of interest cache
+    MAX_CACHE_BYTES = config.getfloat('Sweep', 'Max_Cache_MB') * 1024 * 1024
+    # the point of interest settings are used by location_p in each process
+    location_p.POI_ENGINE = config.get('Frame','Poi_Engine')
+    location_p.DENSITY_K = config.getint('Frame','Density_K')
+    location_p.FOV = fov.fromConfig(config)
+    location_p.COARSE_FACTOR = config.getint('Frame','Coarse_Factor')
+    location_p.MIN_NEIGHBOURS = config.getint('Frame','Min_Neighbours')
+    location_p.SUBDOMAINS = config.getint('Frame','Subdomains')
+    location_p.SUBDOMAIN_OVERLAP = config.getfloat('Frame','Subdomain_Overlap')
+    location_p.SUBDOMAIN_THREADS = config.getint('Frame','Subdomain_Threads')
+    
+    if NUM_CORES > multiprocessing.cpu_count() or NUM_CORES == -1:
+        print('Using maximum number of cores.')
+        NUM_CORES = multiprocessing.cpu_count()
+    #end if
+    if CHUNK_SIZE <= 0:
+        CHUNK_SIZE = max(1, BATCH_FRAMES // (4 * NUM_CORES))
+    #end if
+    
+    # get user input
+    input_folder = raw_input('Enter the path of the folder containing the input files: ')
+    # create the ouput folder (delete first if it exists)
+    output_folder = location_p.createOutputFolder()
+    
+    num_tracers = int(raw_input('Enter the number of tracers expected: '))
+    frame_size = LINES_PER_TRACER * num_tracers
+    
+    input_files = glob.glob(os.path.join(input_folder,'*.dat'))
+    combinations = list(itertools.product(EPS_VALUES, K_VALUES, LOF_FRAC_VALUES, VOL_FRAC_VALUES))
+    print('Sweeping ' + str(len(combinations)) + ' parameter combinations over ' \
+          + str(len(input_files)) + ' files using ' + str(NUM_CORES) + ' cores.')
+    
+    # one output writer and location count per combination
+    writers = {}
+    num_locations = {}
+    for params in combinations:
+        combination_folder = os.path.join(output_folder, getCombinationName(params))
+        os.makedirs(combination_folder)
+        writers[params] = vuti.OutputWriter(combination_folder, MAX_OUTPUT, OUTPUT_FORMAT)
+        num_locations[params] = 0
+    #end for params
+    
+    cache = poicache.POICache(CACHE_FOLDER, MAX_CACHE_BYTES)
+    pool = multiprocessing.Pool(processes=NUM_CORES, initializer=location_p.start_process)
+    num_frames = 0
+    try:
+        for file_path in input_files:
+            print('==================================================')
+            print('Sweeping file ' + file_path)
+            file_hash = poicache.getFileHash(file_path)
+            frames, _ = location_p.loadFile(file_path, frame_size, USE_CACHE)
+            
+            for spacing in EPS_VALUES:
+                start = time.time()
+                frame_pois = cache.load(file_hash, getPoiKey(), frame_size, spacing)
+                if frame_pois is None:
+                    print('Finding points of interest with spacing ' + str(spacing))
+                    frame_pois = cache.store(file_hash, getPoiKey(), frame_size, spacing, 
+                                             findPoints(pool, frames, spacing, BATCH_FRAMES), BATCH_FRAMES)
+                else:
+                    print('Loading points of interest with spacing ' + str(spacing) + ' from cache')
+                #end if
+                
+                # the points of interest are located with each combination a batch
+                # of frames at a time, as they are found or loaded
+                spacing_combinations = [params for params in combinations if params[0] == spacing]
+                locate_times = dict((params, 0.0) for params in spacing_combinations)
+                file_frames = 0
+                for batch in vuti.getChunks(frame_pois, BATCH_FRAMES):
+                    for params in spacing_combinations:
+                        locate_start = time.time()
+                        tasks = ((all_points, all_vols, time_i, params) for all_points, all_vols, time_i in batch)
+                        for locations in vuti.iterResults(pool.imap(locatePointsTask, tasks, CHUNK_SIZE)):
+                            writers[params].append(locations)
+                            num_locations[params] += locations.shape[0]
+                        #end for locations
+                        locate_times[params] += time.time() - locate_start
+                    #end for params
+                    file_frames += len(batch)
+                #end for batch
+                for params in spacing_combinations:
+                    writers[params].flush()
+                    print(getCombinationName(params) + ': ' + str(locate_times[params]) + 's')
+                #end for params
+                print('Spacing ' + str(spacing) + ': ' + str(file_frames) + ' frames in ' \
+                      + str(time.time() - start) + 's')
+            #end for spacing
+            num_frames += file_frames
+        #end for file_path
+        pool.close()
+        pool.join()
+    except (KeyboardInterrupt, SystemExit):
+        pool.terminate()
+        pool.join()
+        print('\n Operation cancelled, writing data to file...')
+        raise
+    finally:
+        for params in combinations:
+            writers[params].close()
+        #end for params
+    #end try
+    
+    # summary of the number of tracers found with each combination
+    summary = np.array([list(params) + [num_locations[params] / float(max(num_frames, 1))] \
+                        for params in combinations])
+    np.savetxt(os.path.join(output_folder, 'sweep_summary.csv'), summary, delimiter=',', fmt='%g',
+               header='eps,k,lof_frac,vol_frac,locations_per_frame', comments='')
+    print('Average number of locations per frame:')
+    for params in combinations:
+        print(getCombinationName(params) + ': %.2f' % (num_locations[params] / float(max(num_frames, 1))))
+    #end for params
+#end main
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from lib import dataset
+
+# Rows of [Ax,Ay,Az,Bx,By,Bz,t] in which t is the row number, so that the rows of
+# each frame can be read back from its last column
+def makeRows(num_rows):
+    rows = np.zeros((num_rows, 7))
+    rows[:,3] = 1.0
+    rows[:,6] = np.arange(num_rows)
+    return rows
+
+def getRanges(frames):
+    return [(int(frame_data[0,6]), int(frame_data[-1,6]) + 1) for frame_data in frames]
+
+# Splits the rows into blocks of the given sizes, as parsed from a file or stream
+def makeBlocks(rows, block_sizes):
+    starts = np.cumsum([0] + list(block_sizes))
+    return [rows[start:stop] for start, stop in zip(starts[:-1], starts[1:])]
+
+class FrameRangeTest(unittest.TestCase):
+    # (num_rows, frame_size, stride, expected (start, stop) rows of each frame)
+    CASES = [
+        # frames which do not overlap, with the last shifted back to the end
+        (12, 4, 0, [(0,4), (4,8), (8,12)]),
+        (10, 4, 0, [(0,4), (4,8), (6,10)]),
+        (10, 4, 4, [(0,4), (4,8), (6,10)]),
+        # overlapping frames
+        (10, 4, 2, [(0,4), (2,6), (4,8), (6,10)]),
+        (11, 4, 2, [(0,4), (2,6), (4,8), (6,10), (7,11)]),
+        (10, 4, 3, [(0,4), (3,7), (6,10)]),
+        # a stride larger than the frame is the frame size
+        (10, 4, 9, [(0,4), (4,8), (6,10)]),
+        # fewer rows than one frame give a single partial frame
+        (3, 4, 0, [(0,3)]),
+        (3, 4, 2, [(0,3)]),
+    ]
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def writeFile(self, rows):
+        file_path = os.path.join(self._folder, 'data.dat')
+        np.savetxt(file_path, rows, delimiter='\t')
+        return file_path
+
+    def testFormFrames(self):
+        for num_rows, frame_size, stride, expected in self.CASES:
+            rows = makeRows(num_rows)
+            for block_sizes in ([num_rows], [1] * num_rows, [2, num_rows - 2]):
+                frames = dataset.formFrames(makeBlocks(rows, block_sizes), frame_size, stride=stride)
+                self.assertEqual(getRanges(frames), expected, (num_rows, frame_size, stride, block_sizes))
+
+    def testFrameReader(self):
+        for num_rows, frame_size, stride, expected in self.CASES:
+            file_path = self.writeFile(makeRows(num_rows))
+            frames = dataset.FrameReader(file_path, frame_size, stride=stride)
+            self.assertEqual(getRanges(frames), expected, (num_rows, frame_size, stride))
+
+    def testDataSet(self):
+        for num_rows, frame_size, stride, expected in self.CASES:
+            file_path = self.writeFile(makeRows(num_rows))
+            data_set = dataset.DataSet(file_path, frame_size, stride=stride)
+            self.assertEqual(data_set.getNumFrames(), len(expected))
+            self.assertEqual(data_set.getFrameRanges(), expected, (num_rows, frame_size, stride))
+
+    def testNumFrames(self):
+        rows = makeRows(11)
+        frames = dataset.formFrames(makeBlocks(rows, [5, 6]), 4, num_frames=2, stride=2)
+        self.assertEqual(getRanges(frames), [(0,4), (2,6)])
+
+if __name__ == '__main__':
+    unittest.main()
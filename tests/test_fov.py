@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+
+from lib import fov
+
+# The range of t in [0,1] at which the points A + tV, sampled at num_samples
+# values of t, are between lower and upper, or None if none are
+def getSampledInterval(A, V, lower, upper, num_samples=20001):
+    t = np.linspace(0.0, 1.0, num_samples)
+    points = A + t[:,np.newaxis] * V
+    inside = np.all((points >= lower) & (points <= upper), axis=1)
+    if not np.any(inside):
+        return None
+    return t[inside][0], t[inside][-1]
+
+class SlabIntervalTest(unittest.TestCase):
+    LOWER = np.array([[-10.0, -20.0, -5.0]])
+    UPPER = np.array([[10.0, 20.0, 5.0]])
+
+    # the intervals of random lines are those found by sampling the lines
+    def testRandomLines(self):
+        rng = np.random.RandomState(0)
+        A = rng.uniform(-30.0, 30.0, (200,3))
+        V = rng.uniform(-60.0, 60.0, (200,3))
+        start, end = fov._getSlabIntervals(A, V, self.LOWER, self.UPPER)
+        for line_id in range(A.shape[0]):
+            expected = getSampledInterval(A[line_id], V[line_id], self.LOWER, self.UPPER)
+            if expected is None:
+                self.assertTrue(start[line_id] > end[line_id] or end[line_id] - start[line_id] < 1e-4)
+            else:
+                self.assertAlmostEqual(start[line_id], expected[0], delta=1e-4)
+                self.assertAlmostEqual(end[line_id], expected[1], delta=1e-4)
+
+    # lines parallel to a pair of faces are inside for all of [0,1] or for none
+    # of it, depending on whether they are between those faces
+    def testParallelLines(self):
+        A = np.array([[0.0, 0.0, -20.0],    # along z, through the box
+                      [15.0, 0.0, -20.0],   # along z, beside the box
+                      [0.0, 0.0, 0.0],      # inside, along x
+                      [-20.0, 30.0, 0.0],   # along x, beside the box
+                      [0.0, 0.0, 10.0]])    # above the box, along y
+        V = np.array([[0.0, 0.0, 40.0],
+                      [0.0, 0.0, 40.0],
+                      [5.0, 0.0, 0.0],
+                      [40.0, 0.0, 0.0],
+                      [0.0, 10.0, 0.0]])
+        start, end = fov._getSlabIntervals(A, V, self.LOWER, self.UPPER)
+        self.assertAlmostEqual(start[0], 15.0 / 40.0)
+        self.assertAlmostEqual(end[0], 25.0 / 40.0)
+        self.assertTrue(start[1] > end[1])
+        self.assertEqual((start[2], end[2]), (0.0, 1.0))
+        self.assertTrue(start[3] > end[3])
+        self.assertTrue(start[4] > end[4])
+
+    # a line with A == B is inside if A is
+    def testPointLines(self):
+        A = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 50.0]])
+        start, end = fov._getSlabIntervals(A, np.zeros((2,3)), self.LOWER, self.UPPER)
+        self.assertEqual((start[0], end[0]), (0.0, 1.0))
+        self.assertTrue(start[1] > end[1])
+
+    # the box and the z range of the cylinder use the slab intervals
+    def testBoxFOV(self):
+        rng = np.random.RandomState(1)
+        A = rng.uniform(-30.0, 30.0, (50,3))
+        V = rng.uniform(-60.0, 60.0, (50,3))
+        box = fov.BoxFOV(self.LOWER.ravel(), self.UPPER.ravel())
+        expected = fov._getSlabIntervals(A, V, self.LOWER, self.UPPER)
+        for values, expected_values in zip(box.getIntervals(A, V), expected):
+            self.assertTrue(np.array_equal(values, expected_values))
+
+if __name__ == '__main__':
+    unittest.main()
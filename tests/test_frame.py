@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from scipy.spatial import Voronoi
+
+from lib import frame
+import vmptlib
+
+# Random seed points on num_lines lines, with the points of each line together
+def makeSeedPoints(num_lines, points_per_line, seed=0):
+    rng = np.random.RandomState(seed)
+    all_points = rng.uniform(-50.0, 50.0, (num_lines * points_per_line, 3))
+    line_indices = np.repeat(np.arange(num_lines), points_per_line)
+    return all_points, line_indices
+
+class SmallestRegionTest(unittest.TestCase):
+    # the array based selection gives the same points and volumes as the list
+    # based getSmallestRegion, including for lines whose points all have
+    # unbounded regions, which keep the last of them
+    def testMatchesListVersion(self):
+        for seed in range(5):
+            all_points, line_indices = makeSeedPoints(40, 5, seed)
+            # the points of the last line lie far outside the others, so that all
+            # of their regions are unbounded
+            all_points[-5:,:] *= 100.0
+            voro = Voronoi(all_points)
+            expected_points, expected_volumes = vmptlib.getSmallestRegion(40, line_indices.tolist(),
+                                                                          voro.point_region.tolist(),
+                                                                          voro.regions, voro.vertices)
+            points, volumes = frame._getSmallestRegionPerLine(all_points, line_indices, 40)
+            self.assertEqual(points.tolist(), expected_points)
+            self.assertEqual(volumes.tolist(), expected_volumes)
+            self.assertEqual(points[39], all_points.shape[0] - 1)
+            self.assertEqual(volumes[39], 100000.0)
+
+    # lines without seed points have no point of interest
+    def testLinesWithoutPoints(self):
+        all_points, line_indices = makeSeedPoints(20, 5)
+        points, volumes = frame._getSmallestRegionPerLine(all_points, line_indices, 22)
+        self.assertEqual(points[20:].tolist(), [-1, -1])
+        self.assertTrue(np.all(points[0:20] >= 0))
+
+# Lines through a few tracers, as in a frame, of [Ax,Ay,Az,Bx,By,Bz,t]
+def makeFrameData(num_tracers, lines_per_tracer, seed=0):
+    rng = np.random.RandomState(seed)
+    tracers = rng.uniform(-40.0, 40.0, (num_tracers, 3))
+    directions = rng.normal(size=(num_tracers * lines_per_tracer, 3))
+    directions /= np.sqrt(np.sum(directions ** 2, axis=1))[:,np.newaxis]
+    centres = np.repeat(tracers, lines_per_tracer, axis=0) + rng.normal(scale=0.5, size=directions.shape)
+    frame_data = np.zeros((num_tracers * lines_per_tracer, 7))
+    frame_data[:,0:3] = centres - 100.0 * directions
+    frame_data[:,3:6] = centres + 100.0 * directions
+    frame_data[:,6] = np.arange(frame_data.shape[0])
+    return frame_data
+
+class DecomposedRegionTest(unittest.TestCase):
+    # the subdomains give the points of interest of the whole frame whatever the
+    # overlap, as the regions the halo does not fix are tessellated again
+    def testMatchesSingleDomain(self):
+        for seed in range(2):
+            frame_data = makeFrameData(3, 20, seed)
+            expected = frame.Frame(frame_data).getPointsOfInterest(4.0)
+            for subdomains in (2, 5):
+                for overlap in (0.0, 10.0, 50.0):
+                    for num_threads in (1, 2):
+                        pois = frame.Frame(frame_data).getPointsOfInterest(4.0, subdomains=subdomains, 
+                                                                            overlap=overlap, 
+                                                                            num_threads=num_threads)
+                        case = (seed, subdomains, overlap, num_threads)
+                        self.assertEqual(pois['ind'].tolist(), expected['ind'].tolist(), case)
+                        self.assertTrue(np.allclose(pois['vol'], expected['vol'], rtol=1e-9), case)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+import location_p
+from lib import dataset
+from tests.test_dataset import makeRows, makeBlocks
+
+class JoinFramesTest(unittest.TestCase):
+    # the joined rows hold each row once, and the range of each frame in them
+    # gives its rows, including the last frame, shifted back to end at the
+    # last row
+    def testOverlappingFrames(self):
+        for num_rows, frame_size, stride in ((10, 4, 2), (11, 4, 2), (10, 4, 3), (12, 4, 4), (10, 4, 4)):
+            rows = makeRows(num_rows)
+            frames = list(dataset.formFrames(makeBlocks(rows, [num_rows]), frame_size, stride=stride))
+            for chunk in (frames, frames[1:], frames[0:2], frames[-1:]):
+                span_data, frame_ranges = location_p.joinFrames(chunk)
+                first = int(chunk[0][0,6])
+                self.assertTrue(np.array_equal(span_data, rows[first:int(chunk[-1][-1,6]) + 1]))
+                for frame_data, (frame_start, frame_end) in zip(chunk, frame_ranges):
+                    self.assertTrue(np.array_equal(span_data[frame_start:frame_end], frame_data))
+
+    # frames which share no rows follow each other
+    def testSeparateFrames(self):
+        rows = makeRows(8)
+        span_data, frame_ranges = location_p.joinFrames([rows[0:4], rows[6:8], rows[2:6]])
+        self.assertEqual(frame_ranges, [(0,4), (4,6), (6,10)])
+        self.assertTrue(np.array_equal(span_data[6:10], rows[2:6]))
+
+if __name__ == '__main__':
+    unittest.main()
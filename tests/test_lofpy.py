@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from lib import lofpy
+from lib import spatialindex
+
+# The Local Outlier Factor found one point at a time, as before it was vectorized
+def getLOFLoop(k, X):
+    num_points = X.shape[0]
+    lof = np.zeros(num_points)
+    lrd = np.zeros(num_points)
+    distances, indices = NearestNeighbors(n_neighbors=k+1).fit(X).kneighbors(X)
+    kdistances = distances[:,-1]
+    for i in range(num_points):
+        i_nbrs = indices[i,1:]
+        i_reach_dist = np.maximum(distances[i,1:], kdistances[i_nbrs])
+        lrd[i] = float(k) / np.sum(i_reach_dist)
+    for j in range(num_points):
+        j_nbrs = indices[j,1:]
+        lof[j] = (np.sum(lrd[j_nbrs]) / float(k)) / lrd[j]
+    return lof
+
+class LOFTest(unittest.TestCase):
+    # the vectorized LOF matches the loop, whether the neighbours are found by
+    # getLOF, from a fitted NearestNeighbors or from a SpatialIndex
+    def testMatchesLoop(self):
+        for seed in range(3):
+            rng = np.random.RandomState(seed)
+            X = np.concatenate((rng.normal(scale=2.0, size=(150,3)), rng.uniform(-30.0, 30.0, (30,3))))
+            for k in (4, 10):
+                expected = getLOFLoop(k, X)
+                nbrs = NearestNeighbors(n_neighbors=k+1).fit(X)
+                index = spatialindex.SpatialIndex(X, k, 5.0)
+                for neighbors in (None, nbrs, index.getKNeighbors()):
+                    lof = lofpy.getLOF(k, X, neighbors)
+                    self.assertEqual(lof.shape, (X.shape[0],))
+                    self.assertTrue(np.allclose(lof, expected, rtol=1e-12))
+
+if __name__ == '__main__':
+    unittest.main()
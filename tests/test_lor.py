@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+
+from lib import lor
+from lib import fov
+
+# Random lines of [Ax,Ay,Az,Bx,By,Bz,t], longer than the spacings used
+def makeFrameData(num_lines, seed=0):
+    rng = np.random.RandomState(seed)
+    frame_data = np.zeros((num_lines,7))
+    frame_data[:,0:3] = rng.uniform(-100.0, 100.0, (num_lines,3))
+    directions = rng.normal(size=(num_lines,3))
+    directions /= np.sqrt(np.sum(directions ** 2, axis=1))[:,np.newaxis]
+    frame_data[:,3:6] = frame_data[:,0:3] + rng.uniform(20.0, 200.0, (num_lines,1)) * directions
+    frame_data[:,6] = np.arange(num_lines)
+    return frame_data
+
+class LineBatchTest(unittest.TestCase):
+    # the batch gives the points of the discretization of each LineOfResponse,
+    # in order of line
+    def testMatchesLineOfResponse(self):
+        frame_data = makeFrameData(50)
+        lines = lor.LineBatch(frame_data)
+        for spacing in (1.0, 2.5, 7.0):
+            points, line_indices = lines.getDiscretization(spacing)
+            expected_points = []
+            for line_id in range(frame_data.shape[0]):
+                line = lor.LineOfResponse(frame_data[line_id,0:3].copy(), frame_data[line_id,3:6].copy(), line_id)
+                expected_points.append(line.getLineDiscretization(spacing))
+                self.assertEqual(lines.getNumPoints(spacing)[line_id], line.getNumPoints(spacing))
+            expected_indices = np.repeat(np.arange(50), [len(line_points) for line_points in expected_points])
+            self.assertTrue(np.allclose(points, np.concatenate(expected_points), rtol=0.0, atol=1e-9))
+            self.assertEqual(line_indices.tolist(), expected_indices.tolist())
+        self.assertEqual(lines.getMeanTime(), np.mean(frame_data[:,6]))
+
+    # clipping keeps the points of the full discretization which are inside the
+    # field of view
+    def testClip(self):
+        frame_data = makeFrameData(50, seed=1)
+        lower = np.array([-40.0, -60.0, -30.0])
+        upper = np.array([50.0, 40.0, 30.0])
+        full_points, full_indices = lor.LineBatch(frame_data).getDiscretization(2.0)
+        lines = lor.LineBatch(frame_data)
+        lines.clip(fov.BoxFOV(lower, upper))
+        points, line_indices = lines.getDiscretization(2.0)
+        # the points on the faces may fall either side by rounding
+        inside = np.all((full_points >= lower + 1e-9) & (full_points <= upper - 1e-9), axis=1)
+        near = np.all((full_points >= lower - 1e-9) & (full_points <= upper + 1e-9), axis=1)
+        kept = set(map(tuple, np.column_stack((line_indices, points)).round(6).tolist()))
+        expected = set(map(tuple, np.column_stack((full_indices, full_points))[inside].round(6).tolist()))
+        allowed = set(map(tuple, np.column_stack((full_indices, full_points))[near].round(6).tolist()))
+        self.assertTrue(expected <= kept <= allowed)
+        self.assertTrue(np.array_equal(lines.getNumPoints(2.0), np.bincount(line_indices, minlength=50)))
+
+    # a span gives the seed points of a range of its lines as a batch of those
+    # lines does
+    def testLineSpan(self):
+        frame_data = makeFrameData(40, seed=2)
+        span = lor.LineSpan(frame_data, 2.0)
+        for start, stop in ((0, 40), (0, 10), (15, 35), (39, 40)):
+            points, line_indices = span.getSeedPoints(start, stop)
+            expected_points, expected_indices = lor.LineBatch(frame_data[start:stop]).getDiscretization(2.0)
+            self.assertTrue(np.array_equal(points, expected_points))
+            self.assertTrue(np.array_equal(line_indices, expected_indices))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from lib import poicache
+
+# The per frame (points, volumes, time) of num_frames frames
+def makeFramePois(num_frames, seed=0):
+    rng = np.random.RandomState(seed)
+    frame_pois = []
+    for frame_num in range(num_frames):
+        num_points = rng.randint(0, 20)
+        frame_pois.append((rng.uniform(size=(num_points,3)), rng.uniform(size=num_points), float(frame_num)))
+    return frame_pois
+
+class POICacheTest(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def assertSamePois(self, frame_pois, expected):
+        self.assertEqual(len(frame_pois), len(expected))
+        for (points, volumes, time_i), (expected_points, expected_volumes, expected_time) in zip(frame_pois, expected):
+            self.assertTrue(np.array_equal(points.reshape(-1,3), expected_points))
+            self.assertTrue(np.array_equal(volumes, expected_volumes))
+            self.assertEqual(time_i, expected_time)
+
+    # the frames are yielded as they are stored, and loaded in parts in order
+    def testStoreLoad(self):
+        cache = poicache.POICache(self._folder, 1e9)
+        expected = makeFramePois(23)
+        self.assertTrue(cache.load('hash', 'voronoi', 300, 5.0) is None)
+        stored = list(cache.store('hash', 'voronoi', 300, 5.0, iter(expected), part_frames=5))
+        self.assertSamePois(stored, expected)
+        entry_path = cache.getEntryPath('hash', 'voronoi', 300, 5.0)
+        self.assertEqual(len(os.listdir(entry_path)), 5)
+        self.assertSamePois(list(cache.load('hash', 'voronoi', 300, 5.0)), expected)
+
+    # an entry only exists once all of its frames are stored, and one which is
+    # being written is not evicted
+    def testIncompleteEntry(self):
+        cache = poicache.POICache(self._folder, 0)
+        frames = cache.store('hash', 'voronoi', 300, 4.0, iter(makeFramePois(10)), part_frames=2)
+        next(frames)
+        self.assertTrue(cache.load('hash', 'voronoi', 300, 4.0) is None)
+        list(cache.store('hash', 'voronoi', 300, 5.0, iter(makeFramePois(10, seed=1)), part_frames=2))
+        list(cache.store('hash', 'voronoi', 300, 6.0, iter(makeFramePois(10, seed=2)), part_frames=2))
+        # the older complete entry is evicted, and the entry being written is not
+        self.assertTrue(cache.load('hash', 'voronoi', 300, 5.0) is None)
+        self.assertEqual(len(list(frames)), 9)
+        self.assertEqual(len(list(cache.load('hash', 'voronoi', 300, 4.0))), 10)
+        self.assertEqual(sorted(os.listdir(self._folder)), 
+                         [os.path.basename(cache.getEntryPath('hash', 'voronoi', 300, 4.0))])
+
+    # a store which is abandoned leaves no entry
+    def testAbandonedStore(self):
+        cache = poicache.POICache(self._folder, 1e9)
+        frames = cache.store('hash', 'voronoi', 300, 4.0, iter(makeFramePois(10)), part_frames=2)
+        next(frames)
+        frames.close()
+        self.assertEqual(os.listdir(self._folder), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+
+from lib import spatialindex
+
+# Clusters of points about a few centres, with scattered points between them
+def makePoints(seed=0):
+    rng = np.random.RandomState(seed)
+    centres = rng.uniform(-50.0, 50.0, (4,3))
+    clusters = [centre + rng.normal(scale=2.0, size=(60,3)) for centre in centres]
+    scattered = rng.uniform(-60.0, 60.0, (80,3))
+    return np.concatenate(clusters + [scattered])
+
+class SpatialIndexTest(unittest.TestCase):
+    # the neighbours are those of a NearestNeighbors fitted to the points
+    def testKNeighbors(self):
+        points = makePoints()
+        distances, indices = spatialindex.SpatialIndex(points, 5, 4.0).getKNeighbors()
+        expected_distances, expected_indices = NearestNeighbors(n_neighbors=6).fit(points).kneighbors(points)
+        self.assertTrue(np.allclose(distances, expected_distances))
+        self.assertTrue(np.array_equal(indices, expected_indices))
+
+    # DBSCAN of the radius graph of a subset of the points gives the labels of
+    # DBSCAN of the points of the subset
+    def testRadiusGraphDBSCAN(self):
+        for seed in range(3):
+            points = makePoints(seed)
+            index = spatialindex.SpatialIndex(points, 5, 4.0)
+            rng = np.random.RandomState(seed)
+            for indices in (None, np.sort(rng.choice(points.shape[0], 200, replace=False)), 
+                            rng.permutation(points.shape[0])[0:150]):
+                subset = points if indices is None else points[indices,:]
+                expected = DBSCAN(eps=4.0, min_samples=5).fit(subset).labels_
+                labels = DBSCAN(eps=4.0, min_samples=5, metric='precomputed').fit(
+                    index.getRadiusGraph(indices)).labels_
+                self.assertEqual(labels.tolist(), expected.tolist())
+
+    # the graph holds the distances of the pairs within eps, and no point is its
+    # own neighbour
+    def testRadiusGraph(self):
+        points = makePoints()
+        indices = np.arange(0, points.shape[0], 3)
+        graph = spatialindex.SpatialIndex(points, 5, 4.0).getRadiusGraph(indices).toarray()
+        subset = points[indices,:]
+        distances = np.sqrt(np.sum((subset[:,np.newaxis,:] - subset[np.newaxis,:,:]) ** 2, axis=2))
+        expected = np.where(distances <= 4.0, distances, 0.0)
+        np.fill_diagonal(expected, 0.0)
+        self.assertTrue(np.allclose(graph, expected))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import numpy as np
+
+from lib import track
+
+# Links tracks one track and one location at a time, with the tracks held in
+# lists, as a reference for the vectorized TrackLinker and its TrackSet
+class ListLinker:
+    def __init__(self, search_radius, max_skips, min_entries, min_density, extrap_len, quad_size):
+        self._search_radius = search_radius
+        self._max_skips = max_skips
+        self._min_entries = min_entries
+        self._min_density = min_density
+        self._extrap_len = extrap_len
+        self._quad_size = quad_size
+        self._step = 0
+        self._active = []       # [entries, skips] of each track, entries being (step, time, location)
+        self._kept = []
+
+    def addLocations(self, time, locations):
+        pairs = []
+        for track_num, (entries, skips) in enumerate(self._active):
+            recent = entries[-self._extrap_len:]
+            times = np.zeros((1,self._extrap_len))
+            positions = np.empty((1,self._extrap_len,3))
+            positions.fill(np.nan)
+            for column, (_, entry_time, location) in enumerate(recent, self._extrap_len - len(recent)):
+                times[0,column] = entry_time
+                positions[0,column,:] = location
+            predicted = track.extrapolate(times, positions, np.array([float(time)]), self._quad_size)[0]
+            for location_num, location in enumerate(locations):
+                distance = np.sqrt(np.sum((location - predicted) ** 2))
+                if distance <= self._search_radius * (1 + skips):
+                    pairs.append((distance, track_num, location_num))
+        pairs.sort()
+
+        # each track's closest pair is taken, then the closest of those of each
+        # location, until no pairs remain
+        matches = {}
+        while len(pairs) > 0:
+            closest = {}
+            for pair in pairs:
+                closest.setdefault(pair[1], pair)
+            accepted = {}
+            for pair in sorted(closest.values()):
+                accepted.setdefault(pair[2], pair)
+            for _, track_num, location_num in accepted.values():
+                matches[track_num] = location_num
+            pairs = [pair for pair in pairs if pair[1] not in matches and pair[2] not in accepted]
+
+        for track_num, track_entry in enumerate(self._active):
+            if track_num in matches:
+                track_entry[0].append((self._step, time, locations[matches[track_num]]))
+                track_entry[1] = 0
+            else:
+                track_entry[1] += 1
+        for location_num, location in enumerate(locations):
+            if location_num not in matches.values():
+                self._active.append([[(self._step, time, location)], 0])
+        self._step += 1
+        self._terminate([track_entry[1] > self._max_skips for track_entry in self._active])
+
+    def skip(self, num_steps):
+        for track_entry in self._active:
+            track_entry[1] += num_steps
+        self._step += num_steps
+        self._terminate([track_entry[1] > self._max_skips for track_entry in self._active])
+
+    def finish(self):
+        self._terminate([True] * len(self._active))
+
+    # Returns the [track,x,y,z,t,vx,vy,vz] entries of the tracks kept
+    def getTracks(self):
+        rows = []
+        for track_num, entries in enumerate(self._kept):
+            previous = None
+            for _, time, location in entries:
+                velocity = [np.nan] * 3
+                if previous is not None:
+                    velocity = (location - previous[1]) / (time - previous[0])
+                rows.append(np.concatenate(([track_num], location, [time], velocity)))
+                previous = (time, location)
+        return np.array(rows).reshape(-1,8)
+
+    def _terminate(self, terminated):
+        active = []
+        for track_entry, is_terminated in zip(self._active, terminated):
+            if not is_terminated:
+                active.append(track_entry)
+                continue
+            entries = track_entry[0]
+            num_steps = entries[-1][0] - entries[0][0] + 1
+            if len(entries) >= self._min_entries and len(entries) >= self._min_density * num_steps:
+                self._kept.append(entries)
+        self._active = active
+
+# The locations of tracers moving on circles, of which some are missed at random,
+# with spurious locations, and a few steps at which no tracer is located
+def makeLocations(num_steps, num_tracers=3, seed=0):
+    rng = np.random.RandomState(seed)
+    centres = rng.uniform(-100.0, 100.0, (num_tracers,3))
+    phases = rng.uniform(0.0, 2 * np.pi, num_tracers)
+    steps = []
+    for step in range(num_steps):
+        time = 10.0 * step + rng.uniform(0.0, 2.0)
+        angles = phases + 0.05 * step
+        locations = centres + 40.0 * np.column_stack((np.cos(angles), np.sin(angles), 0.2 * np.sin(2 * angles)))
+        locations += rng.normal(scale=0.5, size=locations.shape)
+        locations = locations[rng.uniform(size=num_tracers) > 0.1]
+        if rng.uniform() < 0.2:
+            locations = np.concatenate((locations, rng.uniform(-150.0, 150.0, (1,3))))
+        if step % 97 > 90:
+            locations = np.zeros((0,3))
+        steps.append((time, locations[rng.permutation(locations.shape[0])]))
+    return steps
+
+class TrackLinkerTest(unittest.TestCase):
+    # the vectorized linker gives the tracks of the list-based linker, including
+    # across steps with no locations, whether they are added or skipped
+    def testMatchesListLinker(self):
+        for seed in range(3):
+            params = (20.0, 5, 30, 0.5, 15, 10)
+            linker = track.TrackLinker(*params)
+            reference = ListLinker(*params)
+            tracks = []
+            num_skipped = 0
+            for step_num, (time, locations) in enumerate(makeLocations(400, seed=seed)):
+                if locations.shape[0] == 0 and step_num % 2 == 1:
+                    num_skipped += 1
+                    continue
+                linker.skip(num_skipped)
+                reference.skip(num_skipped)
+                num_skipped = 0
+                linker.addLocations(time, locations)
+                reference.addLocations(time, locations)
+                if step_num % 50 == 0:
+                    tracks.append(linker.getTracks())
+            linker.finish()
+            reference.finish()
+            tracks.append(linker.getTracks())
+            tracks = np.concatenate(tracks)
+            expected = reference.getTracks()
+            self.assertEqual(linker.getNumKept(), len(set(expected[:,0])))
+            self.assertEqual(tracks.shape, expected.shape)
+            self.assertTrue(np.allclose(tracks, expected, equal_nan=True))
+
+class TrackSetTest(unittest.TestCase):
+    # a TrackSet holds the entries of each track as a list of them would, as
+    # tracks are added, appended to and removed, and the arrays are compacted
+    def testMatchesLists(self):
+        rng = np.random.RandomState(0)
+        track_set = track.TrackSet(block_capacity=2, initial_capacity=4)
+        entries = {}
+        for step in range(300):
+            for track_id in track_set.addTracks(rng.randint(0, 3)):
+                entries[track_id] = []
+            live = np.array(sorted(entries), int)
+            ids = live[rng.uniform(size=len(live)) < 0.7]
+            locations = rng.uniform(-10.0, 10.0, (len(ids),3))
+            track_set.append(ids, locations, np.repeat(float(step), len(ids)), np.repeat(step, len(ids)))
+            for track_id, location in zip(ids, locations):
+                entries[track_id].append((step, location))
+            removed = live[rng.uniform(size=len(live)) < 0.05]
+            track_set.remove(removed)
+            for track_id in removed:
+                del entries[track_id]
+
+            ids = np.array(sorted(entries), int)
+            self.assertEqual(track_set.getLengths(ids).tolist(), [len(entries[track_id]) for track_id in ids])
+            times, recent = track_set.getRecent(ids, 4)
+            for row, track_id in enumerate(ids):
+                last = entries[track_id][-4:]
+                self.assertTrue(np.all(np.isnan(recent[row,0:4 - len(last)])))
+                self.assertTrue(np.array_equal(recent[row,4 - len(last):], 
+                                               np.array([location for _, location in last]).reshape(-1,3)))
+                self.assertEqual(times[row,4 - len(last):].tolist(), [float(time) for time, _ in last])
+        ids = np.array([track_id for track_id in sorted(entries) if len(entries[track_id]) > 0], int)
+        exported = track_set.export(ids)
+        expected = np.concatenate([[[track_id] + list(location) + [time] for time, location in entries[track_id]] \
+                                   for track_id in ids])
+        self.assertTrue(np.array_equal(exported[:,0:5], expected))
+        first, last = track_set.getTimeIndexRange(ids)
+        self.assertEqual(first.tolist(), [entries[track_id][0][0] for track_id in ids])
+        self.assertEqual(last.tolist(), [entries[track_id][-1][0] for track_id in ids])
+
+if __name__ == '__main__':
+    unittest.main()
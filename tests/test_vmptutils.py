@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from lib import vmptutils as vuti
+
+# The (n,4) locations of each of num_frames frames, some of which have none
+def makeFrames(num_frames, seed=0):
+    rng = np.random.RandomState(seed)
+    frames = []
+    for frame_num in range(num_frames):
+        locations = rng.uniform(-100.0, 100.0, (rng.randint(0, 4),4))
+        locations[:,3] = frame_num
+        frames.append(locations)
+    return frames
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def getOutputPath(self, output_format):
+        name = 'locations.csv' if output_format == 'csv' else 'locations.bin'
+        return os.path.join(self._folder, name)
+
+    # Appends the frames from first_frame to the output, committing the checkpoint
+    # whenever the output is written to disk, as location_p does, until stop_frame.
+    # Returns the writer, which is not closed.
+    def runFrames(self, frames, output_format, first_frame=0, stop_frame=None, truncate_to=None):
+        checkpoint = vuti.Checkpoint(self._folder)
+        if checkpoint.exists():
+            checkpoint.load()
+        else:
+            checkpoint.start({'format':output_format})
+        writer = vuti.OutputWriter(self._folder, 5, output_format, truncate_to)
+        frames_committed = 0
+        for locations in frames[first_frame:stop_frame]:
+            writer.append(locations)
+            if writer.getNumFramesWritten() > frames_committed:
+                frames_committed = writer.getNumFramesWritten()
+                checkpoint.commit('data.dat', first_frame + frames_committed, writer.getOutputBytes())
+        return writer, checkpoint
+
+    def readOutput(self, output_format):
+        chunks = list(vuti.readLocations(self.getOutputPath(output_format), chunk_rows=7))
+        return np.concatenate(chunks) if len(chunks) > 0 else np.zeros((0,4))
+
+    # a run stopped after output was written but before the checkpoint was
+    # committed, and then resumed, writes the output of an uninterrupted run
+    def testResume(self):
+        frames = makeFrames(40)
+        for output_format in ('csv', 'binary'):
+            writer, checkpoint = self.runFrames(frames, output_format)
+            checkpoint.commit('data.dat', len(frames), writer.getOutputBytes(), complete=True)
+            writer.close()
+            expected = self.readOutput(output_format)
+            self.assertEqual(expected.shape[0], sum(locations.shape[0] for locations in frames))
+            os.remove(self.getOutputPath(output_format))
+            os.remove(os.path.join(self._folder, 'checkpoint.json'))
+
+            # the stopped run writes output past the last commit
+            writer, checkpoint = self.runFrames(frames, output_format, stop_frame=23)
+            writer.flush()
+            writer._f_handle.close()
+            self.assertTrue(os.path.getsize(self.getOutputPath(output_format)) > checkpoint.getOutputBytes())
+
+            checkpoint = vuti.Checkpoint(self._folder)
+            checkpoint.load()
+            frames_done = checkpoint.getFramesDone('data.dat')
+            self.assertFalse(checkpoint.isComplete('data.dat'))
+            self.assertTrue(0 < frames_done < 23)
+            writer, checkpoint = self.runFrames(frames, output_format, frames_done, 
+                                          truncate_to=checkpoint.getOutputBytes())
+            writer.close()
+            output = self.readOutput(output_format)
+            if output_format == 'csv':
+                self.assertTrue(np.allclose(output, expected, rtol=1e-15, atol=0.0))
+            else:
+                self.assertTrue(np.array_equal(output, expected))
+            os.remove(self.getOutputPath(output_format))
+            os.remove(os.path.join(self._folder, 'checkpoint.json'))
+
+    # frames are only counted as written once all of their locations are on disk
+    def testFramesWritten(self):
+        writer = vuti.OutputWriter(self._folder, 5)
+        frames = makeFrames(10, seed=1)
+        num_locations = 0
+        for frame_num, locations in enumerate(frames):
+            writer.append(locations)
+            num_locations += locations.shape[0]
+            self.assertTrue(writer.getNumWritten() <= num_locations)
+            self.assertTrue(writer.getNumWritten() >= 
+                            sum(frame.shape[0] for frame in frames[0:writer.getNumFramesWritten()]))
+        writer.close()
+        self.assertEqual(writer.getNumFramesWritten(), len(frames))
+        self.assertEqual(writer.getNumWritten(), num_locations)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# built-in libraries
+import os
+import sys
+import time
+import collections
+import numpy as np
+from ConfigParser import SafeConfigParser
+# custom classes
+from lib import track
+from lib import vmptutils as vuti
+
+
+#==============================================================================
+#     Links the output of location_p.py into the trajectories of the tracers.
+#     The locations are read in one pass, a chunk at a time, and each time
+#     step (the locations with the same time) is passed to a TrackLinker.
+#     Frames in which no tracer was located have no rows, and so no time
+#     step. They are counted from the spacing of the time steps, and the
+#     tracks aged by that many skips.
+#     The tracks kept are written to the output file as rows of
+#     [track,x,y,z,t,vx,vy,vz], ordered by track then time, as they are
+#     terminated. The velocity of the first entry of each track is nan.
+#     Usage: python track_p.py LOCATIONS_FILE OUTPUT_FILE
+#     LOCATIONS_FILE is a locations.csv or locations.bin output file.
+#==============================================================================
+
+#==============================================================================
+#     Generator which groups the rows of the chunks of locations into time
+#     steps, yielding the time and (n,3) locations of each. The rows of a
+#     time step may be split between chunks.
+#==============================================================================
+def getTimeSteps(chunks):
+    pending = np.zeros((0,4))
+    for chunk in chunks:
+        rows = np.concatenate((pending, chunk))
+        # the last time step of the chunk may continue in the next one
+        boundaries = np.flatnonzero(np.diff(rows[:,3]) != 0) + 1
+        starts = np.concatenate(([0], boundaries))
+        for step_start, step_end in zip(starts[:-1], boundaries):
+            yield rows[step_start,3], rows[step_start:step_end,0:3]
+        #end for step_start
+        pending = rows[starts[-1]:,:]
+    #end for chunk
+    if pending.shape[0] > 0:
+        yield pending[0,3], pending[:,0:3]
+    #end if
+#end getTimeSteps() method
+
+#==============================================================================
+#     Generator which adds to each time step the number of missing steps
+#     before it. The frames are taken to be evenly spaced in time, at the
+#     median of the last num_intervals spacings, so a time step about n
+#     spacings after the previous one follows n - 1 missing steps.
+#==============================================================================
+def countMissingSteps(time_steps, num_intervals=100):
+    spacings = collections.deque(maxlen=num_intervals)
+    previous_time = None
+    for step_time, locations in time_steps:
+        num_missing = 0
+        if previous_time is not None:
+            interval = step_time - previous_time
+            if len(spacings) > 0:
+                num_missing = max(int(round(interval / np.median(spacings))) - 1, 0)
+            #end if
+            spacings.append(interval / (num_missing + 1))
+        #end if
+        previous_time = step_time
+        yield step_time, locations, num_missing
+    #end for step_time
+#end countMissingSteps() method
+
+#==============================================================================
+#     Main method.
+#==============================================================================
+if __name__ == "__main__":
+    config = SafeConfigParser()
+    config.read('lib/config.ini')
+
+    SEARCH_RADIUS = config.getfloat('Track','Search_Radius')
+    MAX_SKIPS = config.getint('Track','Max_Skips')
+    MIN_ENTRIES = config.getint('Track','Min_Entries')
+    MIN_DENSITY = config.getfloat('Track','Min_Density')
+    EXTRAP_LEN = config.getint('Track','Extrap_Len')
+    QUAD_SIZE = config.getint('Track','Quad_Size')
+    CHUNK_ROWS = config.getint('Track','Chunk_Rows')
+
+    if len(sys.argv) != 3:
+        print('Usage: python track_p.py LOCATIONS_FILE OUTPUT_FILE')
+        raise SystemExit
+    #end if
+    input_path = sys.argv[1]
+    output_path = sys.argv[2]
+    if os.path.exists(output_path):
+        print('The output file ' + output_path + ' already exists.')
+        raise SystemExit
+    #end if
+    if EXTRAP_LEN <= MAX_SKIPS:
+        print('Extrap_Len must be more than Max_Skips.')
+        raise SystemExit
+    #end if
+
+    linker = track.TrackLinker(SEARCH_RADIUS, MAX_SKIPS, MIN_ENTRIES, MIN_DENSITY, EXTRAP_LEN, QUAD_SIZE)
+    start = time.time()
+    num_steps = 0
+    num_missing_steps = 0
+    num_rows = 0
+    rows_since_write = 0
+    with open(output_path, 'w') as f_handle:
+        time_steps = getTimeSteps(vuti.readLocations(input_path, CHUNK_ROWS))
+        for step_time, locations, num_missing in countMissingSteps(time_steps):
+            linker.skip(num_missing)
+            linker.addLocations(step_time, locations)
+            num_steps += 1
+            num_missing_steps += num_missing
+            num_rows += locations.shape[0]
+            rows_since_write += locations.shape[0]
+            # the tracks terminated are written out once per chunk of input rows,
+            # so that only the entries of the active tracks are held in memory
+            if rows_since_write >= CHUNK_ROWS:
+                np.savetxt(f_handle, linker.getTracks(), delimiter=',')
+                rows_since_write = 0
+            #end if
+        #end for step_time
+        linker.finish()
+        np.savetxt(f_handle, linker.getTracks(), delimiter=',')
+    #end with
+
+    print('Linked ' + str(num_rows) + ' locations in ' + str(num_steps) + ' time steps (and ' \
+          + str(num_missing_steps) + ' missing) into ' + str(linker.getNumKept()) + ' tracks in ' \
+          + str(time.time() - start) + 's')
+#end main
@@ -104,15 +104,139 @@ static PyObject* vmptlib_getSmallestRegion(PyObject* self, PyObject* args) {
     return Py_BuildValue("OO",output_indices,output_volumes);
 }
 
+/* Returns 1 if the array is C-contiguous, aligned and of the given type */
+static int checkArray(PyArrayObject* array, int type_num, const char* name) {
+    if(!PyArray_ISCARRAY_RO(array) || PyArray_TYPE(array) != type_num) {
+        PyErr_Format(PyExc_ValueError, "%s must be a contiguous array of the expected type", name);
+        return 0;
+    }
+    return 1;
+}
+
+/* Volume given to unbounded regions, as in getSmallestRegion. A line on which
+   every seed point has an unbounded region keeps its last such point. */
+#define UNBOUNDED_VOLUME 100000.0
+
+/* Calculates the mean vertex-to-centroid distance of a single region, as used in
+   getSmallestRegion. Returns UNBOUNDED_VOLUME if the region is unbounded. */
+static double getRegionVolume(const npy_intp* region_vertices, npy_intp num_vertices, 
+                              const double* vertex_data) {
+    double centroid[3] = {0.0, 0.0, 0.0};
+    double region_volume = 0;
+    
+    for(npy_intp vertex_i = 0; vertex_i < num_vertices; vertex_i++) {
+        npy_intp vertex_row = region_vertices[vertex_i];
+        if(vertex_row == -1)
+            return UNBOUNDED_VOLUME;
+        for(int dim = 0; dim < 3; dim++)
+            centroid[dim] = centroid[dim] + vertex_data[vertex_row * 3 + dim] / (float)num_vertices;
+    }
+    
+    for(npy_intp vertex_i = 0; vertex_i < num_vertices; vertex_i++) {
+        double vertex[3];
+        getMatrixRow((double*)vertex_data, (int)region_vertices[vertex_i], 3, vertex);
+        region_volume = region_volume + getEuclideanDistance(vertex, centroid)/num_vertices;
+    }
+    return region_volume;
+}
+
+/* Array based version of getSmallestRegion. All inputs are contiguous ndarrays,
+   regions being given in compressed (CSR) form, and the result is written into
+   the preallocated output arrays without the GIL being held. As in 
+   getSmallestRegion, unbounded regions have a volume of UNBOUNDED_VOLUME and
+   ties go to the later point. Lines without any seed points (e.g. clipped out
+   by a field of view) are given an index of -1. */
+static PyObject* vmptlib_getSmallestRegionArray(PyObject* self, PyObject* args) {
+    PyArrayObject* line_indices;    // (npoints,) intp; ID's of lines along which points lie
+    PyArrayObject* point_regions;   // (npoints,) intp; indices into Voronoi regions
+    PyArrayObject* region_offsets;  // (nregions+1,) intp; start of each region in region_vertices
+    PyArrayObject* region_vertices; // (nentries,) intp; indices into vertices
+    PyArrayObject* vertices;        // (nvertices,3) double; co-ords of vertices
+    PyArrayObject* output_indices;  // (nlines,) intp; index of the smallest region's point per line
+    PyArrayObject* output_volumes;  // (nlines,) double; volume of the smallest region per line
+    
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!O!", &PyArray_Type, &line_indices,
+                                                 &PyArray_Type, &point_regions,
+                                                 &PyArray_Type, &region_offsets,
+                                                 &PyArray_Type, &region_vertices,
+                                                 &PyArray_Type, &vertices,
+                                                 &PyArray_Type, &output_indices,
+                                                 &PyArray_Type, &output_volumes))
+        return NULL;
+    
+    if(!checkArray(line_indices, NPY_INTP, "line_indices") ||
+       !checkArray(point_regions, NPY_INTP, "point_regions") ||
+       !checkArray(region_offsets, NPY_INTP, "region_offsets") ||
+       !checkArray(region_vertices, NPY_INTP, "region_vertices") ||
+       !checkArray(vertices, NPY_DOUBLE, "vertices") ||
+       !checkArray(output_indices, NPY_INTP, "output_indices") ||
+       !checkArray(output_volumes, NPY_DOUBLE, "output_volumes"))
+        return NULL;
+    if(!PyArray_ISWRITEABLE(output_indices) || !PyArray_ISWRITEABLE(output_volumes)) {
+        PyErr_SetString(PyExc_ValueError, "output arrays must be writeable");
+        return NULL;
+    }
+    
+    npy_intp num_points  = PyArray_SIZE(line_indices);
+    npy_intp num_lines   = PyArray_SIZE(output_indices);
+    npy_intp num_regions = PyArray_SIZE(region_offsets) - 1;
+    if(PyArray_SIZE(point_regions) != num_points || PyArray_SIZE(output_volumes) != num_lines) {
+        PyErr_SetString(PyExc_ValueError, "mismatched array lengths");
+        return NULL;
+    }
+    
+    const npy_intp* line_data   = (const npy_intp*)PyArray_DATA(line_indices);
+    const npy_intp* region_data = (const npy_intp*)PyArray_DATA(point_regions);
+    const npy_intp* offset_data = (const npy_intp*)PyArray_DATA(region_offsets);
+    const npy_intp* entry_data  = (const npy_intp*)PyArray_DATA(region_vertices);
+    const double* vertex_data   = (const double*)PyArray_DATA(vertices);
+    npy_intp* out_indices       = (npy_intp*)PyArray_DATA(output_indices);
+    double* out_volumes         = (double*)PyArray_DATA(output_volumes);
+    int bad_index = 0;
+    
+    Py_BEGIN_ALLOW_THREADS
+    for(npy_intp line_i = 0; line_i < num_lines; line_i++) {
+        out_indices[line_i] = -1;
+        out_volumes[line_i] = UNBOUNDED_VOLUME;
+    }
+    
+    for(npy_intp point_i = 0; point_i < num_points; point_i++) {
+        npy_intp line_id = line_data[point_i];
+        npy_intp region_index = region_data[point_i];
+        if(line_id < 0 || line_id >= num_lines || region_index < 0 || region_index >= num_regions) {
+            bad_index = 1;
+            break;
+        }
+        double region_volume = getRegionVolume(entry_data + offset_data[region_index],
+                                               offset_data[region_index + 1] - offset_data[region_index],
+                                               vertex_data);
+        if(region_volume <= out_volumes[line_id]) {
+            out_indices[line_id] = point_i;
+            out_volumes[line_id] = region_volume;
+        }
+    }
+    Py_END_ALLOW_THREADS
+    
+    if(bad_index) {
+        PyErr_SetString(PyExc_IndexError, "line or region index out of range");
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
 /* Documentation strings */
 static char module_docstring[] =
     "This module provides methods written in C for the VMPT program.";
 static char getSmallestRegion_docstring[] = 
     "Get the smallest Voronoi region per line of response.";
+static char getSmallestRegionArray_docstring[] = 
+    "Get the smallest Voronoi region per line of response, from contiguous arrays "
+    "into preallocated output arrays.";
 
 /* Add all methods */
 static PyMethodDef vmptlib_methods[] = {
     {"getSmallestRegion", vmptlib_getSmallestRegion, METH_VARARGS, getSmallestRegion_docstring},
+    {"getSmallestRegionArray", vmptlib_getSmallestRegionArray, METH_VARARGS, getSmallestRegionArray_docstring},
     {NULL, NULL, 0, NULL}
 };
 
@@ -0,0 +1,92 @@
+# built-in libraries
+import sys
+import multiprocessing
+from ConfigParser import SafeConfigParser
+# custom classes
+import location_p
+from lib import distributed
+from lib import profiling
+from lib import vmptutils as vuti
+
+
+#==============================================================================
+#     Worker for distributed location. Connects to a coordinator started with
+#     "python location_p.py --distributed" and locates the frames it is sent.
+#     Usage: python worker_p.py [coordinator_host] [num_processes]
+#     The host defaults to localhost, and the number of worker processes
+#     started on this host defaults to the number of cores. The port and
+#     authentication key are read from the [Distributed] section of the
+#     config.ini file, which must match that of the coordinator.
+#==============================================================================
+
+#==============================================================================
+#     Called with the settings sent by the coordinator when a worker connects.
+#     Sets the constants used by locate, and returns the method applied to
+#     the frames of each task.
+#==============================================================================
+def setup(settings):
+    location_p.EPS = settings['eps']
+    location_p.K = settings['k']
+    location_p.LOF_FRAC = settings['lof_frac']
+    location_p.VOL_FRAC = settings['vol_frac']
+    location_p.POI_ENGINE = settings['poi_engine']
+    location_p.DENSITY_K = settings['density_k']
+    location_p.FOV = settings['fov']
+    location_p.COARSE_FACTOR = settings['coarse_factor']
+    location_p.MIN_NEIGHBOURS = settings['min_neighbours']
+    location_p.SUBDOMAINS = settings['subdomains']
+    location_p.SUBDOMAIN_OVERLAP = settings['subdomain_overlap']
+    location_p.SUBDOMAIN_THREADS = settings['subdomain_threads']
+    location_p.WARM_START = settings['warm_start']
+    location_p.WARM_RADIUS = settings['warm_radius']
+    location_p.NUM_TRACERS = settings['num_tracers']
+    if settings['overlapping']:
+        return location_p.WindowTask(settings['profile'])
+    elif settings['warm_start']:
+        return location_p.WarmStartTask(settings['profile'])
+    elif settings['profile']:
+        return vuti.ChunkTask(profiling.Profiled(location_p.locate))
+    #end if
+    return vuti.ChunkTask(location_p.locate)
+#end setup() method
+
+#==============================================================================
+#     Runs one worker process until the coordinator stops.
+#==============================================================================
+def runWorker(address, authkey, heartbeat_interval):
+    print 'Starting ', multiprocessing.current_process().name
+    distributed.runWorker(address, authkey, setup, heartbeat_interval)
+    print 'Stopping ', multiprocessing.current_process().name
+#end runWorker() method
+
+#==============================================================================
+#     Main method.
+#==============================================================================
+if __name__ == "__main__":
+    config = SafeConfigParser()
+    config.read('lib/config.ini')
+
+    PORT = config.getint('Distributed','Port')
+    AUTHKEY = config.get('Distributed','Authkey')
+    HEARTBEAT_INTERVAL = config.getfloat('Distributed','Heartbeat_Interval')
+
+    host = 'localhost'
+    if len(sys.argv) > 1:
+        host = sys.argv[1]
+    #end if
+    num_processes = multiprocessing.cpu_count()
+    if len(sys.argv) > 2:
+        num_processes = int(sys.argv[2])
+    #end if
+
+    print('Starting ' + str(num_processes) + ' workers for the coordinator at ' \
+          + host + ':' + str(PORT))
+    workers = [multiprocessing.Process(target=runWorker, args=((host, PORT), AUTHKEY, HEARTBEAT_INTERVAL)) \
+               for worker_num in range(num_processes)]
+    for worker in workers:
+        worker.start()
+    #end for worker
+    for worker in workers:
+        worker.join()
+    #end for worker
+#end main